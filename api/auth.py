@@ -6,11 +6,15 @@ from sqlalchemy import select
 from authlib.integrations.starlette_client import OAuth
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
+import time
 
-from .database import get_db
+from .database import async_session, get_db, read_session_for
 from .models import User, PendingInvitation, Friendship
 from .schemas import UserResponse
 from .config import get_settings
+from .revisions import bump_revision, bump_revision_with_friends
+from .friend_graph import add_edges
+from .user_cache import UserCache, UserSnapshot
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 settings = get_settings()
@@ -27,6 +31,12 @@ if settings.google_client_id and settings.google_client_secret:
 
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_DAYS = 30
+# Scope of the long-lived tokens embedded in calendar subscription URLs
+FEED_SCOPE = "ics"
+# Scope of the tokens in public links to the rendered ring (previews, og:image)
+SHARE_SCOPE = "share"
+
+user_cache = UserCache(settings.user_cache_size, settings.user_cache_ttl_seconds)
 
 
 def create_token(user_id: str) -> str:
@@ -35,38 +45,118 @@ def create_token(user_id: str) -> str:
     return jwt.encode(payload, settings.jwt_secret, algorithm=JWT_ALGORITHM)
 
 
-def verify_token(token: str) -> Optional[str]:
+def create_feed_token(user_id: str, version: int) -> str:
+    # No expiry: calendar subscriptions outlive login sessions. Revoked instead
+    # by bumping the user's feed_token_version, which `v` must match.
+    payload = {"sub": user_id, "scope": FEED_SCOPE, "v": version}
+    return jwt.encode(payload, settings.jwt_secret, algorithm=JWT_ALGORITHM)
+
+
+def create_share_token(user_id: str, version: int) -> str:
+    # Like feed tokens: no expiry, revoked by bumping share_token_version
+    payload = {"sub": user_id, "scope": SHARE_SCOPE, "v": version}
+    return jwt.encode(payload, settings.jwt_secret, algorithm=JWT_ALGORITHM)
+
+
+def decode_token(token: str, scope: Optional[str] = None) -> Optional[dict]:
+    """Decode a token issued for `scope`; session tokens have no scope."""
     try:
         payload = jwt.decode(token, settings.jwt_secret, algorithms=[JWT_ALGORITHM])
-        return payload.get("sub")
     except JWTError:
         return None
+    if payload.get("scope") != scope:
+        return None
+    return payload
+
+
+def verify_token(token: str) -> Optional[str]:
+    payload = decode_token(token)
+    return payload.get("sub") if payload else None
+
+
+async def _verify_versioned_token(token: str, scope: str, version_column) -> Optional[str]:
+    """User id of a token that is signed, in scope and not revoked."""
+    payload = decode_token(token, scope=scope)
+    if not payload or not payload.get("sub"):
+        return None
+    # The primary, not a replica: a rotation must take effect at once
+    async with async_session() as db:
+        result = await db.execute(select(version_column).where(User.id == payload["sub"]))
+        version = result.scalar_one_or_none()
+    # Tokens from before versioning have no `v`
+    if version is None or payload.get("v", 0) != version:
+        return None
+    return payload["sub"]
+
+
+async def verify_feed_token(token: str) -> Optional[str]:
+    return await _verify_versioned_token(token, FEED_SCOPE, User.feed_token_version)
+
+
+async def verify_share_token(token: str) -> Optional[str]:
+    return await _verify_versioned_token(token, SHARE_SCOPE, User.share_token_version)
 
 
 async def get_current_user(
     request: Request, db: AsyncSession = Depends(get_db)
-) -> Optional[User]:
+) -> Optional[UserSnapshot]:
     token = request.cookies.get("auth_token")
     if not token:
         return None
 
-    user_id = verify_token(token)
-    if not user_id:
+    cached = user_cache.get(token)
+    if cached:
+        return cached
+
+    payload = decode_token(token)
+    if not payload or not payload.get("sub"):
+        return None
+
+    result = await db.execute(select(User).where(User.id == payload["sub"]))
+    user = result.scalar_one_or_none()
+    snapshot = UserSnapshot.from_user(user) if user else None
+    # Give the connection back before the handler runs: bootstrap opens three
+    # sessions of its own, and holding this one as well deadlocks a busy pool
+    await db.rollback()
+    if not snapshot:
         return None
 
-    result = await db.execute(select(User).where(User.id == user_id))
-    return result.scalar_one_or_none()
+    user_cache.set(token, snapshot, token_expires_in=payload["exp"] - time.time())
+    return snapshot
 
 
 async def require_user(
     request: Request, db: AsyncSession = Depends(get_db)
-) -> User:
+) -> UserSnapshot:
     user = await get_current_user(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
 
+async def require_user_id(request: Request) -> str:
+    """Authenticate from the token alone, for handlers that only need the id.
+
+    Never touches the users table: uses the cached snapshot when there is one
+    and otherwise just verifies the JWT signature and expiry.
+    """
+    token = request.cookies.get("auth_token")
+    if token:
+        cached = user_cache.peek(token)
+        if cached:
+            return cached.id
+        user_id = verify_token(token)
+        if user_id:
+            return user_id
+    raise HTTPException(status_code=401, detail="Not authenticated")
+
+
+async def get_read_db(user_id: str = Depends(require_user_id)):
+    """Session for read-only handlers: the replica, or the primary right after a write."""
+    async with read_session_for(user_id)() as session:
+        yield session
+
+
 @router.get("/google")
 async def google_login(request: Request):
     if not settings.google_client_id:
@@ -112,6 +202,7 @@ async def google_callback(request: Request, db: AsyncSession = Depends(get_db)):
         )
         pending_invitations = pending_result.scalars().all()
 
+        new_friendships = []
         for invitation in pending_invitations:
             # Create a friendship request from the inviter to the new user
             friendship = Friendship(
@@ -120,16 +211,25 @@ async def google_callback(request: Request, db: AsyncSession = Depends(get_db)):
                 status="pending"
             )
             db.add(friendship)
+            new_friendships.append(friendship)
             await db.delete(invitation)
 
         if pending_invitations:
+            await db.flush()
+            await add_edges(db, *(friendship.id for friendship in new_friendships))
+            await bump_revision(
+                db, user.id, *(invitation.inviter_id for invitation in pending_invitations)
+            )
             await db.commit()
-    else:
-        # Update user info
+    elif (user.email, user.name, user.picture_url) != (email, name, picture):
+        # Update user info; friends see these fields, so their ETags go stale too.
+        # Unchanged logins leave every revision alone and keep 304s working.
         user.email = email
         user.name = name
         user.picture_url = picture
+        await bump_revision_with_friends(db, user.id)
         await db.commit()
+        user_cache.invalidate_user(user.id)
 
     # Create JWT and set cookie
     auth_token = create_token(str(user.id))
@@ -146,11 +246,14 @@ async def google_callback(request: Request, db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/me", response_model=Optional[UserResponse])
-async def get_me(user: Optional[User] = Depends(get_current_user)):
+async def get_me(user: Optional[UserSnapshot] = Depends(get_current_user)):
     return user
 
 
 @router.post("/logout")
-async def logout(response: Response):
+async def logout(request: Request, response: Response):
+    token = request.cookies.get("auth_token")
+    if token:
+        user_cache.invalidate_token(token)
     response.delete_cookie("auth_token")
     return {"message": "Logged out"}
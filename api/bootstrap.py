@@ -0,0 +1,39 @@
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends
+
+from .database import read_session_for
+from .user_cache import UserSnapshot
+from .schemas import BootstrapResponse
+from .serialization import FastJSONResponse
+from .auth import get_current_user
+from .events import load_events
+from .friends import load_friends, load_pending_requests
+
+router = APIRouter(prefix="/api/bootstrap", tags=["bootstrap"])
+
+
+async def _in_session(loader, user_id: str):
+    # Each loader gets its own session so the queries can run concurrently
+    async with read_session_for(user_id)() as session:
+        return await loader(session, user_id)
+
+
+@router.get("", response_model=BootstrapResponse)
+async def bootstrap(user: Optional[UserSnapshot] = Depends(get_current_user)):
+    """Return the user, their events, friends and pending requests in one round trip."""
+    if not user:
+        return BootstrapResponse(user=None)
+
+    events, friends, pending_requests = await asyncio.gather(
+        _in_session(load_events, user.id),
+        _in_session(load_friends, user.id),
+        _in_session(load_pending_requests, user.id),
+    )
+    # Loaders return response-shaped dicts; encode them without re-validating
+    return FastJSONResponse({
+        "user": user,
+        "events": events,
+        "friends": friends,
+        "pending_requests": pending_requests,
+    })
@@ -5,13 +5,54 @@ from functools import lru_cache
 
 class Settings(BaseSettings):
     database_url: str = "postgresql+asyncpg://localhost/circle_cal"
+    # Optional read-only replica for list endpoints
+    database_read_url: str = ""
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_pre_ping: bool = True
+    db_pool_recycle_seconds: int = 1800
+    db_statement_cache_size: int = 100
+    db_echo: bool = False
+    # Reads go to the primary for this long after a user's own write
+    read_your_writes_seconds: float = 5.0
     google_client_id: str = ""
     google_client_secret: str = ""
     jwt_secret: str = "dev-secret-change-in-production"
     frontend_url: str = "http://localhost:8000"
     sendgrid_api_key: str = ""
+    # "sendgrid", "file" or "console"; defaults to sendgrid when an API key is set
+    email_transport: str = ""
+    email_file_path: str = "email_outbox.jsonl"
+    email_batch_size: int = 100
+    email_max_attempts: int = 8
+    email_poll_interval_seconds: float = 30.0
+    # How often each worker drops event tombstones past their retention (see api/tombstones.py)
+    tombstone_prune_interval_seconds: float = 3600.0
+    # Cross-worker fan-out for push notifications: "local" or "postgres"
+    notification_backend: str = "local"
+    # Per-process cache of authenticated users (see api/user_cache.py)
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: float = 60.0
+    # Computed label layouts kept per process (see api/layout.py)
+    layout_cache_size: int = 512
+    # Rendered ring images (see api/render.py); the directory defaults to a temp dir
+    render_cache_dir: str = ""
+    render_cache_memory_mb: int = 32
+    render_cache_disk_mb: int = 256
+    # Request and SQL metrics (see api/metrics.py)
+    slow_query_ms: float = 200.0
+    server_timing: bool = False
+    # /metrics requires "Authorization: Bearer <token>"; unset, it is not served at all
+    metrics_token: str = ""
+    # Per-user token buckets (see api/rate_limit.py); the backend is "local" or "postgres"
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "local"
+    rate_limit_per_minute: float = 300.0
+    rate_limit_burst: float = 60.0
+    # Answer 503 while connection checkouts wait longer than this on average; 0 disables
+    shed_pool_wait_ms: float = 500.0
 
-    @field_validator("database_url", mode="before")
+    @field_validator("database_url", "database_read_url", mode="before")
     @classmethod
     def convert_postgres_url(cls, v: str) -> str:
         # Heroku uses postgres:// but SQLAlchemy async needs postgresql+asyncpg://
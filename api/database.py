@@ -1,12 +1,93 @@
+import time
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from .config import get_settings
 
 settings = get_settings()
 
-engine = create_async_engine(settings.database_url, echo=True)
+# Seconds for the recorded pool wait to halve when nothing new comes in
+POOL_WAIT_HALF_LIFE = 5.0
+# Weight of each new checkout in the average
+POOL_WAIT_ALPHA = 0.2
+
+
+class PoolWait:
+    """Exponentially weighted average of connection checkout waits, decaying over time.
+
+    The decay matters: requests turned away while the pool is congested never
+    check a connection out, so without it the average would stay high.
+    """
+
+    def __init__(self):
+        self._value = 0.0
+        self._updated = time.monotonic()
+
+    def _decayed(self, now: float) -> float:
+        return self._value * 0.5 ** ((now - self._updated) / POOL_WAIT_HALF_LIFE)
+
+    def record(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._value = self._decayed(now) * (1 - POOL_WAIT_ALPHA) + seconds * POOL_WAIT_ALPHA
+        self._updated = now
+
+    def seconds(self) -> float:
+        return self._decayed(time.monotonic())
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait = PoolWait()
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait.record(time.monotonic() - start)
+
+
+def _create_engine(url: str):
+    kwargs = {"echo": settings.db_echo, "pool_pre_ping": settings.db_pool_pre_ping}
+    if url.startswith("postgresql"):
+        kwargs.update(
+            poolclass=TimedQueuePool,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_recycle=settings.db_pool_recycle_seconds,
+            connect_args={"prepared_statement_cache_size": settings.db_statement_cache_size},
+        )
+    db_engine = create_async_engine(url, **kwargs)
+    if url.startswith("sqlite"):
+        # SQLite only honours ON DELETE CASCADE (friend edges) with this on
+        event.listen(db_engine.sync_engine, "connect", _enable_sqlite_foreign_keys)
+    return db_engine
+
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+engine = _create_engine(settings.database_url)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Read-only replica; falls back to the primary when no replica is configured
+read_engine = _create_engine(settings.database_read_url) if settings.database_read_url else engine
+async_read_session = (
+    async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    if read_engine is not engine
+    else async_session
+)
+
+# user id -> monotonic time of that user's last write in this process
+_last_write: dict[str, float] = {}
+
 
 class Base(DeclarativeBase):
     pass
@@ -20,6 +101,51 @@ async def get_db():
             await session.close()
 
 
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+def note_write(*user_ids: str) -> None:
+    """Record a write so the user's next reads go to the primary for a while."""
+    now = time.monotonic()
+    for user_id in user_ids:
+        _last_write[user_id] = now
+    if len(_last_write) > 10000:
+        cutoff = now - settings.read_your_writes_seconds
+        for user_id, written_at in list(_last_write.items()):
+            if written_at < cutoff:
+                del _last_write[user_id]
+
+
+def read_session_for(user_id: str) -> async_sessionmaker:
+    """Session factory for a user's reads: the replica, unless they wrote recently.
+
+    Writes are tracked per process, so a write served by another worker is only
+    covered once the replica has caught up.
+    """
+    written_at = _last_write.get(user_id)
+    if written_at is not None and time.monotonic() - written_at < settings.read_your_writes_seconds:
+        return async_session
+    return async_read_session
+
+
+def pool_status(db_engine) -> dict:
+    pool = db_engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {}
+    capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+    checked_out = pool.checkedout()
+    status = {
+        "size": pool.size(),
+        "checked_out": checked_out,
+        "overflow": pool.overflow(),
+        "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
+    if isinstance(pool, TimedQueuePool):
+        status["wait_ms"] = round(pool.wait.seconds() * 1000, 2)
+    return status
+
+
+def pool_wait_seconds() -> float:
+    """Recent checkout wait of the most congested pool, primary or replica."""
+    return max(
+        (db_engine.pool.wait.seconds() for db_engine in {engine, read_engine}
+         if isinstance(db_engine.pool, TimedQueuePool)),
+        default=0.0,
+    )
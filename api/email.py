@@ -1,23 +1,45 @@
+import asyncio
+import html
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Email, To, Content, TrackingSettings, ClickTracking
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from .config import get_settings
+from .models import EmailOutbox
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+FROM_EMAIL = "noreply@circlecalendars.com"
+FROM_NAME = "Circle Calendar"
 
 
-async def send_friend_invitation(to_email: str, from_user_name: str) -> bool:
-    """Send a friend invitation email via SendGrid."""
-    if not settings.sendgrid_api_key:
-        print(f"SendGrid not configured. Would send invitation to {to_email}")
-        return True
+@dataclass
+class EmailBatch:
+    """One message sent to several recipients, each seeing only their own address."""
+    subject: str
+    html_content: str
+    recipients: list[str]
 
+
+def render_friend_invitation(from_user_name: str) -> tuple[str, str]:
+    """Return the (subject, html) of a friend invitation email."""
     subject = f"{from_user_name} invited you to Circle Calendar"
+    # Users pick their own names: keep them from adding markup or links to the email
+    name = html.escape(from_user_name)
 
     html_content = f"""
     <div style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; max-width: 500px; margin: 0 auto; padding: 20px;">
         <h2 style="color: #1976d2;">You've been invited to Circle Calendar!</h2>
         <p style="font-size: 16px; color: #333;">
-            <strong>{from_user_name}</strong> wants to connect with you on Circle Calendar
+            <strong>{name}</strong> wants to connect with you on Circle Calendar
             and share birthdays.
         </p>
         <p style="font-size: 14px; color: #666;">
@@ -30,26 +52,98 @@ async def send_friend_invitation(to_email: str, from_user_name: str) -> bool:
             Join Circle Calendar
         </a>
         <p style="font-size: 12px; color: #999; margin-top: 24px;">
-            Once you sign up, {from_user_name}'s friend request will be waiting for you.
+            Once you sign up, {name}'s friend request will be waiting for you.
         </p>
     </div>
     """
+    return subject, html_content
+
+
+def enqueue_friend_invitation(db: AsyncSession, to_email: str, from_user_name: str) -> EmailOutbox:
+    """Add a friend invitation to the outbox. Delivered by the outbox worker once committed."""
+    subject, html_content = render_friend_invitation(from_user_name)
+    message = EmailOutbox(to_email=to_email, subject=subject, html_content=html_content)
+    db.add(message)
+    return message
+
+
+async def enqueue_friend_invitations(db: AsyncSession, to_emails: list[str], from_user_name: str) -> None:
+    """Add a friend invitation per address to the outbox with one multi-row INSERT.
+
+    They share a subject and body, so the outbox worker sends them as batches.
+    """
+    if not to_emails:
+        return
+    subject, html_content = render_friend_invitation(from_user_name)
+    await db.execute(
+        insert(EmailOutbox),
+        [{"to_email": to_email, "subject": subject, "html_content": html_content} for to_email in to_emails],
+    )
+
+
+class SendGridTransport:
+    """Sends each batch as one SendGrid API call with a personalization per recipient."""
 
-    try:
+    def __init__(self, api_key: str):
+        self.client = SendGridAPIClient(api_key)
+
+    def _send(self, batch: EmailBatch) -> None:
         message = Mail(
-            from_email=Email("noreply@circlecalendars.com", "Circle Calendar"),
-            to_emails=To(to_email),
-            subject=subject,
-            html_content=Content("text/html", html_content)
+            from_email=Email(FROM_EMAIL, FROM_NAME),
+            to_emails=[To(recipient) for recipient in batch.recipients],
+            subject=batch.subject,
+            html_content=Content("text/html", batch.html_content),
+            is_multiple=True,
         )
         # Disable click tracking until SSL is configured for link branding
         message.tracking_settings = TrackingSettings(
             click_tracking=ClickTracking(enable=False, enable_text=False)
         )
+        response = self.client.send(message)
+        if response.status_code not in (200, 201, 202):
+            raise RuntimeError(f"SendGrid returned {response.status_code}")
+
+    async def send(self, batch: EmailBatch) -> None:
+        # The SendGrid client is blocking; keep it off the event loop
+        await asyncio.to_thread(self._send, batch)
+
+
+class FileTransport:
+    """Appends each batch as a JSON line to a local file, for development and tests."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, batch: EmailBatch) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        record = {
+            "sent_at": datetime.utcnow().isoformat(),
+            "subject": batch.subject,
+            "recipients": batch.recipients,
+            "html_content": batch.html_content,
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def send(self, batch: EmailBatch) -> None:
+        await asyncio.to_thread(self._write, batch)
+
+
+class ConsoleTransport:
+    """Only reports what would have been sent, used when no email provider is configured."""
+
+    async def send(self, batch: EmailBatch) -> None:
+        logger.info("SendGrid not configured. Would send invitation to %s", ", ".join(batch.recipients))
+
 
-        sg = SendGridAPIClient(settings.sendgrid_api_key)
-        response = sg.send(message)
-        return response.status_code in (200, 201, 202)
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        return False
+def create_transport():
+    transport = settings.email_transport
+    if not transport:
+        transport = "sendgrid" if settings.sendgrid_api_key else "console"
+    if transport == "sendgrid":
+        return SendGridTransport(settings.sendgrid_api_key)
+    if transport == "file":
+        return FileTransport(settings.email_file_path)
+    return ConsoleTransport()
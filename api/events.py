@@ -1,100 +1,523 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, case, func, and_, or_, tuple_
 
-from .database import get_db
-from .models import User, Event
-from .schemas import EventCreate, EventUpdate, EventResponse
-from .auth import require_user
+from .config import get_settings
+from .database import get_db, read_session_for
+from .models import DEFAULT_EVENT_COLOR, Event, EventTombstone, User, generate_uuid, day_of_year, day_of_year_expr
+from .schemas import (
+    EventCreate,
+    EventUpdate,
+    EventResponse,
+    EventBatchRequest,
+    EventBatchResult,
+    EventBatchResponse,
+    EventImportResponse,
+    EventFeedResponse,
+    EventChangesResponse,
+)
+from .auth import require_user_id, get_read_db, create_feed_token, verify_feed_token
+from .revisions import next_revision, current_revision, conditional_response
+from .pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor, split_page, encode_list, encoded_list_response
+from .rate_limit import admission
+from .serialization import FastJSONResponse
+from .singleflight import single_flight
+from .tombstones import TOMBSTONE_RETENTION
+from .ics import ICSError, calendar_header, calendar_footer, format_event, unfold_lines, parse_events
 
-router = APIRouter(prefix="/api/events", tags=["events"])
+router = APIRouter(prefix="/api/events", tags=["events"], dependencies=[Depends(admission)])
+settings = get_settings()
+
+DAYS_IN_MONTH = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+# Rows fetched per round trip when streaming the feed
+ICS_FETCH_SIZE = 500
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_EVENTS = 10000
+
+# The EventResponse fields, read as plain columns for the list endpoints
+EVENT_COLUMNS = (
+    Event.id, Event.month, Event.day, Event.end_month, Event.end_day,
+    Event.title, Event.color, Event.hidden, Event.created_at, Event.updated_at,
+)
+
+
+def _event_values(user_id: str, event_data: EventCreate) -> dict:
+    """Column values for a new event, defaulting the end date to the start date."""
+    end_month = event_data.end_month if event_data.end_month is not None else event_data.month
+    end_day = event_data.end_day if event_data.end_day is not None else event_data.day
+
+    return {
+        "user_id": user_id,
+        "month": event_data.month,
+        "day": event_data.day,
+        "end_month": end_month,
+        "end_day": end_day,
+        "title": event_data.title,
+        # Core inserts would store an omitted color as NULL rather than the column default
+        "color": event_data.color if event_data.color is not None else DEFAULT_EVENT_COLOR,
+        "hidden": bool(event_data.hidden),
+    }
+
+
+def _update_values(event_data: EventUpdate) -> dict:
+    """SET clause for an update, falling back to the row's current values for unset fields."""
+    values = {}
+    month, day = Event.month, Event.day
+    if event_data.month is not None:
+        month = values["month"] = event_data.month
+    if event_data.day is not None:
+        day = values["day"] = event_data.day
+    # Handle end_month/end_day - if explicitly set to None, use start date
+    end_month, end_day = func.coalesce(Event.end_month, month), func.coalesce(Event.end_day, day)
+    if "end_month" in event_data.model_fields_set:
+        end_month = values["end_month"] = event_data.end_month if event_data.end_month is not None else month
+    if "end_day" in event_data.model_fields_set:
+        end_day = values["end_day"] = event_data.end_day if event_data.end_day is not None else day
+    if event_data.title is not None:
+        values["title"] = event_data.title
+    if event_data.color is not None:
+        values["color"] = event_data.color
+    if event_data.hidden is not None:
+        values["hidden"] = event_data.hidden
+    values["start_doy"] = day_of_year_expr(month, day)
+    values["end_doy"] = day_of_year_expr(end_month, end_day)
+    return values
+
+
+def _owns_event(user_id: str, event_id: str):
+    """Condition for bumping the revision only when the event is the user's."""
+    return select(Event.id).where(Event.id == event_id, Event.user_id == user_id).exists()
+
+
+def _update_event(user_id: str, event_id: str, event_data: EventUpdate, revision: int):
+    """UPDATE ... RETURNING for one of the user's events; returns no row if it isn't theirs."""
+    return (
+        update(Event)
+        .where(Event.id == event_id, Event.user_id == user_id)
+        .values(revision=revision, **_update_values(event_data))
+        .returning(*EVENT_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _update_events(user_id: str, updates: dict, revision: int):
+    """One UPDATE ... RETURNING for several of the user's events, {event_id: EventUpdate}.
+
+    Each column is set through a CASE on the event id, so every event gets its
+    own values and keeps its current ones for the fields its update leaves
+    out. Events that aren't the user's return no row.
+    """
+    columns = {}
+    for event_id, event_data in updates.items():
+        for column, value in _update_values(event_data).items():
+            columns.setdefault(column, {})[event_id] = value
+    return (
+        update(Event)
+        .where(Event.id.in_(updates), Event.user_id == user_id)
+        .values(
+            revision=revision,
+            **{
+                column: case(values, value=Event.id, else_=getattr(Event, column))
+                for column, values in columns.items()
+            },
+        )
+        .returning(*EVENT_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _record_deletes(db: AsyncSession, user_id: str, event_ids, revision: int) -> None:
+    """Leave tombstones for deleted events (not committed); api/tombstones.py prunes expired ones."""
+    if not event_ids:
+        return
+    await db.execute(
+        insert(EventTombstone),
+        [{"event_id": event_id, "user_id": user_id, "revision": revision} for event_id in event_ids],
+    )
+
+
+def _parse_month_day(value: str, name: str) -> int:
+    """Parse an MM-DD query parameter into a day of year."""
+    try:
+        month, day = (int(part) for part in value.split("-"))
+        if not 1 <= month <= 12 or not 1 <= day <= DAYS_IN_MONTH[month - 1]:
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' date, expected MM-DD")
+    return day_of_year(month, day)
+
+
+def _overlaps(from_doy: int, to_doy: int):
+    """Filter for events overlapping the window [from_doy, to_doy], either of which may wrap."""
+    wraps = Event.start_doy > Event.end_doy
+    not_wraps = Event.start_doy <= Event.end_doy
+    if from_doy <= to_doy:
+        return or_(
+            and_(not_wraps, Event.start_doy <= to_doy, Event.end_doy >= from_doy),
+            and_(wraps, or_(Event.start_doy <= to_doy, Event.end_doy >= from_doy)),
+        )
+    # The window itself wraps past Dec 31, so every wrapping event overlaps it
+    return or_(
+        and_(not_wraps, or_(Event.start_doy <= to_doy, Event.end_doy >= from_doy)),
+        wraps,
+    )
+
+
+async def load_events(
+    db: AsyncSession,
+    user_id: str,
+    from_doy: Optional[int] = None,
+    to_doy: Optional[int] = None,
+    after: Optional[tuple] = None,
+    limit: Optional[int] = None,
+) -> list[dict]:
+    """Events in (month, day, id) order, optionally only those after the `after` key.
+
+    Rows come back as EventResponse-shaped dicts, without building ORM objects.
+    """
+    query = select(*EVENT_COLUMNS).where(Event.user_id == user_id)
+    if from_doy is not None and to_doy is not None:
+        query = query.where(_overlaps(from_doy, to_doy))
+    if after is not None:
+        query = query.where(tuple_(Event.month, Event.day, Event.id) > after)
+    query = query.order_by(Event.month, Event.day, Event.id)
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return [row._asdict() for row in result]
 
 
 @router.get("", response_model=list[EventResponse])
 async def get_events(
-    user: User = Depends(require_user),
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
+    from_date: Optional[str] = Query(None, alias="from", description="MM-DD"),
+    to_date: Optional[str] = Query(None, alias="to", description="MM-DD"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(require_user_id),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """List events, optionally only those overlapping the from..to window.
+
+    The window and multi-day events may both wrap from December to January.
+    With `limit`, returns one page and the cursor for the next in X-Next-Cursor.
+    """
+    if (from_date is None) != (to_date is None):
+        raise HTTPException(status_code=400, detail="'from' and 'to' must be given together")
+    from_doy = to_doy = None
+    if from_date is not None:
+        from_doy = _parse_month_day(from_date, "from")
+        to_doy = _parse_month_day(to_date, "to")
+
+    revision = await single_flight.run(user_id, "revision", (), lambda: current_revision(db, user_id))
+    not_modified = conditional_response(request, response, user_id, revision)
+    if not_modified:
+        return not_modified
+
+    after = decode_cursor(cursor, int, int, str) if cursor else None
+
+    async def load_page():
+        events = await load_events(db, user_id, from_doy, to_doy, after, limit + 1 if limit else None)
+        events, next_cursor = split_page(events, limit, lambda e: (e["month"], e["day"], e["id"]))
+        return encode_list(events), next_cursor
+
+    body, next_cursor = await single_flight.run(
+        user_id, "GET /api/events", (revision, from_doy, to_doy, limit, after), load_page
+    )
+    return encoded_list_response(body, next_cursor, response.headers)
+
+
+@router.get("/changes", response_model=EventChangesResponse)
+async def get_event_changes(
+    since: Optional[str] = None,
+    user_id: str = Depends(require_user_id),
+    db: AsyncSession = Depends(get_read_db),
 ):
+    """Events created, updated or deleted since `since`, the cursor from an earlier call.
+
+    Without `since`, returns every event. Either way the response carries the
+    cursor for the next call. A cursor older than the tombstone retention gets
+    410, since deletes before it may be forgotten: reload the full list.
+    """
+    after = 0
+    if since:
+        after, issued_at = decode_cursor(since, int, datetime)
+        if issued_at < datetime.utcnow() - TOMBSTONE_RETENTION:
+            raise HTTPException(status_code=410, detail="Cursor expired, reload all events")
+
+    # Read before the rows: a write that commits in between is sent again next time, never skipped
+    revision = await current_revision(db, user_id)
     result = await db.execute(
-        select(Event).where(Event.user_id == user.id).order_by(Event.month, Event.day)
+        select(*EVENT_COLUMNS)
+        .where(Event.user_id == user_id, Event.revision > after)
+        .order_by(Event.revision, Event.id)
     )
-    return result.scalars().all()
+    events = [row._asdict() for row in result]
+    deleted = []
+    if since:
+        result = await db.execute(
+            select(EventTombstone.event_id)
+            .where(EventTombstone.user_id == user_id, EventTombstone.revision > after)
+            .order_by(EventTombstone.revision, EventTombstone.event_id)
+        )
+        deleted = list(result.scalars())
+    return FastJSONResponse({
+        "events": events,
+        "deleted": deleted,
+        "cursor": encode_cursor(revision, datetime.utcnow()),
+    })
+
+
+async def _feed_user_id(request: Request, token: Optional[str] = Query(None)) -> str:
+    """Calendar apps can't send the session cookie, so the feed also takes a feed token."""
+    if token is None:
+        return await require_user_id(request)
+    user_id = await verify_feed_token(token)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid feed token")
+    return user_id
+
+
+async def _ics_stream(user_id: str):
+    year = date.today().year
+    stamp = datetime.utcnow()
+    yield calendar_header("Circle Calendar")
+    async with read_session_for(user_id)() as db:
+        # Server-side cursor: rows arrive ICS_FETCH_SIZE at a time
+        result = await db.stream(
+            select(Event.id, Event.month, Event.day, Event.end_month, Event.end_day,
+                   Event.title, Event.updated_at)
+            .where(Event.user_id == user_id)
+            .order_by(Event.month, Event.day, Event.id)
+            .execution_options(yield_per=ICS_FETCH_SIZE)
+        )
+        async for rows in result.partitions():
+            yield "".join(format_event(row, year, stamp) for row in rows)
+    yield calendar_footer()
+
+
+@router.get(".ics")
+async def get_events_ics(request: Request, user_id: str = Depends(_feed_user_id)):
+    """The user's events as an iCalendar feed of yearly all-day events."""
+    async with read_session_for(user_id)() as db:
+        revision = await current_revision(db, user_id)
+    response = StreamingResponse(
+        _ics_stream(user_id),
+        media_type="text/calendar; charset=utf-8",
+        headers={"Content-Disposition": 'inline; filename="circle-calendar.ics"'},
+    )
+    not_modified = conditional_response(request, response, user_id, revision)
+    if not_modified:
+        return not_modified
+    return response
+
+
+def _feed_url(user_id: str, version: int) -> str:
+    return f"{settings.frontend_url}/api/events.ics?token={create_feed_token(user_id, version)}"
+
+
+@router.get("/feed", response_model=EventFeedResponse)
+async def get_feed_url(user_id: str = Depends(require_user_id), db: AsyncSession = Depends(get_db)):
+    """Subscription URL for calendar apps."""
+    result = await db.execute(select(User.feed_token_version).where(User.id == user_id))
+    version = result.scalar_one_or_none()
+    if version is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return EventFeedResponse(url=_feed_url(user_id, version))
+
+
+@router.post("/feed/rotate", response_model=EventFeedResponse)
+async def rotate_feed_url(user_id: str = Depends(require_user_id), db: AsyncSession = Depends(get_db)):
+    """Revoke every subscription URL handed out so far and return a new one."""
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(feed_token_version=User.feed_token_version + 1)
+        .returning(User.feed_token_version)
+        .execution_options(synchronize_session=False)
+    )
+    version = result.scalar_one_or_none()
+    if version is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    await db.commit()
+    return EventFeedResponse(url=_feed_url(user_id, version))
+
+
+@router.post("/import", response_model=EventImportResponse)
+async def import_events(
+    request: Request,
+    user_id: str = Depends(require_user_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """Import the VEVENTs of an .ics file sent as the request body.
+
+    The body is parsed as it arrives, keeping only the column values of each
+    event (at most IMPORT_MAX_EVENTS of them). Only once the upload is complete
+    and valid does the import take the user's revision, which locks their row,
+    and insert the events in multi-row chunks in one transaction: a slow
+    upload holds no connection or lock, and either the whole file is imported
+    or nothing is.
+    """
+    skipped = 0
+    rows = []
+    try:
+        async for values in parse_events(unfold_lines(request.stream())):
+            if values is None:
+                skipped += 1
+                continue
+            if len(rows) >= IMPORT_MAX_EVENTS:
+                raise HTTPException(
+                    status_code=413, detail=f"At most {IMPORT_MAX_EVENTS} events can be imported at once"
+                )
+            rows.append({"id": generate_uuid(), "user_id": user_id, **values})
+    except ICSError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid iCalendar file: {e}")
+
+    if rows:
+        revision = await next_revision(db, user_id)
+        for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+            chunk = rows[start:start + IMPORT_CHUNK_SIZE]
+            await db.execute(insert(Event), [{"revision": revision, **row} for row in chunk])
+        await db.commit()
+    return EventImportResponse(imported=len(rows), skipped=skipped)
 
 
 @router.post("", response_model=EventResponse, status_code=201)
 async def create_event(
     event_data: EventCreate,
-    user: User = Depends(require_user),
+    user_id: str = Depends(require_user_id),
     db: AsyncSession = Depends(get_db),
 ):
-    # Default end date to start date if not provided
-    end_month = event_data.end_month if event_data.end_month is not None else event_data.month
-    end_day = event_data.end_day if event_data.end_day is not None else event_data.day
-
-    event = Event(
-        user_id=user.id,
-        month=event_data.month,
-        day=event_data.day,
-        end_month=end_month,
-        end_day=end_day,
-        title=event_data.title,
-        color=event_data.color,
+    revision = await next_revision(db, user_id)
+    result = await db.execute(
+        insert(Event)
+        .values(revision=revision, **_event_values(user_id, event_data))
+        .returning(*EVENT_COLUMNS)
     )
-    db.add(event)
+    event = result.one()._asdict()
     await db.commit()
-    await db.refresh(event)
     return event
 
 
+@router.post("/batch", response_model=EventBatchResponse)
+async def batch_events(
+    batch: EventBatchRequest,
+    user_id: str = Depends(require_user_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """Apply a mixed list of create/update/delete operations in one transaction.
+
+    Creates are a single multi-row INSERT, updates a single UPDATE and deletes
+    a single DELETE; all of them return their rows, so nothing is read back
+    afterwards. Operations on events that don't exist or belong to
+    someone else get a 404 result without aborting the rest of the batch.
+
+    Operations are grouped by kind rather than applied in request order, so a
+    batch may update or delete each event at most once; one that names an
+    event twice is rejected with 400 before anything is written. Results come
+    back in request order.
+    """
+    ops = batch.operations
+    seen = set()
+    for op in ops:
+        if op.op != "create":
+            if op.id in seen:
+                raise HTTPException(
+                    status_code=400, detail=f"Event {op.id} appears more than once in the batch"
+                )
+            seen.add(op.id)
+    revision = await next_revision(db, user_id)
+    create_rows = {}
+    for i, op in enumerate(ops):
+        if op.op == "create":
+            create_rows[i] = {"id": generate_uuid(), "revision": revision, **_event_values(user_id, op.data)}
+    update_data = {op.id: op.data for op in ops if op.op == "update"}
+    delete_ids = {op.id for op in ops if op.op == "delete"}
+
+    created = {}
+    if create_rows:
+        result = await db.execute(insert(Event).returning(*EVENT_COLUMNS), list(create_rows.values()))
+        created = {row.id: row._asdict() for row in result}
+
+    updated = {}
+    if update_data:
+        result = await db.execute(_update_events(user_id, update_data, revision))
+        updated = {row.id: row._asdict() for row in result}
+
+    deleted = set()
+    if delete_ids:
+        result = await db.execute(
+            delete(Event)
+            .where(Event.id.in_(delete_ids), Event.user_id == user_id)
+            .returning(Event.id)
+        )
+        deleted = set(result.scalars())
+        await _record_deletes(db, user_id, deleted, revision)
+
+    await db.commit()
+
+    results = []
+    for i, op in enumerate(ops):
+        if op.op == "create":
+            event_id = create_rows[i]["id"]
+            results.append(EventBatchResult(
+                op=op.op, id=event_id, status=201, event=created[event_id]
+            ))
+        elif op.op == "update":
+            if op.id in updated:
+                results.append(EventBatchResult(
+                    op=op.op, id=op.id, status=200, event=updated[op.id]
+                ))
+            else:
+                results.append(EventBatchResult(op=op.op, id=op.id, status=404))
+        else:
+            status = 204 if op.id in deleted else 404
+            results.append(EventBatchResult(op=op.op, id=op.id, status=status))
+
+    return EventBatchResponse(results=results)
+
+
 @router.put("/{event_id}", response_model=EventResponse)
 async def update_event(
     event_id: str,
     event_data: EventUpdate,
-    user: User = Depends(require_user),
+    user_id: str = Depends(require_user_id),
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(
-        select(Event).where(Event.id == event_id, Event.user_id == user.id)
-    )
-    event = result.scalar_one_or_none()
+    revision = await next_revision(db, user_id, only_if=_owns_event(user_id, event_id))
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    result = await db.execute(_update_event(user_id, event_id, event_data, revision))
+    event = result.one_or_none()
 
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
 
-    if event_data.month is not None:
-        event.month = event_data.month
-    if event_data.day is not None:
-        event.day = event_data.day
-    # Handle end_month/end_day - if explicitly set to None, use start date
-    if "end_month" in event_data.model_fields_set:
-        event.end_month = event_data.end_month if event_data.end_month is not None else event.month
-    if "end_day" in event_data.model_fields_set:
-        event.end_day = event_data.end_day if event_data.end_day is not None else event.day
-    if event_data.title is not None:
-        event.title = event_data.title
-    if event_data.color is not None:
-        event.color = event_data.color
-    if event_data.hidden is not None:
-        event.hidden = event_data.hidden
-
     await db.commit()
-    await db.refresh(event)
-    return event
+    return event._asdict()
 
 
 @router.delete("/{event_id}", status_code=204)
 async def delete_event(
     event_id: str,
-    user: User = Depends(require_user),
+    user_id: str = Depends(require_user_id),
     db: AsyncSession = Depends(get_db),
 ):
+    revision = await next_revision(db, user_id, only_if=_owns_event(user_id, event_id))
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Event not found")
     result = await db.execute(
-        select(Event).where(Event.id == event_id, Event.user_id == user.id)
+        delete(Event)
+        .where(Event.id == event_id, Event.user_id == user_id)
+        .returning(Event.id)
     )
-    event = result.scalar_one_or_none()
 
-    if not event:
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Event not found")
 
-    await db.delete(event)
+    await _record_deletes(db, user_id, [event_id], revision)
     await db.commit()
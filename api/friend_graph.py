@@ -0,0 +1,80 @@
+"""The friend graph as symmetric edges.
+
+A Friendship row is directed (requester -> addressee), so "friends of X" used
+to mean `requester_id = X OR addressee_id = X`, which no single index serves.
+Each friendship is mirrored by two FriendEdge rows, one per direction,
+carrying its status and created_at. Friend lists, friend-birthday lookups and
+the revision fan-out are a range scan of (user_id, status, ...), and "how are
+X and Y related" is a primary key lookup.
+
+Writes that create a friendship or change its status update the edges in the
+same transaction through the helpers here; deleting a friendship (or a user)
+removes its edges by cascade.
+"""
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Friendship, FriendEdge
+
+
+def edge_rows(friendship: dict) -> list[dict]:
+    """The two FriendEdge rows for a friendship given as column values (bulk loads)."""
+    shared = {"friendship_id": friendship["id"], "status": friendship["status"], "created_at": friendship.get("created_at")}
+    return [
+        {"user_id": friendship["requester_id"], "friend_id": friendship["addressee_id"], **shared},
+        {"user_id": friendship["addressee_id"], "friend_id": friendship["requester_id"], **shared},
+    ]
+
+
+async def add_edges(db: AsyncSession, *friendship_ids: str) -> None:
+    """Mirror newly inserted (flushed) friendships into edges, copying status and created_at."""
+    if not friendship_ids:
+        return
+    mine = Friendship.id.in_(friendship_ids)
+    both_directions = select(
+        Friendship.requester_id, Friendship.addressee_id, Friendship.id, Friendship.status, Friendship.created_at
+    ).where(mine).union_all(
+        select(
+            Friendship.addressee_id, Friendship.requester_id, Friendship.id, Friendship.status, Friendship.created_at
+        ).where(mine)
+    )
+    await db.execute(
+        insert(FriendEdge).from_select(
+            ["user_id", "friend_id", "friendship_id", "status", "created_at"], both_directions
+        )
+    )
+
+
+async def set_edge_status(db: AsyncSession, user_id: str, other_id: str, status: str) -> None:
+    """Give both edges between two users a friendship's new status."""
+    await db.execute(
+        update(FriendEdge)
+        .where(FriendEdge.user_id.in_((user_id, other_id)), FriendEdge.friend_id.in_((user_id, other_id)))
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def set_edge_status_by_friendship(db: AsyncSession, friendship_ids, status: str) -> None:
+    """Give the edges of several friendships a new status."""
+    await db.execute(
+        update(FriendEdge)
+        .where(FriendEdge.friendship_id.in_(friendship_ids))
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def accepted_friend_ids(user_id: str):
+    """SELECT of the ids of a user's accepted friends."""
+    return select(FriendEdge.friend_id).where(FriendEdge.user_id == user_id, FriendEdge.status == "accepted")
+
+
+async def friendship_between(db: AsyncSession, user_id: str, other_id: str):
+    """The friendship between two users in either direction, or None: one edge lookup plus its row."""
+    result = await db.execute(
+        select(Friendship)
+        .join(FriendEdge, FriendEdge.friendship_id == Friendship.id)
+        .where(FriendEdge.user_id == user_id, FriendEdge.friend_id == other_id)
+    )
+    return result.scalar_one_or_none()
@@ -1,91 +1,184 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import json
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, and_
-from sqlalchemy.orm import selectinload
-from typing import List
+from sqlalchemy import select, insert, update, delete, or_, case, func, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from typing import List, Optional
 
 from .database import get_db
-from .models import User, Friendship, PendingInvitation
+from .models import User, Friendship, FriendEdge, PendingInvitation, generate_uuid
 from .schemas import (
     FriendRequestCreate,
     FriendRequestResponse,
     FriendshipResponse,
-    FriendUserResponse,
     FriendRequestAction,
     FriendRequestSentResponse,
+    FriendRequestBatchCreate,
+    FriendRequestBatchResult,
+    FriendRequestBatchResponse,
 )
-from .auth import require_user
-from .email import send_friend_invitation
+from .auth import require_user, require_user_id, get_read_db
+from .user_cache import UserSnapshot
+from .email import enqueue_friend_invitation, enqueue_friend_invitations
+from .friend_graph import add_edges, friendship_between, set_edge_status, set_edge_status_by_friendship
+from .outbox import outbox_worker
+from .revisions import bump_revision, current_revision, conditional_response
+from .notifications import hub
+from .pagination import MAX_PAGE_SIZE, decode_cursor, split_page, encode_list, encoded_list_response
+from .rate_limit import admission
+from .singleflight import single_flight
 
-router = APIRouter(prefix="/api/friends", tags=["friends"])
+router = APIRouter(prefix="/api/friends", tags=["friends"], dependencies=[Depends(admission)])
 
+# Comment line sent on idle streams so proxies don't drop the connection
+STREAM_KEEPALIVE_SECONDS = 25
 
-@router.get("", response_model=List[FriendshipResponse])
-async def get_friends(
-    user: User = Depends(require_user),
-    db: AsyncSession = Depends(get_db),
-):
-    """Get all accepted friends for the current user."""
-    result = await db.execute(
-        select(Friendship)
-        .options(selectinload(Friendship.requester), selectinload(Friendship.addressee))
+
+# The FriendUserResponse fields, read straight from the joined users row
+FRIEND_USER_COLUMNS = (
+    User.id, User.email, User.name, User.picture_url, User.birthday_month, User.birthday_day,
+)
+_FRIEND_USER_FIELDS = tuple(column.key for column in FRIEND_USER_COLUMNS)
+
+
+async def load_friends(
+    db: AsyncSession, user_id: str, after: Optional[tuple] = None, limit: Optional[int] = None
+) -> List[dict]:
+    """Accepted friendships of a user, each with the "other" user as friend.
+
+    Oldest first by (created_at, id), optionally only those after the `after` key.
+    One range scan of the user's friend edges joined to the friend's user row;
+    results are FriendshipResponse-shaped dicts.
+    """
+    query = (
+        select(FriendEdge.friendship_id, FriendEdge.created_at, *FRIEND_USER_COLUMNS)
+        .join(User, User.id == FriendEdge.friend_id)
+        .where(FriendEdge.user_id == user_id, FriendEdge.status == "accepted")
+        .order_by(FriendEdge.created_at, FriendEdge.friendship_id)
+    )
+    if after is not None:
+        query = query.where(tuple_(FriendEdge.created_at, FriendEdge.friendship_id) > after)
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return [
+        {"id": row[0], "friend": dict(zip(_FRIEND_USER_FIELDS, row[2:])), "created_at": row[1]}
+        for row in result
+    ]
+
+
+async def load_pending_requests(
+    db: AsyncSession, user_id: str, before: Optional[tuple] = None, limit: Optional[int] = None
+) -> List[dict]:
+    """Pending friend requests received by a user, newest first.
+
+    Ordered by (created_at, id) descending, optionally only those before the `before` key.
+    Results are FriendRequestResponse-shaped dicts.
+    """
+    query = (
+        select(Friendship.id, Friendship.status, Friendship.created_at, *FRIEND_USER_COLUMNS)
+        .join(User, User.id == Friendship.requester_id)
         .where(
-            and_(
-                or_(
-                    Friendship.requester_id == user.id,
-                    Friendship.addressee_id == user.id
-                ),
-                Friendship.status == "accepted"
-            )
+            Friendship.addressee_id == user_id,
+            Friendship.status == "pending"
         )
+        .order_by(Friendship.created_at.desc(), Friendship.id.desc())
     )
-    friendships = result.scalars().all()
+    if before is not None:
+        query = query.where(tuple_(Friendship.created_at, Friendship.id) < before)
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return [
+        {
+            "id": row[0],
+            "requester": dict(zip(_FRIEND_USER_FIELDS, row[3:])),
+            "status": row[1],
+            "created_at": row[2],
+        }
+        for row in result
+    ]
+
+
+@router.get("", response_model=List[FriendshipResponse])
+async def get_friends(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(require_user_id),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Get accepted friends for the current user, one page at a time with `limit`."""
+    revision = await single_flight.run(user_id, "revision", (), lambda: current_revision(db, user_id))
+    not_modified = conditional_response(request, response, user_id, revision)
+    if not_modified:
+        return not_modified
+
+    after = decode_cursor(cursor, datetime, str) if cursor else None
 
-    # Transform to include the "other" user as friend
-    response = []
-    for f in friendships:
-        friend = f.addressee if f.requester_id == user.id else f.requester
-        response.append(FriendshipResponse(
-            id=f.id,
-            friend=FriendUserResponse.model_validate(friend),
-            created_at=f.created_at
-        ))
+    async def load_page():
+        friends = await load_friends(db, user_id, after, limit + 1 if limit else None)
+        friends, next_cursor = split_page(friends, limit, lambda f: (f["created_at"], f["id"]))
+        return encode_list(friends), next_cursor
 
-    return response
+    body, next_cursor = await single_flight.run(user_id, "GET /api/friends", (revision, limit, after), load_page)
+    return encoded_list_response(body, next_cursor, response.headers)
 
 
 @router.get("/requests/pending", response_model=List[FriendRequestResponse])
 async def get_pending_requests(
-    user: User = Depends(require_user),
-    db: AsyncSession = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(require_user_id),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    """Get pending friend requests received by the current user."""
-    result = await db.execute(
-        select(Friendship)
-        .options(selectinload(Friendship.requester))
-        .where(
-            Friendship.addressee_id == user.id,
-            Friendship.status == "pending"
-        )
-        .order_by(Friendship.created_at.desc())
+    """Get pending friend requests received by the current user, newest first."""
+    before = decode_cursor(cursor, datetime, str) if cursor else None
+
+    async def load_page():
+        requests = await load_pending_requests(db, user_id, before, limit + 1 if limit else None)
+        requests, next_cursor = split_page(requests, limit, lambda r: (r["created_at"], r["id"]))
+        return encode_list(requests), next_cursor
+
+    body, next_cursor = await single_flight.run(
+        user_id, "GET /api/friends/requests/pending", (limit, before), load_page
     )
-    friendships = result.scalars().all()
+    return encoded_list_response(body, next_cursor)
 
-    return [
-        FriendRequestResponse(
-            id=f.id,
-            requester=FriendUserResponse.model_validate(f.requester),
-            status=f.status,
-            created_at=f.created_at
-        )
-        for f in friendships
-    ]
+
+@router.get("/stream")
+async def stream_notifications(user_id: str = Depends(require_user_id)):
+    """Server-sent events for friend requests, acceptances and birthday changes.
+
+    Replaces polling: an idle connection waits on an in-memory queue and costs
+    no database queries.
+    """
+    async def event_stream():
+        async with hub.subscribe(user_id) as queue:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/request", response_model=FriendRequestSentResponse, status_code=201)
 async def send_friend_request(
     request_data: FriendRequestCreate,
-    user: User = Depends(require_user),
+    user: UserSnapshot = Depends(require_user),
     db: AsyncSession = Depends(get_db),
 ):
     """Send a friend request to another user by email."""
@@ -93,7 +186,7 @@ async def send_friend_request(
 
     # Find addressee by email
     result = await db.execute(
-        select(User).where(User.email == email)
+        select(User).where(func.lower(User.email) == email)
     )
     addressee = result.scalar_one_or_none()
 
@@ -113,10 +206,12 @@ async def send_friend_request(
                 invited_email=email.lower()
             )
             db.add(pending)
-            await db.commit()
 
+        # Queued in the same transaction; the outbox worker sends it in the background
         from_name = user.name or user.email.split("@")[0]
-        await send_friend_invitation(email, from_name)
+        enqueue_friend_invitation(db, email, from_name)
+        await db.commit()
+        outbox_worker.wake()
         return FriendRequestSentResponse(
             message="Invitation sent! They'll see your request when they join.",
             invited=True
@@ -126,21 +221,7 @@ async def send_friend_request(
         raise HTTPException(status_code=400, detail="Cannot add yourself as a friend")
 
     # Check if friendship already exists (in either direction)
-    result = await db.execute(
-        select(Friendship).where(
-            or_(
-                and_(
-                    Friendship.requester_id == user.id,
-                    Friendship.addressee_id == addressee.id
-                ),
-                and_(
-                    Friendship.requester_id == addressee.id,
-                    Friendship.addressee_id == user.id
-                )
-            )
-        )
-    )
-    existing = result.scalar_one_or_none()
+    existing = await friendship_between(db, user.id, addressee.id)
 
     if existing:
         if existing.status == "accepted":
@@ -149,7 +230,10 @@ async def send_friend_request(
             # If the other person already sent us a request, auto-accept
             if existing.requester_id == addressee.id:
                 existing.status = "accepted"
+                await set_edge_status(db, user.id, addressee.id, "accepted")
+                await bump_revision(db, user.id, addressee.id)
                 await db.commit()
+                await hub.publish([addressee.id], "friend_accepted", friendship_id=existing.id)
                 return FriendRequestSentResponse(
                     message="Friend request accepted! They had already sent you a request."
                 )
@@ -159,7 +243,10 @@ async def send_friend_request(
             existing.status = "pending"
             existing.requester_id = user.id
             existing.addressee_id = addressee.id
+            await set_edge_status(db, user.id, addressee.id, "pending")
+            await bump_revision(db, user.id, addressee.id)
             await db.commit()
+            await hub.publish([addressee.id], "friend_request", friendship_id=existing.id)
             return FriendRequestSentResponse(message="Friend request sent!")
 
     # Create new friendship request
@@ -169,65 +256,220 @@ async def send_friend_request(
         status="pending"
     )
     db.add(friendship)
+    await db.flush()
+    await add_edges(db, friendship.id)
+    await bump_revision(db, user.id, addressee.id)
     await db.commit()
+    await hub.publish([addressee.id], "friend_request", friendship_id=friendship.id)
 
     return FriendRequestSentResponse(message="Friend request sent!")
 
 
+def _normalize_email(email: str) -> Optional[str]:
+    """Lowercased address, or None if it can't be one."""
+    email = email.strip().lower()
+    if not 3 <= len(email) <= 255 or email.count("@") != 1 or any(c.isspace() for c in email):
+        return None
+    return email
+
+
+def _insert_ignoring_duplicates(db: AsyncSession, model):
+    """INSERT ... ON CONFLICT DO NOTHING for the session's database."""
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model).on_conflict_do_nothing()
+
+
+@router.post("/request/batch", response_model=FriendRequestBatchResponse)
+async def send_friend_requests(
+    batch: FriendRequestBatchCreate,
+    user: UserSnapshot = Depends(require_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Send friend requests to a list of addresses, e.g. an uploaded contact list.
+
+    Addresses are normalized and deduplicated, then handled in bulk in one
+    transaction: one IN query finds those with accounts and one their existing
+    friendships, new requests are a multi-row INSERT, and addresses without an
+    account get a pending invitation (ON CONFLICT DO NOTHING) and, if it is
+    new, an invitation email in one outbox INSERT. Returns an outcome per
+    distinct address, in the order given.
+    """
+    outcomes: dict[str, FriendRequestBatchResult] = {}
+    emails = []
+    for raw in batch.emails:
+        email = _normalize_email(raw)
+        if email is None:
+            outcomes.setdefault(raw, FriendRequestBatchResult(email=raw, outcome="invalid"))
+        elif email not in outcomes:
+            outcomes[email] = None
+            emails.append(email)
+
+    addressees = {}
+    if emails:
+        # Should several accounts share an address, the request goes to one of them
+        result = await db.execute(
+            select(func.lower(User.email), User.id).where(func.lower(User.email).in_(emails))
+        )
+        addressees = dict(result.all())
+
+    existing = {}
+    if addressees:
+        result = await db.execute(
+            select(FriendEdge.friend_id, Friendship.id, Friendship.status, Friendship.requester_id)
+            .join(Friendship, Friendship.id == FriendEdge.friendship_id)
+            .where(FriendEdge.user_id == user.id, FriendEdge.friend_id.in_(addressees.values()))
+        )
+        existing = {row.friend_id: row for row in result}
+
+    new_rows, accept_ids, rerequest_ids, uninvited = [], [], [], []
+    # (addressee id, notification type, friendship id)
+    notifications = []
+    for email in emails:
+        addressee_id = addressees.get(email)
+        if addressee_id is None:
+            uninvited.append(email)
+            continue
+        friendship = existing.get(addressee_id)
+        if addressee_id == user.id:
+            outcome, friendship_id = "self", None
+        elif friendship is None:
+            friendship_id = generate_uuid()
+            new_rows.append({"id": friendship_id, "requester_id": user.id, "addressee_id": addressee_id,
+                             "status": "pending"})
+            outcome = "requested"
+        elif friendship.status == "accepted":
+            outcome, friendship_id = "already_friends", friendship.id
+        elif friendship.status == "pending" and friendship.requester_id == user.id:
+            outcome, friendship_id = "already_pending", friendship.id
+        elif friendship.status == "pending":
+            # They had already asked us, as in the single request
+            accept_ids.append(friendship.id)
+            outcome, friendship_id = "accepted", friendship.id
+        else:
+            # Re-request after decline
+            rerequest_ids.append(friendship.id)
+            outcome, friendship_id = "requested", friendship.id
+        outcomes[email] = FriendRequestBatchResult(email=email, outcome=outcome, friendship_id=friendship_id)
+        if outcome in ("requested", "accepted"):
+            event_type = "friend_request" if outcome == "requested" else "friend_accepted"
+            notifications.append((addressee_id, event_type, friendship_id))
+
+    if new_rows:
+        await db.execute(insert(Friendship), new_rows)
+        await add_edges(db, *(row["id"] for row in new_rows))
+    if accept_ids:
+        await db.execute(
+            update(Friendship).where(Friendship.id.in_(accept_ids)).values(status="accepted")
+            .execution_options(synchronize_session=False)
+        )
+        await set_edge_status_by_friendship(db, accept_ids, "accepted")
+    if rerequest_ids:
+        # Turned around so we are the requester; SET sees the old values on both sides
+        await db.execute(
+            update(Friendship)
+            .where(Friendship.id.in_(rerequest_ids))
+            .values(
+                status="pending",
+                requester_id=user.id,
+                addressee_id=case(
+                    (Friendship.requester_id == user.id, Friendship.addressee_id), else_=Friendship.requester_id
+                ),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await set_edge_status_by_friendship(db, rerequest_ids, "pending")
+
+    if uninvited:
+        # Only addresses not already invited by this user get an email
+        result = await db.execute(
+            _insert_ignoring_duplicates(db, PendingInvitation).returning(PendingInvitation.invited_email),
+            [{"id": generate_uuid(), "inviter_id": user.id, "invited_email": email} for email in uninvited],
+        )
+        invited = set(result.scalars())
+        for email in uninvited:
+            outcomes[email] = FriendRequestBatchResult(
+                email=email, outcome="invited" if email in invited else "already_invited"
+            )
+        from_name = user.name or user.email.split("@")[0]
+        await enqueue_friend_invitations(db, [email for email in uninvited if email in invited], from_name)
+
+    if notifications:
+        await bump_revision(db, user.id, *(addressee_id for addressee_id, _, _ in notifications))
+    await db.commit()
+    if uninvited:
+        outbox_worker.wake()
+
+    for addressee_id, event_type, friendship_id in notifications:
+        await hub.publish([addressee_id], event_type, friendship_id=friendship_id)
+    return FriendRequestBatchResponse(results=list(outcomes.values()))
+
+
 @router.patch("/request/{friendship_id}", response_model=FriendRequestResponse)
 async def respond_to_friend_request(
     friendship_id: str,
     action: FriendRequestAction,
-    user: User = Depends(require_user),
+    user_id: str = Depends(require_user_id),
     db: AsyncSession = Depends(get_db),
 ):
     """Accept or decline a friend request."""
     result = await db.execute(
-        select(Friendship)
-        .options(selectinload(Friendship.requester))
+        update(Friendship)
         .where(
             Friendship.id == friendship_id,
-            Friendship.addressee_id == user.id,
+            Friendship.addressee_id == user_id,
             Friendship.status == "pending"
         )
+        .values(status="accepted" if action.accept else "declined")
+        .returning(Friendship.id, Friendship.requester_id, Friendship.status, Friendship.created_at)
+        .execution_options(synchronize_session=False)
     )
-    friendship = result.scalar_one_or_none()
+    friendship = result.one_or_none()
 
     if not friendship:
         raise HTTPException(status_code=404, detail="Friend request not found")
 
-    friendship.status = "accepted" if action.accept else "declined"
+    await set_edge_status(db, friendship.requester_id, user_id, friendship.status)
+    # The requester's row is updated anyway; take the response's user columns from it
+    bumped = await bump_revision(db, friendship.requester_id, user_id, returning=FRIEND_USER_COLUMNS)
+    requester = next(row for row in bumped if row.id == friendship.requester_id)
     await db.commit()
-    await db.refresh(friendship)
+    if action.accept:
+        await hub.publish([friendship.requester_id], "friend_accepted", friendship_id=friendship.id)
 
-    return FriendRequestResponse(
-        id=friendship.id,
-        requester=FriendUserResponse.model_validate(friendship.requester),
-        status=friendship.status,
-        created_at=friendship.created_at
-    )
+    return {
+        "id": friendship.id,
+        "requester": requester._asdict(),
+        "status": friendship.status,
+        "created_at": friendship.created_at,
+    }
 
 
 @router.delete("/{friendship_id}", status_code=204)
 async def remove_friend(
     friendship_id: str,
-    user: User = Depends(require_user),
+    user_id: str = Depends(require_user_id),
     db: AsyncSession = Depends(get_db),
 ):
-    """Remove a friend (delete the friendship)."""
+    """Remove a friend (delete the friendship; its edges go by cascade)."""
     result = await db.execute(
-        select(Friendship).where(
+        delete(Friendship)
+        .where(
             Friendship.id == friendship_id,
             or_(
-                Friendship.requester_id == user.id,
-                Friendship.addressee_id == user.id
+                Friendship.requester_id == user_id,
+                Friendship.addressee_id == user_id
             )
         )
+        .returning(Friendship.id, Friendship.requester_id, Friendship.addressee_id)
+        .execution_options(synchronize_session=False)
     )
-    friendship = result.scalar_one_or_none()
+    friendship = result.one_or_none()
 
     if not friendship:
         raise HTTPException(status_code=404, detail="Friendship not found")
 
-    await db.delete(friendship)
+    await bump_revision(db, friendship.requester_id, friendship.addressee_id)
     await db.commit()
+
+    other_id = friendship.addressee_id if friendship.requester_id == user_id else friendship.requester_id
+    await hub.publish([other_id], "friend_removed", friendship_id=friendship.id)
@@ -0,0 +1,212 @@
+"""iCalendar (RFC 5545) export and incremental import of events.
+
+Events have no year, so they are exported as all-day VEVENTs repeating
+yearly, anchored in the current year (the last leap year for Feb 29).
+Imported VEVENTs keep only their start and end month/day.
+"""
+import codecs
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Optional
+
+PRODID = "-//Circle Calendar//Circle Calendar//EN"
+# Longest logical (unfolded) line accepted on import
+MAX_LINE_LENGTH = 64 * 1024
+MAX_TITLE_LENGTH = 500
+
+
+class ICSError(ValueError):
+    pass
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _unescape(text: str) -> str:
+    out = []
+    chars = iter(text)
+    for char in chars:
+        if char == "\\":
+            char = next(chars, "")
+            out.append("\n" if char in ("n", "N") else char)
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+def _fold(line: str) -> str:
+    """Fold a content line at 75 octets, without splitting UTF-8 sequences."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Back up to a character boundary
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode("utf-8"))
+        start, limit = end, 74
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _anchor_year(month: int, day: int, year: int) -> int:
+    if month == 2 and day == 29:
+        while not (year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)):
+            year -= 1
+    return year
+
+
+def calendar_header(name: str) -> str:
+    return "".join(_fold(line) for line in [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+    ])
+
+
+def calendar_footer() -> str:
+    return "END:VCALENDAR\r\n"
+
+
+def _rolled_date(year: int, month: int, day: int) -> date:
+    """The date `day - 1` days after the first of the month.
+
+    Stored days go up to 31 in every month, so Feb 30 or Apr 31 are valid
+    rows; like the ring, they roll over into the next month.
+    """
+    return date(year, month, 1) + timedelta(days=day - 1)
+
+
+def format_event(event, year: int, stamp: datetime) -> str:
+    """One yearly all-day VEVENT for an event row."""
+    start_year = _anchor_year(event.month, event.day, year)
+    start = _rolled_date(start_year, event.month, event.day)
+    end_month = event.end_month or event.month
+    end_day = event.end_day or event.day
+    end_year = start_year if (end_month, end_day) >= (event.month, event.day) else start_year + 1
+    # Feb 29 in a common year becomes Mar 1
+    end = max(_rolled_date(end_year, end_month, end_day), start)
+    updated = event.updated_at or stamp
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{event.id}@circle-calendar",
+        f"DTSTAMP:{stamp.strftime('%Y%m%dT%H%M%SZ')}",
+        f"LAST-MODIFIED:{updated.strftime('%Y%m%dT%H%M%SZ')}",
+        f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}",
+        # DTEND is exclusive for all-day events
+        f"DTEND;VALUE=DATE:{(end + timedelta(days=1)).strftime('%Y%m%d')}",
+        "RRULE:FREQ=YEARLY",
+        f"SUMMARY:{_escape(event.title)}",
+        "TRANSP:TRANSPARENT",
+        "END:VEVENT",
+    ]
+    return "".join(_fold(line) for line in lines)
+
+
+def _join_folded(pending: Optional[str], physical: list[str]) -> tuple[list[str], Optional[str]]:
+    """Merge continuation lines into `pending`; returns completed lines and the new pending one."""
+    completed = []
+    for line in physical:
+        line = line.rstrip("\r")
+        if line[:1] in (" ", "\t") and pending is not None:
+            pending += line[1:]
+        else:
+            if pending:
+                completed.append(pending)
+            pending = line
+        if pending is not None and len(pending) > MAX_LINE_LENGTH:
+            raise ICSError("Line too long")
+    return completed, pending
+
+
+async def unfold_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Logical content lines from a byte stream, unfolding continuation lines."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    pending: Optional[str] = None
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *physical, buffer = buffer.split("\n")
+        if len(buffer) > MAX_LINE_LENGTH:
+            raise ICSError("Line too long")
+        completed, pending = _join_folded(pending, physical)
+        for line in completed:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    completed, pending = _join_folded(pending, buffer.split("\n"))
+    for line in completed:
+        yield line
+    if pending:
+        yield pending
+
+
+def _parse_date(value: str) -> date:
+    # DATE or DATE-TIME (floating, UTC or TZID); only the calendar date is kept
+    return datetime.strptime(value[:8], "%Y%m%d").date()
+
+
+def _split_property(line: str) -> tuple[str, dict, str]:
+    name_params, _, value = line.partition(":")
+    name, *params = name_params.split(";")
+    parsed = {}
+    for param in params:
+        key, _, param_value = param.partition("=")
+        parsed[key.upper()] = param_value.strip('"').upper()
+    return name.upper(), parsed, value
+
+
+def _event_from_properties(properties: dict) -> Optional[dict]:
+    if "DTSTART" not in properties:
+        return None
+    try:
+        start_params, start_value = properties["DTSTART"]
+        start = _parse_date(start_value)
+        end = start
+        if "DTEND" in properties:
+            end_params, end_value = properties["DTEND"]
+            end = _parse_date(end_value)
+            # DATE values (and midnight DATE-TIMEs) end exclusively
+            if end > start and (end_params.get("VALUE") == "DATE" or len(end_value) == 8
+                                or end_value[9:15] == "000000"):
+                end -= timedelta(days=1)
+    except ValueError:
+        return None
+    if end < start or (end - start).days >= 365:
+        end = start
+    title = _unescape(properties.get("SUMMARY", ({}, ""))[1]).strip()[:MAX_TITLE_LENGTH]
+    return {
+        "month": start.month,
+        "day": start.day,
+        "end_month": end.month,
+        "end_day": end.day,
+        "title": title or "Untitled",
+    }
+
+
+async def parse_events(lines: AsyncIterator[str]) -> AsyncIterator[Optional[dict]]:
+    """Event values for each VEVENT, or None for one that can't be imported."""
+    properties: Optional[dict] = None
+    depth = 0
+    async for line in lines:
+        name, params, value = _split_property(line)
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and properties is None:
+                properties, depth = {}, 0
+            elif properties is not None:
+                # Nested components (VALARM) don't contribute properties
+                depth += 1
+        elif name == "END":
+            if properties is not None and depth:
+                depth -= 1
+            elif properties is not None and value.upper() == "VEVENT":
+                yield _event_from_properties(properties)
+                properties = None
+        elif properties is not None and not depth and name not in properties:
+            properties[name] = (params, value)
@@ -0,0 +1,255 @@
+"""Server-side placement of the ring's annotation labels.
+
+Runs the energy model from labeler.js (leader length, label/label overlap,
+label/anchor overlap) plus D3-Labeler's orientation bias as a vectorized
+annealer. Each step proposes a move for one random slice of the labels and
+scores the old and new positions of the whole slice in a single NumPy pass;
+the overlap terms only look at pairs that share a cell of a uniform grid,
+so dense calendars don't pay for every pair of labels.
+
+Layouts depend only on the request, so they are cached by a hash of it and
+the annealer is seeded from the same hash: identical label sets and
+viewports always get identical positions.
+"""
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends
+
+from .auth import require_user_id
+from .config import get_settings
+from .rate_limit import admission
+from .schemas import LayoutRequest, LayoutResponse, LayoutPosition
+
+router = APIRouter(prefix="/api/layout", tags=["layout"], dependencies=[Depends(admission)])
+settings = get_settings()
+
+# Same weights and move sizes as labeler.js
+W_LEN = 0.2
+W_LAB2 = 30.0
+W_LAB_ANC = 30.0
+W_ORIENT = 3.0
+MAX_MOVE = 5.0
+MAX_ANGLE = 0.5
+# Labels moved together per step; the rest stay put while they are scored
+SLICES = 4
+
+_NEIGHBOUR_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+
+class Grid:
+    """Points bucketed into cells of cell_w x cell_h for neighbour lookups."""
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, cell_w: float, cell_h: float):
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+        cx, cy = self._cells(x, y)
+        self._keys = self._key(cx, cy)
+        self._order = np.argsort(self._keys, kind="stable")
+        self._sorted = self._keys[self._order]
+
+    def _cells(self, x, y):
+        return np.floor(x / self.cell_w).astype(np.int64), np.floor(y / self.cell_h).astype(np.int64)
+
+    @staticmethod
+    def _key(cx, cy):
+        # Unique while |cy| stays below the multiplier; cells are viewport sized
+        return cx * 1_000_003 + cy
+
+    def pairs(self, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(query index, point index) for every point in the 3x3 cells around each query."""
+        cx, cy = self._cells(x, y)
+        keys = self._key(
+            (cx[:, None] + _NEIGHBOUR_OFFSETS[:, 0]).ravel(),
+            (cy[:, None] + _NEIGHBOUR_OFFSETS[:, 1]).ravel(),
+        )
+        lo = np.searchsorted(self._sorted, keys, "left")
+        counts = np.searchsorted(self._sorted, keys, "right") - lo
+        total = int(counts.sum())
+        query = np.repeat(np.arange(len(x)).repeat(len(_NEIGHBOUR_OFFSETS)), counts)
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        return query, self._order[np.repeat(lo, counts) + within]
+
+
+def _energy(
+    idx: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    lab_x: np.ndarray,
+    lab_y: np.ndarray,
+    width: np.ndarray,
+    height: np.ndarray,
+    anchor_x: np.ndarray,
+    anchor_y: np.ndarray,
+    label_grid: Grid,
+    anchor_grid: Grid,
+) -> np.ndarray:
+    """Energy of labels `idx` placed at (x, y), against every other label where it is now."""
+    w, h = width[idx], height[idx]
+    dx = x - anchor_x[idx]
+    dy = anchor_y[idx] - y
+    energy = np.hypot(dx, dy) * W_LEN
+
+    # Orientation: prefer up-right of the anchor, then up-left, down-left, down-right
+    energy += W_ORIENT * np.select([(dx > 0) & (dy > 0), (dx < 0) & (dy > 0), (dx < 0) & (dy < 0)], [0, 1, 2], 3)
+
+    # Label/label overlap (boxes are [x, x + w] x [y - h + 2, y + 2], as in labeler.js)
+    q, j = label_grid.pairs(x + w / 2, y - h / 2 + 2)
+    others = j != idx[q]
+    q, j = q[others], j[others]
+    x_overlap = np.minimum(lab_x[j] + width[j], x[q] + w[q]) - np.maximum(lab_x[j], x[q])
+    y_overlap = np.minimum(lab_y[j] + 2, y[q] + 2) - np.maximum(lab_y[j] - height[j] + 2, y[q] - h[q] + 2)
+    area = np.clip(x_overlap, 0, None) * np.clip(y_overlap, 0, None)
+    energy += np.bincount(q, weights=area * W_LAB2, minlength=len(idx))
+
+    # Anchors inside [x, x + w] x [y, y + h], own anchor included
+    q, k = anchor_grid.pairs(x + w / 2, y + h / 2)
+    adx = anchor_x[k] - x[q]
+    ady = anchor_y[k] - y[q]
+    inside = (adx >= 0) & (adx <= w[q]) & (ady >= 0) & (ady <= h[q])
+    energy += np.bincount(q[inside], minlength=len(idx)) * W_LAB_ANC
+    return energy
+
+
+def place_labels(
+    x: np.ndarray,
+    y: np.ndarray,
+    width: np.ndarray,
+    height: np.ndarray,
+    anchor_x: np.ndarray,
+    anchor_y: np.ndarray,
+    viewport_width: float,
+    viewport_height: float,
+    sweeps: int = 500,
+    seed: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Anneal label positions inside [0, viewport_width] x [0, viewport_height]."""
+    n = len(x)
+    x = np.array(x, dtype=float)
+    y = np.array(y, dtype=float)
+    if n == 0 or sweeps <= 0:
+        return x, y
+    width = np.asarray(width, dtype=float)
+    height = np.asarray(height, dtype=float)
+    anchor_x = np.asarray(anchor_x, dtype=float)
+    anchor_y = np.asarray(anchor_y, dtype=float)
+
+    rng = np.random.default_rng(seed)
+    # Labels are wide and short; cells that fit the largest one keep any
+    # overlapping pair within one cell of each other on both axes
+    cell_w = max(float(width.max()), 1.0)
+    cell_h = max(float(height.max()), 1.0)
+    anchor_grid = Grid(anchor_x, anchor_y, cell_w, cell_h)
+    slices = min(SLICES, n)
+    temperature = 1.0
+
+    for _ in range(sweeps):
+        for idx in np.array_split(rng.permutation(n), slices):
+            old_x, old_y = x[idx], y[idx]
+
+            # Half the slice translates, the other half rotates around its anchor
+            rotate = rng.random(len(idx)) < 0.5
+            step_x = (rng.random(len(idx)) - 0.5) * MAX_MOVE
+            step_y = (rng.random(len(idx)) - 0.5) * MAX_MOVE
+            angle = (rng.random(len(idx)) - 0.5) * MAX_ANGLE
+            rel_x, rel_y = old_x - anchor_x[idx], old_y - anchor_y[idx]
+            sin, cos = np.sin(angle), np.cos(angle)
+            new_x = np.where(rotate, anchor_x[idx] + rel_x * cos - rel_y * sin, old_x + step_x)
+            new_y = np.where(rotate, anchor_y[idx] + rel_x * sin + rel_y * cos, old_y + step_y)
+
+            # Out-of-bounds coordinates snap back, each axis on its own
+            new_x = np.where((new_x < 0) | (new_x > viewport_width), old_x, new_x)
+            new_y = np.where((new_y < 0) | (new_y > viewport_height), old_y, new_y)
+
+            label_grid = Grid(x + width / 2, y - height / 2 + 2, cell_w, cell_h)
+            both = np.concatenate([idx, idx])
+            energies = _energy(
+                both, np.concatenate([old_x, new_x]), np.concatenate([old_y, new_y]),
+                x, y, width, height, anchor_x, anchor_y, label_grid, anchor_grid,
+            )
+            delta = energies[len(idx):] - energies[:len(idx)]
+            with np.errstate(over="ignore"):
+                accept = rng.random(len(idx)) < np.exp(-delta / temperature)
+            x[idx] = np.where(accept, new_x, old_x)
+            y[idx] = np.where(accept, new_y, old_y)
+
+        temperature -= 1.0 / sweeps
+
+    return x, y
+
+
+def layout_key(request: LayoutRequest) -> str:
+    payload = json.dumps(request.model_dump(), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def compute_layout(request: LayoutRequest, key: str) -> list[LayoutPosition]:
+    labels = request.labels
+    x, y = place_labels(
+        [label.x for label in labels],
+        [label.y for label in labels],
+        [label.width for label in labels],
+        [label.height for label in labels],
+        [label.anchor_x for label in labels],
+        [label.anchor_y for label in labels],
+        request.width,
+        request.height,
+        sweeps=request.sweeps,
+        seed=int(key[:16], 16),
+    )
+    return [
+        LayoutPosition(id=label.id, x=round(float(px), 2), y=round(float(py), 2))
+        for label, px, py in zip(labels, x, y)
+    ]
+
+
+class LayoutCache:
+    """LRU of computed layouts keyed by request hash."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, list[LayoutPosition]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[list[LayoutPosition]]:
+        positions = self._entries.get(key)
+        if positions is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return positions
+
+    def set(self, key: str, positions: list[LayoutPosition]) -> None:
+        if self.max_size <= 0:
+            return
+        self._entries[key] = positions
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+layout_cache = LayoutCache(settings.layout_cache_size)
+
+
+@router.post("", response_model=LayoutResponse)
+async def get_layout(request: LayoutRequest, user_id: str = Depends(require_user_id)):
+    key = layout_key(request)
+    positions = layout_cache.get(key)
+    cached = positions is not None
+    if not cached:
+        # CPU bound; keep the event loop free while it runs
+        positions = await asyncio.to_thread(compute_layout, request, key)
+        layout_cache.set(key, positions)
+    return LayoutResponse(key=key, cached=cached, labels=positions)
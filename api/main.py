@@ -1,25 +1,46 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
-from starlette.middleware.sessions import SessionMiddleware
+from fastapi.responses import Response
 from contextlib import asynccontextmanager
 import os
 
 from .config import get_settings
-from .database import init_db
-from .auth import router as auth_router
+from .migrations import ensure_schema
+from .database import engine, read_engine, pool_status
+from .revisions import etag_matches
+from .static_assets import StaticAssets, choose_encoding
+from .notifications import hub
+from .outbox import outbox_worker
+from .tombstones import tombstone_pruner
+from .auth import router as auth_router, user_cache
 from .events import router as events_router
 from .profile import router as profile_router
 from .friends import router as friends_router
+from .bootstrap import router as bootstrap_router
+from .layout import router as layout_router, layout_cache
+from .render import router as render_router, render_cache
+from .metrics import router as metrics_router, MetricsMiddleware, register_collected
+from .middleware import CanonicalHostMiddleware, ScopedSessionMiddleware
+from .rate_limit import rate_limiter
+from .singleflight import single_flight
 
 settings = get_settings()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    await ensure_schema()
+    static_assets.load()
+    await hub.start()
+    outbox_worker.start()
+    tombstone_pruner.start()
+    await rate_limiter.start()
     yield
+    await rate_limiter.stop()
+    await tombstone_pruner.stop()
+    await outbox_worker.stop()
+    await hub.stop()
 
 
 app = FastAPI(
@@ -29,42 +50,19 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-# Session middleware for OAuth
+# Session cookie for the OAuth state, needed only by the login round trip
 # Use https_only=True in production for secure cookies
 is_production = settings.frontend_url.startswith("https")
 app.add_middleware(
-    SessionMiddleware,
+    ScopedSessionMiddleware,
+    paths=("/auth/google", "/auth/callback"),
     secret_key=settings.jwt_secret,
     https_only=is_production,
     same_site="lax",
 )
 
-
-# Redirect HTTP to HTTPS and www to non-www in production
-@app.middleware("http")
-async def https_and_www_redirect(request: Request, call_next):
-    if is_production:
-        host = request.headers.get("host", "")
-        forwarded_proto = request.headers.get("x-forwarded-proto", "https")
-
-        # Redirect www to non-www
-        if host.startswith("www."):
-            new_host = host[4:]  # Remove "www."
-            url = request.url.replace(scheme="https", netloc=new_host)
-            return RedirectResponse(url=str(url), status_code=301)
-
-        # Redirect HTTP to HTTPS
-        if forwarded_proto == "http":
-            url = request.url.replace(scheme="https")
-            return RedirectResponse(url=str(url), status_code=301)
-
-    response = await call_next(request)
-
-    # Add HSTS header to tell browsers to always use HTTPS
-    if is_production:
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-
-    return response
+# Redirect HTTP to HTTPS and www to non-www in production, with HSTS
+app.add_middleware(CanonicalHostMiddleware, enabled=is_production)
 
 # CORS
 app.add_middleware(
@@ -75,31 +73,86 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the timings include the other middleware
+app.add_middleware(MetricsMiddleware, server_timing=settings.server_timing)
+
 # Routers
 app.include_router(auth_router)
 app.include_router(events_router)
 app.include_router(profile_router)
 app.include_router(friends_router)
+app.include_router(bootstrap_router)
+app.include_router(layout_router)
+app.include_router(render_router)
+app.include_router(metrics_router)
+
+
+def _cache_stat(*fields: str):
+    caches = {"user": user_cache, "layout": layout_cache, "render": render_cache}
+
+    def collect():
+        return {
+            (name,): sum(cache.stats().get(field, 0) for field in fields)
+            for name, cache in caches.items()
+        }
+    return collect
+
+
+register_collected("cache_entries", "Entries held by each in-process cache.", ("cache",), _cache_stat("size"))
+register_collected(
+    "cache_hits_total", "Cache lookups that hit.", ("cache",),
+    _cache_stat("hits", "memory_hits", "disk_hits"), kind="counter",
+)
+register_collected(
+    "cache_misses_total", "Cache lookups that missed.", ("cache",), _cache_stat("misses"), kind="counter",
+)
+register_collected(
+    "singleflight_coalesced_total", "Reads that shared an identical request's in-flight result.", ("route",),
+    lambda: {(route,): count for route, count in single_flight.coalesced.items()}, kind="counter",
+)
 
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    pools = {"primary": pool_status(engine)}
+    if read_engine is not engine:
+        pools["replica"] = pool_status(read_engine)
+    return {
+        "status": "healthy",
+        "pools": pools,
+        "user_cache": user_cache.stats(),
+        "layout_cache": layout_cache.stats(),
+        "render_cache": render_cache.stats(),
+        "single_flight": single_flight.stats(),
+    }
+
+
+# Static files are held in memory; see api/static_assets.py and build_assets.py
+static_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+static_assets = StaticAssets(static_dir, os.path.join(static_dir, "dist"))
+
+
+def _asset_response(request: Request, path: str) -> Response:
+    asset, cache_control = static_assets.lookup(path)
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""), asset.bodies)
+    etag = asset.etag(encoding)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
 
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
 
-# Serve static files in development
-static_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "")
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(asset.bodies[encoding], media_type=asset.content_type, headers=headers)
 
 
 @app.get("/")
-async def serve_index():
-    return FileResponse(os.path.join(static_dir, "index.html"))
+async def serve_index(request: Request):
+    return _asset_response(request, "/index.html")
 
 
 @app.get("/{filename:path}")
-async def serve_static(filename: str):
-    file_path = os.path.join(static_dir, filename)
-    if os.path.isfile(file_path):
-        return FileResponse(file_path)
-    # Fallback to index.html for SPA routing
-    return FileResponse(os.path.join(static_dir, "index.html"))
+async def serve_static(filename: str, request: Request):
+    # Unknown paths fall back to index.html for SPA routing
+    return _asset_response(request, f"/{filename}")
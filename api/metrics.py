@@ -0,0 +1,277 @@
+"""Request timing, SQL statement accounting and a Prometheus /metrics endpoint.
+
+MetricsMiddleware times every request by route template. SQLAlchemy cursor
+hooks attribute each statement and its duration to the request that ran it
+(through a context variable, so bootstrap's concurrent loaders count toward
+their request), and log statements slower than `slow_query_ms`. With
+`server_timing` on, responses carry the DB time and statement count so far
+in a Server-Timing header.
+
+Metrics are per process; scrape every worker.
+"""
+import bisect
+import contextvars
+import hmac
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+from .config import get_settings
+from .database import engine, read_engine, pool_status
+
+router = APIRouter(tags=["metrics"])
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+# Longest statement text written to the slow query log
+SLOW_QUERY_LOG_CHARS = 1000
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(total)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Collected:
+    """Read from a callback at scrape time; the callback returns {label values: value}."""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], collect: Callable[[], dict], kind: str):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+        self.kind = kind
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time to handle a request, by route template.",
+    LATENCY_BUCKETS, ("method", "route", "status"),
+))
+request_statements = registry.register(Histogram(
+    "http_request_db_statements", "SQL statements run per request.",
+    STATEMENT_BUCKETS, ("method", "route"),
+))
+request_db_time = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per request.",
+    LATENCY_BUCKETS, ("method", "route"),
+))
+statement_duration = registry.register(Histogram(
+    "db_statement_duration_seconds", "Duration of each SQL statement.", LATENCY_BUCKETS,
+))
+slow_statements = registry.register(Counter(
+    "db_slow_statements_total", "SQL statements slower than the slow query threshold.",
+))
+
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    db_seconds: float = 0.0
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Statement count and DB time of the request being handled, if any."""
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_start"].pop()
+    statement_duration.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+    if elapsed * 1000 >= settings.slow_query_ms:
+        slow_statements.inc()
+        logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:SLOW_QUERY_LOG_CHARS])
+
+
+def _handle_error(exception_context):
+    # Drop the start time of a statement that failed, so the stack stays aligned
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("metrics_start"):
+        conn.info["metrics_start"].pop()
+
+
+for _engine in {engine, read_engine}:
+    event.listen(_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(_engine.sync_engine, "handle_error", _handle_error)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Records latency and SQL accounting per route; optionally adds Server-Timing."""
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    # Only what ran before the headers; streamed bodies may query more
+                    app_ms = (time.perf_counter() - start) * 1000
+                    value = (
+                        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.statements} queries", '
+                        f"app;dur={app_ms:.1f}"
+                    )
+                    message = {**message, "headers": list(message.get("headers", [])) + [
+                        (b"server-timing", value.encode()),
+                    ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            method, route = scope["method"], _route_template(scope)
+            request_duration.observe(time.perf_counter() - start, method, route, status)
+            request_statements.observe(stats.statements, method, route)
+            request_db_time.observe(stats.db_seconds, method, route)
+
+
+def register_collected(
+    name: str, help: str, labels: tuple[str, ...], collect: Callable[[], dict], kind: str = "gauge"
+) -> None:
+    """Expose values owned elsewhere (pools, caches), read at scrape time."""
+    registry.register(Collected(name, help, labels, collect, kind))
+
+
+def _pool_gauge(field: str) -> Callable[[], dict]:
+    def collect():
+        pools = {"primary": pool_status(engine)}
+        if read_engine is not engine:
+            pools["replica"] = pool_status(read_engine)
+        return {(name,): status[field] for name, status in pools.items() if field in status}
+    return collect
+
+
+register_collected("db_pool_checked_out", "Connections in use.", ("pool",), _pool_gauge("checked_out"))
+register_collected("db_pool_saturation", "Share of pool capacity in use.", ("pool",), _pool_gauge("saturation"))
+register_collected("db_pool_wait_ms", "Recent average wait for a connection.", ("pool",), _pool_gauge("wait_ms"))
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Prometheus text exposition; needs `Authorization: Bearer <metrics_token>`.
+
+    Without a configured token the endpoint doesn't exist: traffic, pool and
+    cache figures are not for the public.
+    """
+    if not settings.metrics_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {settings.metrics_token}"
+    if not hmac.compare_digest(request.headers.get("authorization", "").encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
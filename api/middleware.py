@@ -0,0 +1,72 @@
+"""Pure ASGI middleware for the HTTPS/host redirect and the OAuth session.
+
+Both used to wrap every request: the redirect as an @app.middleware("http")
+function, which runs each response (static files included) through an extra
+task and memory stream, and SessionMiddleware, which parsed and re-signed the
+session cookie on every call. Now the redirect works on the raw scope and
+headers, and only the OAuth routes go through the session middleware.
+"""
+from urllib.parse import quote
+
+from starlette.middleware.sessions import SessionMiddleware
+
+HSTS_HEADER = (b"strict-transport-security", b"max-age=31536000; includeSubDomains")
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+class CanonicalHostMiddleware:
+    """Redirect www to the bare host and HTTP to HTTPS, and send HSTS.
+
+    Only active in production, where TLS ends at the proxy and the original
+    scheme arrives in X-Forwarded-Proto.
+    """
+
+    def __init__(self, app, enabled: bool = True):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            return await self.app(scope, receive, send)
+
+        host = _header(scope, b"host")
+        forwarded_proto = _header(scope, b"x-forwarded-proto") or "https"
+        if host.startswith("www.") or forwarded_proto == "http":
+            path = scope.get("raw_path") or quote(scope.get("root_path", "") + scope["path"]).encode()
+            location = b"https://" + host.removeprefix("www.").encode("latin-1") + path
+            if scope.get("query_string"):
+                location += b"?" + scope["query_string"]
+            await send({
+                "type": "http.response.start",
+                "status": 301,
+                "headers": [(b"location", location), (b"content-length", b"0")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_hsts(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [HSTS_HEADER]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_hsts)
+
+
+class ScopedSessionMiddleware:
+    """SessionMiddleware for the listed paths only; other requests skip the cookie entirely."""
+
+    def __init__(self, app, paths: tuple[str, ...], **session_options):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.session_app = SessionMiddleware(app, **session_options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            return await self.session_app(scope, receive, send)
+        await self.app(scope, receive, send)
@@ -0,0 +1,343 @@
+"""Versioned schema migrations.
+
+Applied versions are recorded in the `schema_migrations` table. At startup
+`ensure_schema` only reads the current version; pending migrations run in
+order while holding a Postgres advisory lock, so workers booting at the same
+time don't race. A database with no tables is created straight from the
+models and stamped with the latest version.
+
+Add new migrations to the end of MIGRATIONS with the next version number.
+Steps are SQL strings or async callables taking the connection. Callables
+that backfill large tables should commit in bounded chunks (see
+`backfill_in_chunks`).
+
+Run from the command line with `python -m api.migrations` (or `--status`).
+"""
+import asyncio
+import sys
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional, Union
+
+from sqlalchemy import text, inspect
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .database import Base, engine
+from . import models  # noqa: F401  (registers the tables on Base.metadata)
+
+# Arbitrary constant identifying this app's migration lock
+ADVISORY_LOCK_KEY = 7_242_015
+BACKFILL_CHUNK_SIZE = 1000
+
+Step = Union[str, Callable[[AsyncConnection], Awaitable[None]]]
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    steps: list[Step] = field(default_factory=list)
+
+
+async def backfill_in_chunks(conn: AsyncConnection, sql: str, chunk_size: int = BACKFILL_CHUNK_SIZE) -> int:
+    """Run an UPDATE repeatedly, committing after each chunk, until it touches no rows.
+
+    `sql` must limit itself to `:chunk_size` rows per run and stop matching
+    rows once they are backfilled.
+    """
+    total = 0
+    while True:
+        result = await conn.execute(text(sql), {"chunk_size": chunk_size})
+        await conn.commit()
+        if not result.rowcount:
+            return total
+        total += result.rowcount
+
+
+# Day of year on the leap-year ring; must match models.day_of_year
+_DOY_SQL = "(ARRAY[0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])[{month}] + {day}"
+
+
+async def _backfill_event_day_of_year(conn: AsyncConnection) -> None:
+    start = _DOY_SQL.format(month="month", day="day")
+    end = _DOY_SQL.format(month="COALESCE(end_month, month)", day="COALESCE(end_day, day)")
+    await backfill_in_chunks(conn, f"""
+        UPDATE events SET start_doy = {start}, end_doy = {end}
+        WHERE id IN (SELECT id FROM events WHERE start_doy IS NULL LIMIT :chunk_size)
+    """)
+
+
+async def _backfill_event_end_dates(conn: AsyncConnection) -> None:
+    await backfill_in_chunks(conn, """
+        UPDATE events SET end_month = COALESCE(end_month, month), end_day = COALESCE(end_day, day)
+        WHERE id IN (
+            SELECT id FROM events WHERE end_month IS NULL OR end_day IS NULL LIMIT :chunk_size
+        )
+    """)
+
+
+async def _backfill_friend_edges(conn: AsyncConnection) -> None:
+    # Keyset over friendships.id, so each chunk is an index range rather than a rescan
+    last_id = ""
+    while True:
+        result = await conn.execute(text("""
+            SELECT MAX(id) FROM (
+                SELECT id FROM friendships WHERE id > :last_id ORDER BY id LIMIT :chunk_size
+            ) chunk
+        """), {"last_id": last_id, "chunk_size": BACKFILL_CHUNK_SIZE})
+        upper = result.scalar()
+        if upper is None:
+            return
+        await conn.execute(text("""
+            INSERT INTO friend_edges (user_id, friend_id, friendship_id, status, created_at)
+            SELECT requester_id, addressee_id, id, status, created_at
+            FROM friendships WHERE id > :last_id AND id <= :upper
+            UNION ALL
+            SELECT addressee_id, requester_id, id, status, created_at
+            FROM friendships WHERE id > :last_id AND id <= :upper
+            ON CONFLICT DO NOTHING
+        """), {"last_id": last_id, "upper": upper})
+        await conn.commit()
+        last_id = upper
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "event end date, color and hidden columns", [
+        "ALTER TABLE events ADD COLUMN IF NOT EXISTS end_month INTEGER",
+        "ALTER TABLE events ADD COLUMN IF NOT EXISTS end_day INTEGER",
+        "ALTER TABLE events ADD COLUMN IF NOT EXISTS color VARCHAR(7) DEFAULT '#ff6360'",
+        "ALTER TABLE events ADD COLUMN IF NOT EXISTS hidden BOOLEAN DEFAULT FALSE",
+    ]),
+    # Set end = start for single-day events
+    Migration(2, "backfill event end dates", [_backfill_event_end_dates]),
+    Migration(3, "user birthday columns", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS birthday_month INTEGER",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS birthday_day INTEGER",
+    ]),
+    Migration(4, "friendships table", [
+        """
+        CREATE TABLE IF NOT EXISTS friendships (
+            id VARCHAR(36) PRIMARY KEY,
+            requester_id VARCHAR(36) NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            addressee_id VARCHAR(36) NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT unique_friendship_request UNIQUE(requester_id, addressee_id)
+        )
+        """,
+    ]),
+    Migration(5, "pending invitations table", [
+        """
+        CREATE TABLE IF NOT EXISTS pending_invitations (
+            id VARCHAR(36) PRIMARY KEY,
+            inviter_id VARCHAR(36) NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            invited_email VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT unique_pending_invitation UNIQUE(inviter_id, invited_email)
+        )
+        """,
+    ]),
+    Migration(6, "per-user data revision", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS revision INTEGER NOT NULL DEFAULT 0",
+    ]),
+    Migration(7, "email outbox table", [
+        """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id VARCHAR(36) PRIMARY KEY,
+            to_email VARCHAR(255) NOT NULL,
+            subject VARCHAR(500) NOT NULL,
+            html_content TEXT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+        """,
+    ]),
+    Migration(8, "indexes for hot queries", [
+        "CREATE INDEX IF NOT EXISTS ix_users_email_lower ON users (lower(email))",
+        "CREATE INDEX IF NOT EXISTS ix_events_user_month_day ON events (user_id, month, day)",
+        "CREATE INDEX IF NOT EXISTS ix_friendships_requester_status ON friendships (requester_id, status)",
+        "CREATE INDEX IF NOT EXISTS ix_friendships_addressee_status_created"
+        " ON friendships (addressee_id, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_pending_invitations_invited_email ON pending_invitations (invited_email)",
+        "CREATE INDEX IF NOT EXISTS ix_email_outbox_status_next_attempt ON email_outbox (status, next_attempt_at)",
+    ]),
+    Migration(9, "event day-of-year columns", [
+        "ALTER TABLE events ADD COLUMN IF NOT EXISTS start_doy INTEGER",
+        "ALTER TABLE events ADD COLUMN IF NOT EXISTS end_doy INTEGER",
+        _backfill_event_day_of_year,
+        "ALTER TABLE events ALTER COLUMN start_doy SET NOT NULL",
+        "ALTER TABLE events ALTER COLUMN end_doy SET NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_events_user_start_doy ON events (user_id, start_doy)",
+        "CREATE INDEX IF NOT EXISTS ix_events_user_end_doy ON events (user_id, end_doy)",
+        "CREATE INDEX IF NOT EXISTS ix_events_user_wrapping ON events (user_id) WHERE start_doy > end_doy",
+    ]),
+    # Extend the list indexes with the keyset pagination tie-breakers
+    Migration(10, "keyset pagination indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_events_user_month_day_id ON events (user_id, month, day, id)",
+        "DROP INDEX IF EXISTS ix_events_user_month_day",
+        "CREATE INDEX IF NOT EXISTS ix_friendships_requester_status_created"
+        " ON friendships (requester_id, status, created_at, id)",
+        "DROP INDEX IF EXISTS ix_friendships_requester_status",
+        "CREATE INDEX IF NOT EXISTS ix_friendships_addressee_status_created_id"
+        " ON friendships (addressee_id, status, created_at, id)",
+        "DROP INDEX IF EXISTS ix_friendships_addressee_status_created",
+    ]),
+    Migration(11, "rate limit buckets table", [
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key VARCHAR(255) PRIMARY KEY,
+            tokens FLOAT NOT NULL,
+            updated_at FLOAT NOT NULL
+        )
+        """,
+    ]),
+    # Existing events keep revision 0: clients start with a full load, then sync changes after it
+    Migration(12, "event revisions and tombstones", [
+        "ALTER TABLE events ADD COLUMN IF NOT EXISTS revision INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS ix_events_user_revision ON events (user_id, revision)",
+        """
+        CREATE TABLE IF NOT EXISTS event_tombstones (
+            event_id VARCHAR(36) PRIMARY KEY,
+            user_id VARCHAR(36) NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            revision INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_event_tombstones_user_revision ON event_tombstones (user_id, revision)",
+    ]),
+    Migration(13, "symmetric friend edges", [
+        """
+        CREATE TABLE IF NOT EXISTS friend_edges (
+            user_id VARCHAR(36) NOT NULL,
+            friend_id VARCHAR(36) NOT NULL,
+            friendship_id VARCHAR(36) NOT NULL REFERENCES friendships(id) ON DELETE CASCADE,
+            status VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP,
+            PRIMARY KEY (user_id, friend_id)
+        )
+        """,
+        _backfill_friend_edges,
+        "CREATE INDEX IF NOT EXISTS ix_friend_edges_user_status_created"
+        " ON friend_edges (user_id, status, created_at, friendship_id, friend_id)",
+        "CREATE INDEX IF NOT EXISTS ix_friend_edges_friendship ON friend_edges (friendship_id)",
+    ]),
+    # Feed tokens issued before this carry no version and count as version 0
+    Migration(14, "feed token versions", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS feed_token_version INTEGER NOT NULL DEFAULT 0",
+    ]),
+    Migration(15, "share token versions", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS share_token_version INTEGER NOT NULL DEFAULT 0",
+    ]),
+    Migration(16, "tombstone pruning by age", [
+        "CREATE INDEX IF NOT EXISTS ix_event_tombstones_deleted_at ON event_tombstones (deleted_at)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def _current_version(conn: AsyncConnection) -> Optional[int]:
+    """Latest applied version, or None if the version table doesn't exist yet."""
+    has_table = await conn.run_sync(
+        lambda sync_conn: inspect(sync_conn).has_table("schema_migrations")
+    )
+    if not has_table:
+        return None
+    result = await conn.execute(text("SELECT MAX(version) FROM schema_migrations"))
+    return result.scalar() or 0
+
+
+async def _stamp(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+        {"version": migration.version, "name": migration.name},
+    )
+
+
+async def _migrate_locked(conn: AsyncConnection) -> list[Migration]:
+    await conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+    await conn.commit()
+
+    # Re-read under the lock: another worker may have finished first
+    current = await _current_version(conn) or 0
+    pending = [m for m in MIGRATIONS if m.version > current]
+    if not pending:
+        return []
+
+    has_users = await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table("users"))
+    if current == 0 and not has_users:
+        # Empty database: build the current schema directly and stamp every version
+        await conn.run_sync(Base.metadata.create_all)
+        for migration in pending:
+            await _stamp(conn, migration)
+        await conn.commit()
+        return pending
+
+    for migration in pending:
+        print(f"Applying migration {migration.version}: {migration.name}")
+        for step in migration.steps:
+            if isinstance(step, str):
+                await conn.execute(text(step))
+            else:
+                await step(conn)
+        await _stamp(conn, migration)
+        await conn.commit()
+    return pending
+
+
+async def migrate(db_engine: AsyncEngine = engine) -> list[Migration]:
+    """Apply all pending migrations and return the ones that ran."""
+    async with db_engine.connect() as conn:
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            await conn.commit()
+        try:
+            return await _migrate_locked(conn)
+        finally:
+            # Discard a half-applied step so the unlock can run
+            await conn.rollback()
+            if is_postgres:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                await conn.commit()
+
+
+async def ensure_schema(db_engine: AsyncEngine = engine) -> None:
+    """Startup check: a single version lookup, migrating only if something is pending."""
+    async with db_engine.connect() as conn:
+        current = await _current_version(conn)
+    if current != LATEST_VERSION:
+        await migrate(db_engine)
+
+
+async def _main(argv: list[str]) -> int:
+    try:
+        if "--status" in argv:
+            async with engine.connect() as conn:
+                current = await _current_version(conn)
+            print(f"Schema version: {current if current is not None else 'none'} (latest {LATEST_VERSION})")
+            return 0 if current == LATEST_VERSION else 1
+
+        applied = await migrate()
+        print(f"Applied {len(applied)} migration(s); schema is at version {LATEST_VERSION}.")
+        return 0
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, UniqueConstraint, Boolean
+from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, Text, UniqueConstraint, Boolean, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import case, func
 import uuid
+from datetime import datetime
 
 from .database import Base
 
@@ -10,6 +11,35 @@ def generate_uuid():
     return str(uuid.uuid4())
 
 
+# Days before each month in a leap year, so Feb 29 has its own day of year
+_DAYS_BEFORE_MONTH = [0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335]
+
+
+def day_of_year(month: int, day: int) -> int:
+    """1-366 position of a month/day on the (leap-year) calendar ring."""
+    return _DAYS_BEFORE_MONTH[month - 1] + day
+
+
+def day_of_year_expr(month, day):
+    """day_of_year for values that may be SQL expressions, e.g. a row's current month in an UPDATE."""
+    if isinstance(month, int) and isinstance(day, int):
+        return day_of_year(month, day)
+    offsets = {m: before for m, before in enumerate(_DAYS_BEFORE_MONTH, start=1)}
+    return case(offsets, value=month) + day
+
+
+def _start_doy_default(context):
+    params = context.get_current_parameters()
+    return day_of_year(params["month"], params["day"])
+
+
+def _end_doy_default(context):
+    params = context.get_current_parameters()
+    return day_of_year(
+        params.get("end_month") or params["month"], params.get("end_day") or params["day"]
+    )
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -24,6 +54,13 @@ class User(Base):
     birthday_month = Column(Integer, nullable=True)  # 1-12
     birthday_day = Column(Integer, nullable=True)    # 1-31
 
+    # Bumped on every write visible to this user; used as the ETag for reads
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    # Embedded in feed tokens; bumping it revokes every feed URL handed out so far
+    feed_token_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Likewise for the public links to the rendered ring
+    share_token_version = Column(Integer, nullable=False, default=0, server_default="0")
+
     events = relationship("Event", back_populates="user", cascade="all, delete-orphan")
 
     # Friendship relationships (for future mutual birthday sharing)
@@ -40,6 +77,14 @@ class User(Base):
         cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        # Friend requests look users up by case-insensitive email
+        Index("ix_users_email_lower", func.lower(email)),
+    )
+
+
+DEFAULT_EVENT_COLOR = "#ff6360"
+
 
 class Event(Base):
     __tablename__ = "events"
@@ -50,14 +95,49 @@ class Event(Base):
     day = Column(Integer, nullable=False)
     end_month = Column(Integer, nullable=True)  # For multi-day events
     end_day = Column(Integer, nullable=True)    # For multi-day events
+    # Day-of-year of start/end, for range queries; end < start means the event wraps past Dec 31
+    start_doy = Column(Integer, nullable=False, default=_start_doy_default)
+    end_doy = Column(Integer, nullable=False, default=_end_doy_default)
     title = Column(String(500), nullable=False)
-    color = Column(String(7), nullable=True, default="#ff6360")  # Hex color
+    color = Column(String(7), nullable=True, default=DEFAULT_EVENT_COLOR)  # Hex color
     hidden = Column(Boolean, nullable=False, default=False)  # Hide event text/line
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # The owner's users.revision as of the last write, for GET /api/events/changes
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="events")
 
+    __table_args__ = (
+        # A user's events, already in calendar order
+        Index("ix_events_user_month_day_id", "user_id", "month", "day", "id"),
+        Index("ix_events_user_start_doy", "user_id", "start_doy"),
+        Index("ix_events_user_end_doy", "user_id", "end_doy"),
+        Index("ix_events_user_revision", "user_id", "revision"),
+        # Few events wrap past Dec 31, so they get a small partial index of their own
+        Index(
+            "ix_events_user_wrapping",
+            "user_id",
+            postgresql_where=start_doy > end_doy,
+            sqlite_where=start_doy > end_doy,
+        ),
+    )
+
+
+class EventTombstone(Base):
+    """A deleted event, kept for a while so GET /api/events/changes can report the delete"""
+    __tablename__ = "event_tombstones"
+
+    event_id = Column(String(36), primary_key=True)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    revision = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_event_tombstones_user_revision", "user_id", "revision"),
+        Index("ix_event_tombstones_deleted_at", "deleted_at"),
+    )
+
 
 class Friendship(Base):
     """Mutual friend connection for birthday sharing (future feature)"""
@@ -75,6 +155,29 @@ class Friendship(Base):
 
     __table_args__ = (
         UniqueConstraint('requester_id', 'addressee_id', name='unique_friendship_request'),
+        # Both also serve keyset pages ordered by (created_at, id)
+        Index("ix_friendships_requester_status_created", "requester_id", "status", "created_at", "id"),
+        Index("ix_friendships_addressee_status_created_id", "addressee_id", "status", "created_at", "id"),
+    )
+
+
+class FriendEdge(Base):
+    """One direction of a friendship; see api/friend_graph.py"""
+    __tablename__ = "friend_edges"
+
+    # No foreign keys to users: the edge goes with its friendship, which goes with either user
+    user_id = Column(String(36), primary_key=True)
+    friend_id = Column(String(36), primary_key=True)
+    friendship_id = Column(String(36), ForeignKey("friendships.id", ondelete="CASCADE"), nullable=False)
+    # Copies of the friendship's, kept in step by api/friend_graph.py
+    status = Column(String(20), nullable=False)
+    created_at = Column(DateTime)
+
+    __table_args__ = (
+        # A user's friends in keyset order, and the revision fan-out; covers friend_id for index-only scans
+        Index("ix_friend_edges_user_status_created", "user_id", "status", "created_at", "friendship_id", "friend_id"),
+        # The cascade from friendships
+        Index("ix_friend_edges_friendship", "friendship_id"),
     )
 
 
@@ -91,4 +194,36 @@ class PendingInvitation(Base):
 
     __table_args__ = (
         UniqueConstraint('inviter_id', 'invited_email', name='unique_pending_invitation'),
+        Index("ix_pending_invitations_invited_email", "invited_email"),
     )
+
+
+class EmailOutbox(Base):
+    """Outbound emails waiting for (or retrying) delivery by the outbox worker"""
+    __tablename__ = "email_outbox"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    to_email = Column(String(255), nullable=False)
+    subject = Column(String(500), nullable=False)
+    html_content = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # Also used as a lease: claimed rows are pushed forward so a crashed worker's batch is retried
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+
+class RateLimitBucket(Base):
+    """Token bucket state shared by all workers (the postgres rate limit backend)"""
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String(255), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Epoch seconds on the database clock, so workers' clocks don't matter
+    updated_at = Column(Float, nullable=False)
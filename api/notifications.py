@@ -0,0 +1,216 @@
+"""In-process pub/sub hub for pushing friend notifications to open clients.
+
+Each connected client holds a queue subscribed to its user id. Publishing goes
+through a backend so that, with several workers, a message published in one
+process reaches subscribers connected to another:
+
+- LocalBackend delivers directly in-process (single worker, dev, tests).
+- PostgresBackend fans out through LISTEN/NOTIFY on the app database.
+"""
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+Deliver = Callable[[str, dict], None]
+
+# Messages queued per connection before the oldest are dropped
+QUEUE_SIZE = 32
+
+
+class LocalBackend:
+    """Delivers published messages to subscribers in this process only."""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+    async def publish(self, user_id: str, message: dict) -> None:
+        if self._deliver:
+            self._deliver(user_id, message)
+
+
+class PostgresBackend:
+    """Fans messages out to every worker through Postgres LISTEN/NOTIFY.
+
+    The LISTEN connection is watched: when it closes, or stops answering the
+    periodic health check, it is replaced (with backoff while the database is
+    unreachable). Notifications sent while it is down are not delivered here.
+    """
+
+    CHANNEL = "circle_cal_notifications"
+    # Seconds between health checks of the LISTEN connection, and how long one may take
+    HEALTH_CHECK_INTERVAL = 30.0
+    HEALTH_CHECK_TIMEOUT = 5.0
+    # Reconnect delays double from the first to the last, in seconds
+    RECONNECT_MIN_DELAY = 0.5
+    RECONNECT_MAX_DELAY = 30.0
+
+    def __init__(self, dsn: str):
+        # asyncpg wants a plain postgresql:// DSN, not the SQLAlchemy dialect URL
+        self._dsn = dsn.replace("postgresql+asyncpg://", "postgresql://", 1)
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._deliver: Optional[Deliver] = None
+        self._lost = asyncio.Event()
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+        self._conn = await self._connect()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watcher:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        if self._conn:
+            await self._close(self._conn)
+            self._conn = None
+        self._deliver = None
+
+    async def _connect(self):
+        import asyncpg
+
+        conn = await asyncpg.connect(self._dsn)
+        conn.add_termination_listener(self._on_termination)
+        await conn.add_listener(self.CHANNEL, self._on_notify)
+        return conn
+
+    async def _close(self, conn) -> None:
+        conn.remove_termination_listener(self._on_termination)
+        try:
+            await asyncio.wait_for(conn.close(), self.HEALTH_CHECK_TIMEOUT)
+        except Exception:
+            conn.terminate()
+
+    def _on_termination(self, connection) -> None:
+        if connection is self._conn:
+            self._lost.set()
+
+    async def _healthy(self) -> bool:
+        if self._conn is None or self._conn.is_closed():
+            return False
+        try:
+            async with self._lock:
+                await asyncio.wait_for(self._conn.fetchval("SELECT 1"), self.HEALTH_CHECK_TIMEOUT)
+        except Exception:
+            return False
+        return True
+
+    async def _watch(self) -> None:
+        """Check the LISTEN connection now and then, replacing it when it is lost."""
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), self.HEALTH_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._lost.clear()
+            if await self._healthy():
+                continue
+            logger.warning("Notification LISTEN connection lost, reconnecting")
+            await self._reconnect()
+
+    async def _reconnect(self) -> None:
+        old, self._conn = self._conn, None
+        if old is not None:
+            await self._close(old)
+        delay = self.RECONNECT_MIN_DELAY
+        while True:
+            try:
+                conn = await self._connect()
+            except Exception as e:
+                logger.warning("Notification reconnect failed (%s), retrying in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
+                continue
+            self._conn = conn
+            logger.info("Notification LISTEN connection restored")
+            return
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            envelope = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed notification payload")
+            return
+        if self._deliver:
+            self._deliver(envelope["user_id"], envelope["message"])
+
+    async def publish(self, user_id: str, message: dict) -> None:
+        payload = json.dumps({"user_id": user_id, "message": message})
+        # A single asyncpg connection can't run concurrent operations
+        async with self._lock:
+            if self._conn is None or self._conn.is_closed():
+                raise ConnectionError("Notification connection is down, reconnecting")
+            try:
+                await self._conn.execute("SELECT pg_notify($1, $2)", self.CHANNEL, payload)
+            except Exception:
+                # Have the watcher check the connection now rather than at its next interval
+                self._lost.set()
+                raise
+
+
+class NotificationHub:
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    async def start(self) -> None:
+        await self.backend.start(self._deliver)
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: str):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(user_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def _deliver(self, user_id: str, message: dict) -> None:
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                # Slow client: drop the oldest message rather than block publishers
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def publish(self, user_ids, event_type: str, **data) -> None:
+        """Notify each of `user_ids`. Failures are logged, never raised to the caller."""
+        message = {"type": event_type, **data}
+        for user_id in set(user_ids):
+            try:
+                await self.backend.publish(user_id, message)
+            except Exception:
+                logger.exception("Failed to publish %s notification", event_type)
+
+
+def _create_backend():
+    if settings.notification_backend == "postgres":
+        return PostgresBackend(settings.database_url)
+    return LocalBackend()
+
+
+hub = NotificationHub(_create_backend())
@@ -0,0 +1,141 @@
+"""Background delivery of queued emails from the email_outbox table.
+
+Request handlers only insert outbox rows and call `outbox_worker.wake()` after
+committing. The worker claims due rows, groups recipients that share the same
+message into one transport call, and reschedules failures with exponential
+backoff. Claiming pushes `next_attempt_at` forward as a lease, so rows claimed
+by a worker that dies are picked up again once the lease runs out. On Postgres
+the claim uses SKIP LOCKED, so several app workers can share the outbox.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from .config import get_settings
+from .database import async_session
+from .email import EmailBatch, create_transport
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CLAIM_LIMIT = 500
+LEASE = timedelta(minutes=5)
+BASE_BACKOFF = timedelta(seconds=30)
+MAX_BACKOFF = timedelta(hours=6)
+
+
+def backoff_for(attempts: int) -> timedelta:
+    return min(BASE_BACKOFF * (2 ** max(attempts - 1, 0)), MAX_BACKOFF)
+
+
+class OutboxWorker:
+    def __init__(self, transport, poll_interval: float, batch_size: int, max_attempts: int):
+        self.transport = transport
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """Deliver newly committed rows now instead of at the next poll."""
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.deliver_due() == CLAIM_LIMIT:
+                    pass
+            except Exception:
+                logger.exception("Outbox delivery failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> list[EmailOutbox]:
+        now = datetime.utcnow()
+        async with async_session() as db:
+            result = await db.execute(
+                select(EmailOutbox)
+                .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(CLAIM_LIMIT)
+                .with_for_update(skip_locked=True)
+            )
+            messages = result.scalars().all()
+            for message in messages:
+                message.attempts += 1
+                message.next_attempt_at = now + LEASE
+            await db.commit()
+            return messages
+
+    async def deliver_due(self) -> int:
+        """Send every due message once. Returns how many were claimed."""
+        messages = await self._claim()
+        if not messages:
+            return 0
+
+        groups: dict[tuple[str, str], list[EmailOutbox]] = {}
+        for message in messages:
+            groups.setdefault((message.subject, message.html_content), []).append(message)
+
+        sent_ids, failures = [], []
+        for (subject, html_content), group in groups.items():
+            for i in range(0, len(group), self.batch_size):
+                chunk = group[i:i + self.batch_size]
+                batch = EmailBatch(subject, html_content, [m.to_email for m in chunk])
+                try:
+                    await self.transport.send(batch)
+                    sent_ids.extend(m.id for m in chunk)
+                except Exception as e:
+                    logger.warning("Failed to send %d email(s): %s", len(chunk), e)
+                    failures.extend((m, str(e)) for m in chunk)
+
+        await self._record(sent_ids, failures)
+        return len(messages)
+
+    async def _record(self, sent_ids: list[str], failures: list[tuple[EmailOutbox, str]]) -> None:
+        now = datetime.utcnow()
+        async with async_session() as db:
+            if sent_ids:
+                await db.execute(
+                    update(EmailOutbox)
+                    .where(EmailOutbox.id.in_(sent_ids))
+                    .values(status="sent", sent_at=now, last_error=None)
+                )
+            for message, error in failures:
+                values = {"last_error": error[:1000]}
+                if message.attempts >= self.max_attempts:
+                    values["status"] = "failed"
+                else:
+                    values["next_attempt_at"] = now + backoff_for(message.attempts)
+                await db.execute(
+                    update(EmailOutbox).where(EmailOutbox.id == message.id).values(**values)
+                )
+            await db.commit()
+
+
+outbox_worker = OutboxWorker(
+    create_transport(),
+    poll_interval=settings.email_poll_interval_seconds,
+    batch_size=settings.email_batch_size,
+    max_attempts=settings.email_max_attempts,
+)
@@ -0,0 +1,72 @@
+"""Keyset pagination helpers for the list endpoints.
+
+A cursor is the sort key of the last row on a page, encoded as opaque
+URL-safe base64 JSON. The next page is read with a row-value comparison
+against it (`(month, day, id) > (...)`), so every page is an index range
+scan no matter how deep the client pages, and rows inserted or deleted
+between requests never shift the pages. The next cursor goes in the
+`X-Next-Cursor` header and the body stays a plain JSON array, encoded once
+so concurrent identical requests can share it (see api/singleflight.py).
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Callable, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from .serialization import dumps
+
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values: Any) -> str:
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    """Decode a cursor whose values have the given types; 400 if it doesn't fit."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        decoded = []
+        for value, kind in zip(values, types):
+            if kind is datetime:
+                decoded.append(datetime.fromisoformat(value))
+            elif isinstance(value, kind) and not isinstance(value, bool):
+                decoded.append(value)
+            else:
+                raise ValueError
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple(decoded)
+
+
+def split_page(rows: Sequence, limit: Optional[int], key: Callable[[Any], tuple]) -> tuple[Sequence, Optional[str]]:
+    """Trim rows fetched with LIMIT limit + 1 to one page and build the next cursor."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
+
+
+def encode_list(items: Sequence) -> bytes:
+    """Encode `items`, dicts already in response shape, as a JSON array."""
+    return dumps(list(items))
+
+
+def encoded_list_response(
+    body: bytes, next_cursor: Optional[str] = None, headers: Optional[dict] = None
+) -> Response:
+    """Send a JSON array already encoded by `encode_list`."""
+    headers = dict(headers or {})
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return Response(body, media_type="application/json", headers=headers)
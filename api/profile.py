@@ -1,18 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, update, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .database import get_db
 from .models import User
 from .schemas import UserUpdate, UserResponse
-from .auth import require_user
+from .auth import require_user_id, user_cache
+from .revisions import bump_revision_with_friends
+from .notifications import hub
 
 router = APIRouter(prefix="/api/profile", tags=["profile"])
 
+# The UserResponse fields
+USER_COLUMNS = (User.id, User.email, User.name, User.picture_url, User.birthday_month, User.birthday_day)
+
 
 @router.patch("", response_model=UserResponse)
 async def update_profile(
     profile_data: UserUpdate,
-    user: User = Depends(require_user),
+    user_id: str = Depends(require_user_id),
     db: AsyncSession = Depends(get_db),
 ):
     """Update the current user's profile (birthday, etc.)"""
@@ -29,12 +35,31 @@ async def update_profile(
 
     # Allow clearing birthday by setting both to None
     if profile_data.birthday_month is None or profile_data.birthday_day is None:
-        user.birthday_month = None
-        user.birthday_day = None
+        birthday = (None, None)
     else:
-        user.birthday_month = profile_data.birthday_month
-        user.birthday_day = profile_data.birthday_day
+        birthday = (profile_data.birthday_month, profile_data.birthday_day)
+
+    # Only matches when the birthday actually changes, so no-op saves write nothing
+    result = await db.execute(
+        update(User)
+        .where(
+            User.id == user_id,
+            or_(User.birthday_month.is_distinct_from(birthday[0]), User.birthday_day.is_distinct_from(birthday[1])),
+        )
+        .values(birthday_month=birthday[0], birthday_day=birthday[1])
+        .returning(*USER_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    user = result.one_or_none()
+    if user is None:
+        result = await db.execute(select(*USER_COLUMNS).where(User.id == user_id))
+        user = result.one_or_none()
+        if user is None:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return user._asdict()
 
+    friend_ids = await bump_revision_with_friends(db, user_id)
     await db.commit()
-    await db.refresh(user)
-    return user
+    user_cache.invalidate_user(user_id)
+    await hub.publish(friend_ids, "birthday_changed", friend_id=user_id)
+    return user._asdict()
@@ -0,0 +1,242 @@
+"""Query-plan regression check for the router queries.
+
+Builds the schema in a scratch Postgres schema, seeds it, drives every router
+through the ASGI app and records each SELECT/UPDATE/DELETE the app sends. Each
+recorded statement is then EXPLAINed with sequential scans disabled: if the
+planner still picks a Seq Scan, no index can serve that query and the check
+fails.
+
+    DATABASE_URL=postgresql+asyncpg://... python -m api.query_plans
+
+Only the scratch schema is written to; it is dropped afterwards. The test
+suite runs the same check (tests/test_query_plans.py) when DATABASE_URL points
+at Postgres.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+
+import httpx
+from sqlalchemy import event, select, text
+
+from .database import Base, engine, async_session
+from .models import User, Event, Friendship, PendingInvitation, EmailOutbox
+from .friend_graph import add_edges
+from .auth import create_token
+from .tombstones import prune_expired
+
+SCHEMA = f"plan_check_{os.getpid()}"
+SEED_USERS = 200
+SEED_EVENTS_PER_USER = 20
+
+captured: list[tuple[str, tuple]] = []
+capturing = False
+
+
+def _use_scratch_schema(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET search_path TO {SCHEMA}")
+    cursor.close()
+    # SET is transactional; commit so the pool's reset-on-return rollback keeps it
+    dbapi_connection.commit()
+
+
+def _capture(conn, cursor, statement, parameters, context, executemany):
+    if capturing and not executemany:
+        if statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE"):
+            captured.append((statement, tuple(parameters or ())))
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+async def _seed() -> list[str]:
+    rng = random.Random(42)
+    async with async_session() as db:
+        users = [
+            User(google_id=f"g{i}", email=f"User{i}@Example.com", name=f"User {i}")
+            for i in range(SEED_USERS)
+        ]
+        db.add_all(users)
+        await db.flush()
+        ids = [u.id for u in users]
+        for user_id in ids:
+            for _ in range(SEED_EVENTS_PER_USER):
+                month, day = rng.randint(1, 12), rng.randint(1, 28)
+                # Roughly one in ten events spans a few days, some wrapping past Dec 31
+                end_month, end_day = month, day
+                if rng.random() < 0.1:
+                    end_month, end_day = month % 12 + 1, rng.randint(1, 28)
+                db.add(Event(user_id=user_id, month=month, day=day, end_month=end_month,
+                             end_day=end_day, title="seed"))
+        friendships = []
+        for i, user_id in enumerate(ids):
+            for j in rng.sample(range(SEED_USERS), 5):
+                if j > i:
+                    friendships.append(Friendship(requester_id=user_id, addressee_id=ids[j],
+                                                  status=rng.choice(["accepted", "pending"])))
+            db.add(PendingInvitation(inviter_id=user_id, invited_email=f"invitee{i}@example.com"))
+        db.add_all(friendships)
+        await db.flush()
+        await add_edges(db, *(f.id for f in friendships))
+        await db.commit()
+    return ids
+
+
+async def _scenarios(app, user_ids: list[str]) -> None:
+    """Exercise every router endpoint that touches the database."""
+    me, other, stranger = user_ids[0], user_ids[1], user_ids[2]
+
+    def client(user_id):
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://plan-check",
+            cookies={"auth_token": create_token(user_id)},
+        )
+
+    async with client(me) as c, client(other) as o, client(stranger) as s:
+        await c.get("/auth/me")
+        await c.get("/api/bootstrap")
+        await c.get("/api/events")
+        await c.get("/api/events", params={"from": "03-01", "to": "03-31"})
+        await c.get("/api/events", params={"from": "12-20", "to": "01-10"})
+        await c.get("/api/friends")
+        await c.get("/api/friends/requests/pending")
+        for endpoint in ("/api/events", "/api/friends", "/api/friends/requests/pending"):
+            page = await c.get(endpoint, params={"limit": 2})
+            if "x-next-cursor" in page.headers:
+                await c.get(endpoint, params={"limit": 2, "cursor": page.headers["x-next-cursor"]})
+        await c.get("/api/render/ring.svg")
+        await c.get("/api/events.ics")
+        feed_url = (await c.post("/api/events/feed/rotate")).json()["url"]
+        await s.get("/api/events.ics", params={"token": feed_url.split("token=", 1)[1]})
+        share_url = (await c.post("/api/render/share/rotate")).json()["svg_url"]
+        await s.get("/api/render/ring.svg", params={"token": share_url.split("token=", 1)[1]})
+
+        cursor = (await c.get("/api/events/changes")).json()["cursor"]
+        created = (await c.post("/api/events", json={"month": 3, "day": 4, "title": "x"})).json()
+        await c.put(f"/api/events/{created['id']}", json={"title": "y"})
+        await c.post("/api/events/batch", json={"operations": [
+            {"op": "create", "data": {"month": 5, "day": 6, "title": "z"}},
+            {"op": "update", "id": created["id"], "data": {"color": "#000000"}},
+        ]})
+        await c.delete(f"/api/events/{created['id']}")
+        await c.post("/api/events/import", content=(
+            b"BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\nDTSTART;VALUE=DATE:20240704\r\n"
+            b"SUMMARY:imported\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n"
+        ))
+        await c.get("/api/events/changes", params={"since": cursor})
+
+        await c.patch("/api/profile", json={"birthday_month": 6, "birthday_day": 7})
+
+        await s.post("/api/friends/request", json={"email": "user0@example.com"})
+        await c.post("/api/friends/request", json={"email": "someone-new@example.com"})
+        await s.post("/api/friends/request/batch", json={"emails": [
+            "user0@example.com", "User1@example.com", "user3@example.com", "someone-new@example.com",
+            "another-new@example.com",
+        ]})
+        pending = (await c.get("/api/friends/requests/pending")).json()
+        for request in pending[:1]:
+            await c.patch(f"/api/friends/request/{request['id']}", json={"accept": True})
+            await c.delete(f"/api/friends/{request['id']}")
+
+    # Paths that need OAuth or the background workers, issued directly
+    await prune_expired()
+    async with async_session() as db:
+        await db.execute(select(User).where(User.google_id == "g0"))
+        await db.execute(
+            select(PendingInvitation).where(PendingInvitation.invited_email == "invitee0@example.com")
+        )
+        await db.execute(
+            select(EmailOutbox)
+            .where(EmailOutbox.status == "pending")
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(10)
+        )
+
+
+async def seq_scans() -> tuple[int, list[tuple[str, list[str]]]]:
+    """The number of distinct statements checked, and (statement, tables) for each that scans sequentially.
+
+    The listeners that route connections to the scratch schema and record
+    statements are attached only while this runs, and the pool is emptied on
+    both sides so no connection carries the scratch search_path outside it.
+    """
+    global capturing
+    # Import late: the app module reads settings and wires routers on import
+    from .main import app
+
+    captured.clear()
+    await engine.dispose()
+    event.listen(engine.sync_engine, "connect", _use_scratch_schema)
+    event.listen(engine.sync_engine, "before_cursor_execute", _capture)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await conn.commit()
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            user_ids = await _seed()
+            async with engine.connect() as conn:
+                await conn.execute(text("ANALYZE"))
+                await conn.commit()
+
+            capturing = True
+            try:
+                await _scenarios(app, user_ids)
+            finally:
+                capturing = False
+
+            failures = []
+            seen = set()
+            async with engine.connect() as conn:
+                await conn.execute(text("SET enable_seqscan = off"))
+                for statement, parameters in captured:
+                    if statement in seen:
+                        continue
+                    seen.add(statement)
+                    result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                    plan = result.scalar()
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    tables = _seq_scans(plan[0]["Plan"])
+                    if tables:
+                        failures.append((statement, tables))
+                await conn.rollback()
+            return len(seen), failures
+        finally:
+            async with engine.connect() as conn:
+                await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+                await conn.commit()
+    finally:
+        await engine.dispose()
+        event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+        event.remove(engine.sync_engine, "connect", _use_scratch_schema)
+
+
+async def check() -> int:
+    if engine.dialect.name != "postgresql":
+        print("The query plan check needs a Postgres DATABASE_URL")
+        return 2
+    checked, failures = await seq_scans()
+    print(f"Checked {checked} distinct statements")
+    for statement, tables in failures:
+        print(f"\nSeq Scan on {', '.join(tables)}:\n  {' '.join(statement.split())}")
+    return 1 if failures else 0
+
+
+def main() -> None:
+    sys.exit(asyncio.run(check()))
+
+
+if __name__ == "__main__":
+    main()
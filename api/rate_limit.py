@@ -0,0 +1,267 @@
+"""Per-user token-bucket rate limiting and load shedding for the API routers.
+
+`admission` is a router dependency. Before any handler or DB session runs it:
+
+1. Sheds load: while recent connection checkouts have waited longer than
+   `shed_pool_wait_ms`, requests get 503 with a short Retry-After instead of
+   queueing for the pool and timing out anyway.
+2. Rate limits: every request takes a token from the user's bucket, and
+   expensive routes (friend requests send email, imports insert thousands of
+   rows) also from a bucket of their own. An empty bucket means 429 with
+   Retry-After set to when the next token arrives, and a rejected request
+   keeps no token from the other bucket.
+
+Buckets are keyed by user id, from the session cookie or the calendar feed
+token, and by client address for anything else. They live in a backend:
+
+- LocalBackend keeps them in process memory, so each worker enforces the
+  budget on its own (single worker, dev).
+- PostgresBackend keeps them in the rate_limit_buckets table, shared by every
+  worker, updating a bucket with one atomic statement on its own small
+  connection pool. If the database can't be reached it lets requests through.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request
+
+from .auth import FEED_SCOPE, SHARE_SCOPE, decode_token, user_cache, verify_token
+from .config import get_settings
+from .database import pool_wait_seconds
+from .metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Buckets kept by the local backend; the least recently used are dropped (and so refilled)
+LOCAL_MAX_BUCKETS = 100_000
+# Idle shared buckets older than this are deleted; a full bucket carries no state
+BUCKET_RETENTION_SECONDS = 24 * 3600
+PRUNE_INTERVAL_SECONDS = 3600
+SHED_RETRY_AFTER_SECONDS = 2
+
+rate_limited = registry.register(Counter(
+    "rate_limited_total", "Requests rejected with 429 by the rate limiter.", ("route",),
+))
+shed = registry.register(Counter(
+    "load_shed_total", "Requests rejected with 503 while the connection pool was congested.", ("route",),
+))
+
+
+@dataclass(frozen=True)
+class Budget:
+    """Up to `burst` requests at once, refilled at `per_minute`."""
+    burst: float
+    per_minute: float
+
+    @property
+    def per_second(self) -> float:
+        return self.per_minute / 60
+
+
+# Routes with budgets of their own, on top of the per-user budget
+ROUTE_BUDGETS = {
+    # Each may look up a user, insert a row and send an email
+    "POST /api/friends/request": Budget(burst=10, per_minute=1),
+    # Hundreds of addresses per call
+    "POST /api/friends/request/batch": Budget(burst=3, per_minute=1),
+    "POST /api/events/import": Budget(burst=3, per_minute=1),
+    "POST /api/events/batch": Budget(burst=20, per_minute=30),
+    # CPU-bound annealing when the layout isn't cached
+    "POST /api/layout": Budget(burst=10, per_minute=10),
+}
+
+
+class LocalBackend:
+    """Token buckets in this process's memory."""
+
+    def __init__(self, max_buckets: int = LOCAL_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def take(self, key: str, budget: Budget) -> float:
+        """Take a token; returns 0 if one was available, else seconds until one will be."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (budget.burst, now))
+        tokens = min(budget.burst, tokens + (now - updated) * budget.per_second)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / budget.per_second
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return wait
+
+    async def refund(self, key: str, budget: Budget) -> None:
+        """Put back a token taken from `key` for a request that was rejected after all."""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            tokens, updated = bucket
+            self._buckets[key] = (min(budget.burst, tokens + 1), updated)
+
+
+class PostgresBackend:
+    """Token buckets in the rate_limit_buckets table, shared by all workers."""
+
+    # Refill and take in one statement; no row comes back when the bucket is empty
+    TAKE_SQL = """
+        INSERT INTO rate_limit_buckets AS b (key, tokens, updated_at)
+        VALUES ($1, $2 - 1, EXTRACT(EPOCH FROM clock_timestamp()))
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = LEAST($2, b.tokens + (EXTRACT(EPOCH FROM clock_timestamp()) - b.updated_at) * $3) - 1,
+            updated_at = EXTRACT(EPOCH FROM clock_timestamp())
+        WHERE LEAST($2, b.tokens + (EXTRACT(EPOCH FROM clock_timestamp()) - b.updated_at) * $3) >= 1
+        RETURNING tokens
+    """
+    DEFICIT_SQL = """
+        SELECT 1 - LEAST($2, tokens + (EXTRACT(EPOCH FROM clock_timestamp()) - updated_at) * $3)
+        FROM rate_limit_buckets WHERE key = $1
+    """
+    REFUND_SQL = "UPDATE rate_limit_buckets SET tokens = LEAST($2, tokens + 1) WHERE key = $1"
+    PRUNE_SQL = "DELETE FROM rate_limit_buckets WHERE updated_at < EXTRACT(EPOCH FROM clock_timestamp()) - $1"
+
+    def __init__(self, dsn: str, pool_size: int = 4):
+        # asyncpg wants a plain postgresql:// DSN, not the SQLAlchemy dialect URL
+        self._dsn = dsn.replace("postgresql+asyncpg://", "postgresql://", 1)
+        self._pool_size = pool_size
+        self._pool = None
+        self._pruned_at = 0.0
+
+    async def start(self) -> None:
+        import asyncpg
+
+        self._pool = await asyncpg.create_pool(self._dsn, min_size=1, max_size=self._pool_size)
+
+    async def stop(self) -> None:
+        if self._pool:
+            await self._pool.close()
+            self._pool = None
+
+    async def take(self, key: str, budget: Budget) -> float:
+        if self._pool is None:
+            return 0.0
+        try:
+            async with self._pool.acquire() as conn:
+                tokens = await conn.fetchval(self.TAKE_SQL, key, float(budget.burst), budget.per_second)
+                if tokens is not None:
+                    await self._maybe_prune(conn)
+                    return 0.0
+                deficit = await conn.fetchval(self.DEFICIT_SQL, key, float(budget.burst), budget.per_second)
+        except Exception:
+            # The limiter must not take the API down with it
+            logger.exception("Rate limit backend unavailable; allowing request")
+            return 0.0
+        return max(deficit or 0.0, 0.0) / budget.per_second
+
+    async def refund(self, key: str, budget: Budget) -> None:
+        if self._pool is None:
+            return
+        try:
+            async with self._pool.acquire() as conn:
+                await conn.execute(self.REFUND_SQL, key, float(budget.burst))
+        except Exception:
+            logger.exception("Rate limit backend unavailable; token not refunded")
+
+    async def _maybe_prune(self, conn) -> None:
+        now = time.monotonic()
+        if now - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+            self._pruned_at = now
+            await conn.execute(self.PRUNE_SQL, float(BUCKET_RETENTION_SECONDS))
+
+
+class RateLimiter:
+    def __init__(self, backend, user_budget: Budget, route_budgets: dict[str, Budget]):
+        self.backend = backend
+        self.user_budget = user_budget
+        self.route_budgets = route_budgets
+
+    async def start(self) -> None:
+        await self.backend.start()
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+
+    async def check(self, client: str, route: str) -> float:
+        """Seconds the client has to wait before `route` is allowed, 0 if it is now.
+
+        A rejected request consumes nothing: when the user bucket is empty the
+        token already taken from the route bucket is put back.
+        """
+        budget = self.route_budgets.get(route)
+        if budget is not None:
+            wait = await self.backend.take(f"{client}|{route}", budget)
+            if wait:
+                return wait
+        wait = await self.backend.take(client, self.user_budget)
+        if wait and budget is not None:
+            await self.backend.refund(f"{client}|{route}", budget)
+        return wait
+
+
+def _create_backend():
+    if settings.rate_limit_backend == "postgres":
+        return PostgresBackend(settings.database_url)
+    return LocalBackend()
+
+
+rate_limiter = RateLimiter(
+    _create_backend(),
+    Budget(burst=settings.rate_limit_burst, per_minute=settings.rate_limit_per_minute),
+    ROUTE_BUDGETS,
+)
+
+
+def _client_key(request: Request) -> str:
+    token = request.cookies.get("auth_token")
+    if token:
+        cached = user_cache.peek(token)
+        user_id = cached.id if cached else verify_token(token)
+        if user_id:
+            return f"user:{user_id}"
+    # Calendar apps and link crawlers fetch for many users from a few addresses
+    link_token = request.query_params.get("token")
+    if link_token:
+        # Signature only, for the bucket key; the route itself checks for revocation
+        payload = decode_token(link_token, scope=FEED_SCOPE) or decode_token(link_token, scope=SHARE_SCOPE)
+        if payload and payload.get("sub"):
+            return f"user:{payload['sub']}"
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+def _route_key(request: Request) -> str:
+    route = request.scope.get("route")
+    return f"{request.method} {getattr(route, 'path', request.url.path)}"
+
+
+async def admission(request: Request) -> None:
+    """Router dependency: shed load when the pool is congested, then apply the rate limits."""
+    route = _route_key(request)
+    if settings.shed_pool_wait_ms > 0 and pool_wait_seconds() * 1000 > settings.shed_pool_wait_ms:
+        shed.inc(route)
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, try again shortly",
+            headers={"Retry-After": str(SHED_RETRY_AFTER_SECONDS)},
+        )
+    if not settings.rate_limit_enabled:
+        return
+    wait = await rate_limiter.check(_client_key(request), route)
+    if wait:
+        rate_limited.inc(route)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
@@ -0,0 +1,444 @@
+"""Server-side rendering of a user's ring calendar as SVG or PNG.
+
+Draws the same ring app.js builds in the DOM (day segments, weekend shading,
+coloured event sub-segments, month ticks and labels) from the stored events
+and birthdays, for share previews and og:image. Geometry is computed for all
+days and sub-segments at once with NumPy. PNGs are rasterized directly on a
+polar pixel grid (2x supersampled) and encoded with zlib, so no imaging
+library is needed; they omit the month names.
+
+Rendered images are cached under a key that includes the user's data
+revision, so a repeat fetch is served from memory or disk without touching
+anything but the users row.
+
+The app fetches them with the session cookie. Share links and crawlers
+fetching og:image have none, so the ring routes also take a share token
+(GET /api/render/share), revocable like the calendar feed token.
+"""
+import asyncio
+import re
+import struct
+import zlib
+from dataclasses import dataclass
+from datetime import date
+from typing import Literal, Optional
+from xml.sax.saxutils import escape
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .auth import require_user_id, create_share_token, verify_share_token
+from .config import get_settings
+from .database import get_db, read_session_for
+from .events import load_events
+from .friends import load_friends
+from .models import User
+from .render_cache import RenderCache
+from .schemas import RenderShareResponse
+from .revisions import current_revision, etag_matches
+
+router = APIRouter(prefix="/api/render", tags=["render"])
+settings = get_settings()
+
+# Shared images may sit in link-preview and CDN caches for this long
+SHARE_MAX_AGE_SECONDS = 300
+
+render_cache = RenderCache(
+    settings.render_cache_dir,
+    memory_bytes=settings.render_cache_memory_mb * 1024 * 1024,
+    disk_bytes=settings.render_cache_disk_mb * 1024 * 1024,
+)
+
+# Ring geometry, in the same SVG units as app.js
+OUTER_RADIUS = 200
+INNER_RADIUS = 140
+MONTH_LABEL_RADIUS = OUTER_RADIUS + 20
+VIEW_RADIUS = 240
+# Events fill the outer 80% of a day segment
+EVENT_INNER_RADIUS = INNER_RADIUS + (OUTER_RADIUS - INNER_RADIUS) * 0.2
+TICK_INNER_RADIUS = INNER_RADIUS - 5
+TICK_OUTER_RADIUS = OUTER_RADIUS + 5
+TICK_WIDTH = 0.4
+SUPERSAMPLE = 2
+
+MONTHS = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+]
+DEFAULT_COLOR = "#ff6360"
+BIRTHDAY_COLOR = "#ff69b4"
+FRIEND_BIRTHDAY_COLOR = "#9c27b0"
+
+# From the :root and [data-theme="dark"] variables in style.css
+THEMES = {
+    "light": {"background": "#e4e4e4", "segment": "#ececec", "weekend": "#dcdcdc",
+              "border": "#c0c0c0", "text": "#4a4a4a"},
+    "dark": {"background": "#2a2a2a", "segment": "#363636", "weekend": "#303030",
+             "border": "#4a4a4a", "text": "#a0a0a0"},
+}
+TICK_COLOR = (0, 0, 0, 0.5)
+
+_HEX_COLOR = re.compile(r"^#(?:[0-9a-fA-F]{3}){1,2}$")
+
+
+@dataclass
+class Span:
+    """A run of days on the ring, 0-based day of year, end inclusive; may wrap."""
+    start: int
+    end: int
+    color: str
+    opacity: float
+
+
+def _rgb(color: str) -> tuple[int, int, int]:
+    value = color.lstrip("#")
+    if len(value) == 3:
+        value = "".join(c * 2 for c in value)
+    return int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16)
+
+
+def _safe_color(color) -> str:
+    return color if isinstance(color, str) and _HEX_COLOR.match(color) else DEFAULT_COLOR
+
+
+def _days_in_months(year: int) -> np.ndarray:
+    leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+    return np.array([31, 29 if leap else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def _day_index(year: int, month: int, day: int) -> int:
+    # Overflowing days (Feb 29 in a common year) roll into the next month, as in app.js
+    days = _days_in_months(year)
+    return (int(days[:month - 1].sum()) + day - 1) % int(days.sum())
+
+
+def collect_spans(year: int, events, birthday: tuple, friend_birthdays: list[tuple]) -> list[Span]:
+    """Ring spans in app.js stacking order: own birthday, events, friends' birthdays."""
+    total_days = int(_days_in_months(year).sum())
+    spans = []
+    if birthday[0] and birthday[1]:
+        doy = _day_index(year, *birthday)
+        spans.append(Span(doy, doy, BIRTHDAY_COLOR, 1.0))
+    for event in events:
+        start = _day_index(year, event["month"], event["day"])
+        end = _day_index(year, event["end_month"] or event["month"], event["end_day"] or event["day"])
+        length = (end - start) % total_days + 1
+        # Hidden events and events longer than four days are drawn faded
+        opacity = 0.25 if event["hidden"] else (0.4 if length > 4 else 1.0)
+        spans.append(Span(start, end, _safe_color(event["color"]), opacity))
+    for month, day in friend_birthdays:
+        doy = _day_index(year, month, day)
+        spans.append(Span(doy, doy, FRIEND_BIRTHDAY_COLOR, 1.0))
+    return spans
+
+
+def _layers(spans: list[Span], total_days: int):
+    """Expand spans to one entry per covered day and stack them per day.
+
+    Returns (day, layer, layer count for that day, span index) arrays.
+    """
+    if not spans:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    start = np.array([s.start for s in spans])
+    end = np.array([s.end for s in spans])
+    lengths = (end - start) % total_days + 1
+    span_index = np.repeat(np.arange(len(spans)), lengths)
+    offsets = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    day = (start[span_index] + offsets) % total_days
+
+    # Stable sort keeps span order within a day, which is the stacking order
+    order = np.argsort(day, kind="stable")
+    day, span_index = day[order], span_index[order]
+    counts = np.bincount(day, minlength=total_days)
+    first = np.cumsum(counts) - counts
+    layer = np.arange(len(day)) - first[day]
+    return day, layer, counts[day], span_index
+
+
+def _angles(day_position: np.ndarray, total_days: int) -> np.ndarray:
+    """Radians, starting at 12 o'clock and running clockwise (SVG y points down)."""
+    return np.radians(-90 + day_position / total_days * 360)
+
+
+def _arc_paths(start: np.ndarray, end: np.ndarray, inner: np.ndarray, outer: np.ndarray) -> list[str]:
+    # Each segment spans at most a few degrees, so the large-arc flag is always 0
+    x1, y1 = np.cos(start) * outer, np.sin(start) * outer
+    x2, y2 = np.cos(end) * outer, np.sin(end) * outer
+    x3, y3 = np.cos(end) * inner, np.sin(end) * inner
+    x4, y4 = np.cos(start) * inner, np.sin(start) * inner
+    columns = np.round(np.stack([outer, outer, x1, y1, x2, y2, x3, y3, inner, inner, x4, y4], axis=1), 3)
+    return [
+        f"M{r[2]:g} {r[3]:g}A{r[0]:g} {r[1]:g} 0 0 1 {r[4]:g} {r[5]:g}"
+        f"L{r[6]:g} {r[7]:g}A{r[8]:g} {r[9]:g} 0 0 0 {r[10]:g} {r[11]:g}Z"
+        for r in columns.tolist()
+    ]
+
+
+def _weekends(year: int, total_days: int) -> np.ndarray:
+    first_weekday = date(year, 1, 1).weekday()  # Monday = 0
+    return (np.arange(total_days) + first_weekday) % 7 >= 5
+
+
+def render_svg(year: int, spans: list[Span], theme: str = "light") -> bytes:
+    palette = THEMES[theme]
+    days_in_months = _days_in_months(year)
+    total_days = int(days_in_months.sum())
+    day_start = np.arange(total_days)
+    starts = _angles(day_start, total_days)
+    ends = _angles(day_start + 1, total_days)
+    weekend = _weekends(year, total_days)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{-VIEW_RADIUS} {-VIEW_RADIUS} '
+        f'{2 * VIEW_RADIUS} {2 * VIEW_RADIUS}">',
+        "<style>text{font-family:-apple-system,BlinkMacSystemFont,'Segoe UI',Roboto,sans-serif}</style>",
+        f'<rect x="{-VIEW_RADIUS}" y="{-VIEW_RADIUS}" width="{2 * VIEW_RADIUS}" '
+        f'height="{2 * VIEW_RADIUS}" fill="{palette["background"]}"/>',
+        f'<g stroke="{palette["border"]}" stroke-width="0.05">',
+    ]
+    ring = _arc_paths(starts, ends, np.full(total_days, INNER_RADIUS), np.full(total_days, OUTER_RADIUS))
+    for path, is_weekend in zip(ring, weekend.tolist()):
+        parts.append(f'<path d="{path}" fill="{palette["weekend"] if is_weekend else palette["segment"]}"/>')
+
+    day, layer, count, span_index = _layers(spans, total_days)
+    step = (OUTER_RADIUS - EVENT_INNER_RADIUS) / np.maximum(count, 1)
+    inner = EVENT_INNER_RADIUS + layer * step
+    paths = _arc_paths(starts[day], ends[day], inner, inner + step)
+    for path, i in zip(paths, span_index.tolist()):
+        span = spans[i]
+        opacity = "" if span.opacity == 1.0 else f' fill-opacity="{span.opacity:g}"'
+        parts.append(f'<path d="{path}" fill="{escape(span.color)}"{opacity}/>')
+    parts.append("</g>")
+
+    month_first_day = np.concatenate([[0], np.cumsum(days_in_months)[:-1]])
+    tick_angles = _angles(month_first_day, total_days)
+    parts.append(f'<g stroke="rgba(0,0,0,0.5)" stroke-width="{TICK_WIDTH}" stroke-linecap="round">')
+    for cos, sin in zip(np.round(np.cos(tick_angles), 6).tolist(), np.round(np.sin(tick_angles), 6).tolist()):
+        parts.append(
+            f'<line x1="{cos * TICK_INNER_RADIUS:.3f}" y1="{sin * TICK_INNER_RADIUS:.3f}" '
+            f'x2="{cos * TICK_OUTER_RADIUS:.3f}" y2="{sin * TICK_OUTER_RADIUS:.3f}"/>'
+        )
+    parts.append("</g>")
+
+    # Month names follow the circle, flipped where app.js flips them to stay upright
+    label_degrees = np.degrees(_angles(month_first_day + days_in_months / 2, total_days))
+    parts.append(f'<g fill="{palette["text"]}" font-size="10" font-weight="500" letter-spacing="0.3" '
+                 'text-anchor="middle" dominant-baseline="middle">')
+    for month, angle in enumerate(label_degrees.tolist()):
+        x = np.cos(np.radians(angle)) * MONTH_LABEL_RADIUS
+        y = np.sin(np.radians(angle)) * MONTH_LABEL_RADIUS
+        rotation = angle + 90
+        if angle > 90 or angle < -90:
+            rotation += 180
+        if 4 <= month <= 5 or 9 <= month <= 11:
+            rotation += 180
+        parts.append(
+            f'<text x="{x:.3f}" y="{y:.3f}" transform="rotate({rotation:.3f} {x:.3f} {y:.3f})">'
+            f"{MONTHS[month]}</text>"
+        )
+    parts.append("</g></svg>")
+    return "".join(parts).encode()
+
+
+def _blend(image: np.ndarray, mask: np.ndarray, rgb: np.ndarray, alpha) -> None:
+    """Alpha-blend `rgb` over `image` where `mask` is set (in place)."""
+    alpha = np.asarray(alpha, dtype=np.float32)
+    if alpha.ndim:
+        alpha = alpha[:, None]
+    image[mask] = image[mask] * (1 - alpha) + rgb * alpha
+
+
+def render_png(year: int, spans: list[Span], size: int, theme: str = "light") -> bytes:
+    palette = THEMES[theme]
+    days_in_months = _days_in_months(year)
+    total_days = int(days_in_months.sum())
+    weekend = _weekends(year, total_days)
+    segment_rgb = np.where(weekend[:, None], _rgb(palette["weekend"]), _rgb(palette["segment"])).astype(np.float32)
+
+    day, layer, count, span_index = _layers(spans, total_days)
+    layers_per_day = np.bincount(day, minlength=total_days)
+    max_layers = max(int(layers_per_day.max()) if len(day) else 0, 1)
+    event_rgb = np.zeros((total_days, max_layers, 3), dtype=np.float32)
+    event_alpha = np.zeros((total_days, max_layers), dtype=np.float32)
+    if len(day):
+        event_rgb[day, layer] = np.array([_rgb(spans[i].color) for i in span_index.tolist()])
+        event_alpha[day, layer] = np.array([spans[i].opacity for i in span_index.tolist()])
+
+    month_first_day = np.concatenate([[0], np.cumsum(days_in_months)[:-1]])
+    tick_angles = _angles(month_first_day, total_days)
+    tick_rgb = np.array(TICK_COLOR[:3], dtype=np.float32)
+
+    samples = size * SUPERSAMPLE
+    scale = 2 * VIEW_RADIUS / samples
+    coords = (np.arange(samples, dtype=np.float32) + 0.5) * scale - VIEW_RADIUS
+    image = np.empty((size, size, 3), dtype=np.uint8)
+    # Rasterize in horizontal bands to keep the float buffers small
+    band = max(SUPERSAMPLE, (262144 // samples) // SUPERSAMPLE * SUPERSAMPLE)
+    for top in range(0, samples, band):
+        y = coords[top:top + band, None]
+        x = coords[None, :]
+        r = np.hypot(x, y)
+        turn = (np.degrees(np.arctan2(y, x)) + 90) % 360 / 360
+        pixel_day = np.minimum((turn * total_days).astype(np.int64), total_days - 1)
+        rgb = np.empty(r.shape + (3,), dtype=np.float32)
+        rgb[:] = _rgb(palette["background"])
+
+        ring = (r >= INNER_RADIUS) & (r <= OUTER_RADIUS)
+        rgb[ring] = segment_rgb[pixel_day[ring]]
+
+        in_band = (r >= EVENT_INNER_RADIUS) & (r <= OUTER_RADIUS) & (layers_per_day[pixel_day] > 0)
+        band_day = pixel_day[in_band]
+        band_count = layers_per_day[band_day]
+        band_layer = np.minimum(
+            ((r[in_band] - EVENT_INNER_RADIUS) / (OUTER_RADIUS - EVENT_INNER_RADIUS) * band_count).astype(np.int64),
+            band_count - 1,
+        )
+        _blend(rgb, in_band, event_rgb[band_day, band_layer], event_alpha[band_day, band_layer])
+
+        for angle in tick_angles.tolist():
+            along = x * np.cos(angle) + y * np.sin(angle)
+            across = np.abs(y * np.cos(angle) - x * np.sin(angle))
+            tick = (across <= TICK_WIDTH / 2) & (along >= TICK_INNER_RADIUS) & (along <= TICK_OUTER_RADIUS)
+            _blend(rgb, tick, tick_rgb, TICK_COLOR[3])
+
+        rows = rgb.shape[0] // SUPERSAMPLE
+        image[top // SUPERSAMPLE:top // SUPERSAMPLE + rows] = np.round(
+            rgb.reshape(rows, SUPERSAMPLE, size, SUPERSAMPLE, 3).mean(axis=(1, 3))
+        ).astype(np.uint8)
+
+    return _encode_png(image)
+
+
+def _encode_png(image: np.ndarray) -> bytes:
+    height, width, _ = image.shape
+    # Filter type 0 (None) in front of every scanline
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, -1)], axis=1)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+async def _load_spans(db: AsyncSession, user_id: str, year: int) -> list[Span]:
+    events = await load_events(db, user_id)
+    result = await db.execute(select(User.birthday_month, User.birthday_day).where(User.id == user_id))
+    birthday = tuple(result.one_or_none() or (None, None))
+    friend_birthdays = [
+        (f["friend"]["birthday_month"], f["friend"]["birthday_day"])
+        for f in await load_friends(db, user_id)
+        if f["friend"]["birthday_month"] and f["friend"]["birthday_day"]
+    ]
+    return collect_spans(year, events, birthday, friend_birthdays)
+
+
+async def _render(
+    request: Request,
+    db: AsyncSession,
+    user_id: str,
+    fmt: Literal["svg", "png"],
+    size: int,
+    theme: str,
+    shared: bool,
+) -> Response:
+    year = date.today().year
+    revision = await current_revision(db, user_id)
+    # Weekdays and leap days change with the year even when the data doesn't; each
+    # theme, size and format is a different image of the same data
+    key = f"{user_id}.{revision}.{year}.{theme}.{size}.{fmt}"
+    etag = f'"{key}"'
+    cache_control = f"public, max-age={SHARE_MAX_AGE_SECONDS}" if shared else "private, no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = await render_cache.get(key)
+    if body is None:
+        spans = await _load_spans(db, user_id, year)
+        if fmt == "svg":
+            body = await asyncio.to_thread(render_svg, year, spans, theme)
+        else:
+            body = await asyncio.to_thread(render_png, year, spans, size, theme)
+        await render_cache.set(key, body)
+    return Response(body, media_type="image/svg+xml" if fmt == "svg" else "image/png", headers=headers)
+
+
+async def _ring_user_id(request: Request, token: Optional[str] = Query(None)) -> str:
+    """The session cookie, or for share links a share token."""
+    if token is None:
+        return await require_user_id(request)
+    user_id = await verify_share_token(token)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid share token")
+    return user_id
+
+
+async def _ring_db(user_id: str = Depends(_ring_user_id)):
+    async with read_session_for(user_id)() as session:
+        yield session
+
+
+@router.get("/ring.svg")
+async def get_ring_svg(
+    request: Request,
+    theme: Literal["light", "dark"] = "light",
+    token: Optional[str] = None,
+    user_id: str = Depends(_ring_user_id),
+    db: AsyncSession = Depends(_ring_db),
+):
+    return await _render(request, db, user_id, "svg", 0, theme, shared=token is not None)
+
+
+@router.get("/ring.png")
+async def get_ring_png(
+    request: Request,
+    size: int = Query(600, ge=64, le=1200),
+    theme: Literal["light", "dark"] = "light",
+    token: Optional[str] = None,
+    user_id: str = Depends(_ring_user_id),
+    db: AsyncSession = Depends(_ring_db),
+):
+    return await _render(request, db, user_id, "png", size, theme, shared=token is not None)
+
+
+def _share_links(user_id: str, version: int) -> RenderShareResponse:
+    token = create_share_token(user_id, version)
+    base = f"{settings.frontend_url}/api/render"
+    return RenderShareResponse(svg_url=f"{base}/ring.svg?token={token}", png_url=f"{base}/ring.png?token={token}")
+
+
+@router.get("/share", response_model=RenderShareResponse)
+async def get_share_links(user_id: str = Depends(require_user_id), db: AsyncSession = Depends(get_db)):
+    """Public links to the ring, for share previews and og:image."""
+    result = await db.execute(select(User.share_token_version).where(User.id == user_id))
+    version = result.scalar_one_or_none()
+    if version is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return _share_links(user_id, version)
+
+
+@router.post("/share/rotate", response_model=RenderShareResponse)
+async def rotate_share_links(user_id: str = Depends(require_user_id), db: AsyncSession = Depends(get_db)):
+    """Revoke every share link handed out so far and return new ones."""
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(share_token_version=User.share_token_version + 1)
+        .returning(User.share_token_version)
+        .execution_options(synchronize_session=False)
+    )
+    version = result.scalar_one_or_none()
+    if version is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    await db.commit()
+    return _share_links(user_id, version)
@@ -0,0 +1,126 @@
+"""Size-bounded memory + disk cache for rendered calendar images.
+
+Keys are expected to change whenever the rendered content would (they embed
+the user's data revision), so entries never need invalidating; old ones just
+age out. The memory tier is an LRU bounded by total bytes. The disk tier
+survives restarts and is shared by the workers on one machine; when it grows
+past its budget the least recently used files are deleted, down to
+PRUNE_TO of the budget. Each worker tracks the directory's size from its last
+scan plus its own writes and only scans again once that passes the budget, so
+the directory can overshoot by what the other workers wrote in between.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# Pruning deletes files until the disk tier is this fraction of its budget
+PRUNE_TO = 0.9
+
+
+class RenderCache:
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "circle-cal-render")
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        # Disk tier bytes as of the last scan plus this process's writes since; None until scanned
+        self._disk_size: Optional[int] = None
+        self._disk_lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return body
+        if self.disk_bytes > 0:
+            body = await asyncio.to_thread(self._read, key)
+            if body is not None:
+                self.disk_hits += 1
+                self._remember(key, body)
+                return body
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, body: bytes) -> None:
+        self._remember(key, body)
+        if self.disk_bytes > 0:
+            await asyncio.to_thread(self._write, key, body)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "bytes": self._size,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def _remember(self, key: str, body: bytes) -> None:
+        if len(body) > self.memory_bytes:
+            return
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = body
+        self._size += len(body)
+        while self._size > self.memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            # mtime doubles as the last-used time for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return body
+
+    def _write(self, key: str, body: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, self._path(key))
+        with self._disk_lock:
+            if self._disk_size is not None:
+                self._disk_size += len(body)
+            if self._disk_size is None or self._disk_size > self.disk_bytes:
+                self._disk_size = self._prune()
+
+    def _prune(self) -> int:
+        """Delete the least recently used files past PRUNE_TO of the budget; returns the bytes left."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        if total <= self.disk_bytes:
+            return total
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes * PRUNE_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
@@ -0,0 +1,127 @@
+"""Per-user data revisions used for ETag / conditional GET support.
+
+Every write that changes what a user sees from the read endpoints bumps that
+user's revision inside the same transaction, so a matching If-None-Match can
+be answered from the users row alone.
+"""
+from typing import Optional
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import update, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import User
+from .friend_graph import accepted_friend_ids
+from .database import note_write
+from .singleflight import invalidate_on_commit
+
+
+async def bump_revision(db: AsyncSession, *user_ids: str, returning: tuple = ()) -> list:
+    """Increment the revision of the given users (not committed).
+
+    Returns the `returning` columns of the bumped rows, saving a separate read
+    when the caller needs them anyway.
+    """
+    if not user_ids:
+        return []
+    note_write(*user_ids)
+    invalidate_on_commit(db, *user_ids)
+    statement = (
+        update(User)
+        .where(User.id.in_(set(user_ids)))
+        .values(revision=User.revision + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if not returning:
+        await db.execute(statement)
+        return []
+    result = await db.execute(statement.returning(*returning))
+    return result.all()
+
+
+async def next_revision(db: AsyncSession, user_id: str, only_if=None) -> Optional[int]:
+    """Increment one user's revision and return it (not committed).
+
+    The update locks the users row until commit, so the user's writes that
+    stamp rows with the result commit in revision order. Raises 401 if the
+    user no longer exists (a valid token can outlive its user).
+
+    With `only_if`, a SQL condition such as the target row existing, the
+    revision is bumped only when it holds and None is returned otherwise: a
+    write that finds nothing to change costs this one statement.
+    """
+    statement = update(User).where(User.id == user_id)
+    if only_if is not None:
+        statement = statement.where(only_if)
+    result = await db.execute(
+        statement
+        .values(revision=User.revision + 1)
+        .returning(User.revision)
+        .execution_options(synchronize_session=False)
+    )
+    revision = result.scalar_one_or_none()
+    if revision is None:
+        if only_if is not None:
+            return None
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    note_write(user_id)
+    invalidate_on_commit(db, user_id)
+    return revision
+
+
+async def bump_revision_with_friends(db: AsyncSession, user_id: str) -> list[str]:
+    """Increment the revision of a user and of everyone who lists them as a friend.
+
+    Returns the ids of the friends whose revision was bumped.
+    """
+    # One IN over a UNION ALL (rather than `id = ? OR id IN ...`) keeps both arms on an index
+    bumped_ids = select(User.id).where(User.id == user_id).union_all(accepted_friend_ids(user_id))
+    result = await db.execute(
+        update(User)
+        .where(User.id.in_(bumped_ids))
+        .values(revision=User.revision + 1)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    bumped = list(result.scalars())
+    note_write(*bumped)
+    invalidate_on_commit(db, *bumped)
+    return [bumped_id for bumped_id in bumped if bumped_id != user_id]
+
+
+async def current_revision(db: AsyncSession, user_id: str) -> int:
+    """Read the revision straight from the users row.
+
+    Not taken from the cached user snapshot: other workers may have bumped it.
+    """
+    result = await db.execute(select(User.revision).where(User.id == user_id))
+    return result.scalar_one_or_none() or 0
+
+
+def etag_for(user_id: str, revision: int) -> str:
+    return f'"{user_id}.{revision}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        # If-None-Match uses weak comparison
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def conditional_response(
+    request: Request, response: Response, user_id: str, revision: int
+) -> Optional[Response]:
+    """Set validators on `response` and return a 304 if the client copy is current."""
+    etag = etag_for(user_id, revision)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Literal, Union, Annotated
 
 
 class UserResponse(BaseModel):
@@ -56,6 +56,60 @@ class EventResponse(BaseModel):
         from_attributes = True
 
 
+# Delta sync, import and calendar feed
+class EventChangesResponse(BaseModel):
+    events: list[EventResponse]
+    deleted: list[str]
+    cursor: str
+
+
+class EventImportResponse(BaseModel):
+    imported: int
+    skipped: int
+
+
+class EventFeedResponse(BaseModel):
+    url: str
+
+
+# Batch event operations
+class EventBatchCreate(BaseModel):
+    op: Literal["create"]
+    data: EventCreate
+
+
+class EventBatchUpdate(BaseModel):
+    op: Literal["update"]
+    id: str
+    data: EventUpdate
+
+
+class EventBatchDelete(BaseModel):
+    op: Literal["delete"]
+    id: str
+
+
+EventBatchOperation = Annotated[
+    Union[EventBatchCreate, EventBatchUpdate, EventBatchDelete],
+    Field(discriminator="op"),
+]
+
+
+class EventBatchRequest(BaseModel):
+    operations: list[EventBatchOperation] = Field(min_length=1, max_length=500)
+
+
+class EventBatchResult(BaseModel):
+    op: str
+    id: Optional[str] = None
+    status: int
+    event: Optional[EventResponse] = None
+
+
+class EventBatchResponse(BaseModel):
+    results: list[EventBatchResult]
+
+
 # Friend-related schemas
 class FriendUserResponse(BaseModel):
     """User info for friend display"""
@@ -74,6 +128,22 @@ class FriendRequestCreate(BaseModel):
     email: str = Field(min_length=1, max_length=255)
 
 
+class FriendRequestBatchCreate(BaseModel):
+    emails: list[str] = Field(min_length=1, max_length=500)
+
+
+class FriendRequestBatchResult(BaseModel):
+    email: str
+    # requested, accepted (they had already asked us), invited (no account yet),
+    # already_invited, already_friends, already_pending, self or invalid
+    outcome: str
+    friendship_id: Optional[str] = None
+
+
+class FriendRequestBatchResponse(BaseModel):
+    results: list[FriendRequestBatchResult]
+
+
 class FriendRequestAction(BaseModel):
     accept: bool
 
@@ -100,3 +170,47 @@ class FriendshipResponse(BaseModel):
 class FriendRequestSentResponse(BaseModel):
     message: str
     invited: bool = False
+
+
+class BootstrapResponse(BaseModel):
+    """Everything the client needs for first paint, in one response"""
+    user: Optional[UserResponse]
+    events: list[EventResponse] = []
+    friends: list[FriendshipResponse] = []
+    pending_requests: list[FriendRequestResponse] = []
+
+
+class RenderShareResponse(BaseModel):
+    """Public links to the rendered ring, usable without signing in"""
+    svg_url: str
+    png_url: str
+
+
+class LayoutLabel(BaseModel):
+    id: str = Field(max_length=100)
+    x: float
+    y: float
+    width: float = Field(gt=0, le=10000)
+    height: float = Field(gt=0, le=10000)
+    anchor_x: float
+    anchor_y: float
+
+
+class LayoutRequest(BaseModel):
+    width: float = Field(gt=0, le=100000)
+    height: float = Field(gt=0, le=100000)
+    # The annealer's work grows with sweeps x labels; app.js sends 500 sweeps
+    sweeps: int = Field(500, ge=0, le=500)
+    labels: list[LayoutLabel] = Field(max_length=500)
+
+
+class LayoutPosition(BaseModel):
+    id: str
+    x: float
+    y: float
+
+
+class LayoutResponse(BaseModel):
+    key: str
+    cached: bool
+    labels: list[LayoutPosition]
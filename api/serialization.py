@@ -0,0 +1,42 @@
+"""JSON encoding for read paths that skip Pydantic.
+
+The list loaders select plain columns and build dicts already shaped like
+their response models, so there is nothing left to validate; encoding them
+directly is several times cheaper than a model_validate + model_dump_json
+per row. orjson does the encoding when it is installed, the stdlib encoder
+otherwise.
+"""
+import json
+from dataclasses import asdict, is_dataclass
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat().replace("+00:00", "Z")
+    if is_dataclass(value):
+        return asdict(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode dicts, lists, datetimes and dataclasses the way Pydantic would."""
+    if orjson is not None:
+        # Pydantic writes UTC offsets as "Z"
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,98 @@
+"""Single-flight coalescing of concurrent identical reads.
+
+A user with several tabs open sends bursts of the same GET within
+milliseconds (each tab's poll, the reload after every save). The first
+request for a (user, route, params) key runs the query and serializes the
+body; requests for the same key that arrive while it is in flight wait for
+and share its result instead of running their own.
+
+Flights are dropped for a user once a transaction that bumped their revision
+commits, so a read that starts after a write never joins a flight that began
+before it. Per process, like the caches.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+_INVALIDATE_KEY = "singleflight_invalidate"
+
+
+class SingleFlight:
+    def __init__(self):
+        # user id -> key -> future of the flight's result
+        self._calls: dict[str, dict[tuple, asyncio.Future]] = {}
+        self.leaders = 0
+        # route -> requests that shared another request's result
+        self.coalesced: dict[str, int] = {}
+
+    async def run(self, user_id: str, route: str, params: tuple[Hashable, ...], fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return `await fn()`, shared with identical calls already in flight."""
+        key = (route, *params)
+        calls = self._calls.get(user_id)
+        future = calls.get(key) if calls else None
+        if future is not None:
+            self.coalesced[route] = self.coalesced.get(route, 0) + 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader went away (client disconnect); run it ourselves unless we were cancelled
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls.setdefault(user_id, {})[key] = future
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marks it retrieved, so a flight nobody joined doesn't log it again
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            calls = self._calls.get(user_id)
+            if calls is not None and calls.get(key) is future:
+                del calls[key]
+                if not calls:
+                    del self._calls[user_id]
+
+    def invalidate(self, *user_ids: str) -> None:
+        """Start fresh flights for these users; requests already waiting keep their result."""
+        for user_id in user_ids:
+            self._calls.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": sum(len(calls) for calls in self._calls.values()),
+            "leaders": self.leaders,
+            "coalesced": sum(self.coalesced.values()),
+        }
+
+
+single_flight = SingleFlight()
+
+
+def invalidate_on_commit(db: AsyncSession, *user_ids: str) -> None:
+    """Drop the users' flights once `db` commits."""
+    db.info.setdefault(_INVALIDATE_KEY, set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    user_ids = session.info.pop(_INVALIDATE_KEY, None)
+    if user_ids:
+        single_flight.invalidate(*user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_INVALIDATE_KEY, None)
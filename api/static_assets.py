@@ -0,0 +1,198 @@
+"""Fingerprinted, precompressed static assets served from memory.
+
+`build_assets.py` (repo root) writes `dist/` ahead of time: content-hashed
+copies of the scripts and stylesheet, gzip and (if the optional `brotli`
+package is installed) brotli variants, an `index.html` that points at the
+hashed names, and `manifest.json`. At startup the server loads every file
+listed in the manifest into memory. Without a build, the same table is
+computed in memory from the source files, so development needs no extra
+step.
+
+Only files listed here are served; anything else falls back to index.html.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Referenced from index.html and safe to cache forever once hashed
+FINGERPRINTED = ["app.js", "labeler.js", "style.css"]
+# Served as-is, revalidated with ETags
+PLAIN = ["favicon.ico", "favicon-16x16.png", "favicon-32x32.png", "apple-touch-icon.png"]
+INDEX = "index.html"
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+@dataclass
+class Asset:
+    content_type: str
+    cache_control: str
+    digest: str
+    # encoding ("identity", "gzip", "br") -> bytes
+    bodies: dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, encoding: str) -> str:
+        suffix = "" if encoding == "identity" else f"-{encoding}"
+        return f'"{self.digest}{suffix}"'
+
+
+def _content_type(name: str) -> str:
+    if name.endswith(".js"):
+        return "application/javascript"
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _hashed_name(name: str, digest: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:10]}{ext}"
+
+
+def _compress(data: bytes, content_type: str) -> dict[str, bytes]:
+    bodies = {"identity": data}
+    if content_type.startswith(COMPRESSIBLE_TYPES):
+        bodies["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            bodies["br"] = brotli.compress(data, quality=11)
+    return bodies
+
+
+def compile_assets(source_dir: str) -> tuple[dict[str, Asset], dict[str, str]]:
+    """Build the asset table from source files.
+
+    Returns (assets by URL path, aliases from unhashed to hashed URL paths).
+    """
+    assets: dict[str, Asset] = {}
+    aliases: dict[str, str] = {}
+
+    with open(os.path.join(source_dir, INDEX), encoding="utf-8") as f:
+        index_html = f.read()
+
+    for name in FINGERPRINTED:
+        with open(os.path.join(source_dir, name), "rb") as f:
+            data = f.read()
+        digest = _digest(data)
+        hashed = _hashed_name(name, digest)
+        content_type = _content_type(name)
+        assets[f"/{hashed}"] = Asset(content_type, IMMUTABLE, digest, _compress(data, content_type))
+        # Old cached pages may still ask for the unhashed name
+        aliases[f"/{name}"] = f"/{hashed}"
+        index_html = index_html.replace(f'"{name}"', f'"/{hashed}"')
+
+    for name in PLAIN:
+        path = os.path.join(source_dir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        content_type = _content_type(name)
+        assets[f"/{name}"] = Asset(content_type, REVALIDATE, _digest(data), _compress(data, content_type))
+
+    html = index_html.encode("utf-8")
+    assets[f"/{INDEX}"] = Asset("text/html", REVALIDATE, _digest(html),
+                                _compress(html, "text/html"))
+    return assets, aliases
+
+
+_SUFFIXES = {"identity": "", "gzip": ".gz", "br": ".br"}
+
+
+def write_build(source_dir: str, out_dir: str) -> dict:
+    """Write compiled assets and manifest.json to `out_dir`; returns the manifest."""
+    assets, aliases = compile_assets(source_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"assets": {}, "aliases": aliases}
+    for url_path, asset in assets.items():
+        name = url_path.lstrip("/")
+        files = {}
+        for encoding, body in asset.bodies.items():
+            filename = name + _SUFFIXES[encoding]
+            with open(os.path.join(out_dir, filename), "wb") as f:
+                f.write(body)
+            files[encoding] = filename
+        manifest["assets"][url_path] = {
+            "content_type": asset.content_type,
+            "cache_control": asset.cache_control,
+            "digest": asset.digest,
+            "files": files,
+        }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_build(out_dir: str) -> Optional[tuple[dict[str, Asset], dict[str, str]]]:
+    """Load a prebuilt `dist/` into memory, or None if there isn't one."""
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    assets = {}
+    for url_path, entry in manifest["assets"].items():
+        bodies = {}
+        for encoding, filename in entry["files"].items():
+            with open(os.path.join(out_dir, filename), "rb") as f:
+                bodies[encoding] = f.read()
+        assets[url_path] = Asset(entry["content_type"], entry["cache_control"], entry["digest"], bodies)
+    return assets, manifest["aliases"]
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """Pick the best available encoding for an Accept-Encoding header."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            accepted[token.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and q > 0:
+            return encoding
+    return "identity"
+
+
+class StaticAssets:
+    def __init__(self, source_dir: str, build_dir: str):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.assets: dict[str, Asset] = {}
+        self.aliases: dict[str, str] = {}
+
+    def load(self) -> None:
+        loaded = load_build(self.build_dir)
+        self.assets, self.aliases = loaded if loaded else compile_assets(self.source_dir)
+
+    def lookup(self, path: str) -> tuple[Asset, str]:
+        """Return (asset, Cache-Control) for a URL path.
+
+        Unhashed aliases must be revalidated even though the file they point
+        to is immutable. Unknown paths get index.html for SPA routing.
+        """
+        if not self.assets:
+            self.load()
+        if path in self.aliases:
+            return self.assets[self.aliases[path]], REVALIDATE
+        asset = self.assets.get(path) or self.assets[f"/{INDEX}"]
+        return asset, asset.cache_control
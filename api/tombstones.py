@@ -0,0 +1,78 @@
+"""Background pruning of expired event tombstones.
+
+Deletes leave a tombstone (see api/events.py) so GET /api/events/changes can
+report them; once older than TOMBSTONE_RETENTION no valid cursor can ask for
+them any more. The pruner drops those on a timer, a bounded batch per
+statement, so cleanup doesn't depend on how often each user deletes events.
+Every app worker runs one; pruning the same rows twice is harmless.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from .config import get_settings
+from .database import async_session
+from .models import EventTombstone
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Deletes are reported by GET /changes for this long; older cursors must reload everything
+TOMBSTONE_RETENTION = timedelta(days=30)
+PRUNE_BATCH = 1000
+
+
+async def prune_expired() -> int:
+    """Delete every tombstone older than the retention. Returns how many were deleted."""
+    cutoff = datetime.utcnow() - TOMBSTONE_RETENTION
+    pruned = 0
+    while True:
+        async with async_session() as db:
+            expired = (
+                select(EventTombstone.event_id)
+                .where(EventTombstone.deleted_at < cutoff)
+                .limit(PRUNE_BATCH)
+            )
+            result = await db.execute(
+                delete(EventTombstone)
+                .where(EventTombstone.event_id.in_(expired))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        pruned += result.rowcount
+        if result.rowcount < PRUNE_BATCH:
+            return pruned
+
+
+class TombstonePruner:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                pruned = await prune_expired()
+                if pruned:
+                    logger.info("Pruned %d expired event tombstones", pruned)
+            except Exception:
+                logger.exception("Tombstone pruning failed")
+            await asyncio.sleep(self.interval)
+
+
+tombstone_pruner = TombstonePruner(settings.tombstone_prune_interval_seconds)
@@ -0,0 +1,109 @@
+"""Bounded TTL + LRU cache of verified auth tokens to user snapshots.
+
+Lets authenticated requests skip the `SELECT users WHERE id = ?` that
+`get_current_user` would otherwise run on every call. Entries expire after a
+short TTL (never later than the token itself) and are dropped explicitly when
+the user's profile changes. The cache is per process, so other workers see a
+profile change once their own entry expires.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Read-only copy of the user columns handlers need."""
+    id: str
+    email: str
+    name: Optional[str]
+    picture_url: Optional[str]
+    birthday_month: Optional[int]
+    birthday_day: Optional[int]
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            email=user.email,
+            name=user.name,
+            picture_url=user.picture_url,
+            birthday_month=user.birthday_month,
+            birthday_day=user.birthday_day,
+        )
+
+
+class UserCache:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, UserSnapshot]] = OrderedDict()
+        self._tokens_by_user: dict[str, set[str]] = {}
+
+    def get(self, token: str) -> Optional[UserSnapshot]:
+        snapshot = self.peek(token)
+        if snapshot is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return snapshot
+
+    def peek(self, token: str) -> Optional[UserSnapshot]:
+        """Like get, but leaves the hit/miss counts and LRU order alone.
+
+        For callers that only want the id if it happens to be cached and
+        never fill the cache, whose misses would say nothing about it.
+        """
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at <= time.monotonic():
+            self._remove(token)
+            return None
+        return snapshot
+
+    def set(self, token: str, snapshot: UserSnapshot, token_expires_in: Optional[float] = None) -> None:
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl_seconds
+        if token_expires_in is not None:
+            ttl = min(ttl, token_expires_in)
+        if ttl <= 0:
+            return
+
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (time.monotonic() + ttl, snapshot)
+        self._tokens_by_user.setdefault(snapshot.id, set()).add(token)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def invalidate_token(self, token: str) -> None:
+        if token in self._entries:
+            self._remove(token)
+
+    def invalidate_user(self, user_id: str) -> None:
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._remove(token)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _remove(self, token: str) -> None:
+        _, snapshot = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(snapshot.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[snapshot.id]
@@ -17,6 +17,7 @@
     let selectedEndDate = null; // For multi-day events
     let currentUser = null;
     let events = []; // Events from API
+    let eventsCursor = null; // From /api/events/changes; null until the first full load
     let selectedColor = '#ff6360'; // Default color
     let selectedHidden = false; // Default visibility
     const DEFAULT_COLOR = '#ff6360';
@@ -39,6 +40,7 @@
 
     // Label positioning
     let labelData = [];
+    let labelerRun = 0; // Bumped per runLabeler call so stale layouts are dropped
 
     const svg = document.getElementById('calendar');
     const tooltip = document.getElementById('tooltip');
@@ -89,7 +91,8 @@
     let pendingFriendRequests = [];
     let friends = [];
     let friendsPollInterval = null;
-    const FRIENDS_POLL_INTERVAL = 30000; // 30 seconds
+    let friendsStream = null;
+    const FRIENDS_POLL_INTERVAL = 30000; // 30 seconds, only used without EventSource
 
     // API helper
     async function api(endpoint, options = {}) {
@@ -108,19 +111,46 @@
         return response.json();
     }
 
+    // Fetch every page of a keyset-paginated list endpoint, following X-Next-Cursor.
+    // onPage (optional) sees the items loaded so far after each page.
+    const LIST_PAGE_SIZE = 500;
+    async function apiList(endpoint, onPage) {
+        const items = [];
+        let cursor = null;
+        do {
+            const params = new URLSearchParams({ limit: LIST_PAGE_SIZE });
+            if (cursor) params.set('cursor', cursor);
+            const separator = endpoint.includes('?') ? '&' : '?';
+            const response = await fetch(`${API_URL}${endpoint}${separator}${params}`, {
+                credentials: 'include',
+            });
+            if (!response.ok) {
+                throw new Error(`API error: ${response.status}`);
+            }
+            items.push(...await response.json());
+            cursor = response.headers.get('X-Next-Cursor');
+            if (onPage) onPage(items);
+        } while (cursor);
+        return items;
+    }
+
     // Auth functions
     async function checkAuth() {
         try {
-            const user = await api('/auth/me');
-            if (user) {
-                currentUser = user;
+            // User, events, friends and pending requests in one round trip
+            const data = await api('/api/bootstrap');
+            if (data.user) {
+                currentUser = data.user;
                 updateAuthUI();
-                await loadEventsFromAPI();
+                events = data.events;
+                eventsCursor = null;
+                friends = data.friends;
+                rebuildAnnotationsFromEvents();
 
                 // Start polling for friend requests
-                pendingFriendRequests = await fetchPendingRequests();
+                pendingFriendRequests = data.pending_requests;
                 updateFriendBadge();
-                startFriendsPoll();
+                startFriendsUpdates();
             } else {
                 showLoginButton();
             }
@@ -159,10 +189,11 @@
         }
         currentUser = null;
         events = [];
+        eventsCursor = null;
         annotations = {};
         friends = [];
         pendingFriendRequests = [];
-        stopFriendsPoll();
+        stopFriendsUpdates();
         updateFriendBadge();
         loadFromLocalStorage();
         updateAuthUI();
@@ -236,7 +267,7 @@
     async function fetchPendingRequests() {
         if (!currentUser) return [];
         try {
-            return await api('/api/friends/requests/pending');
+            return await apiList('/api/friends/requests/pending');
         } catch (e) {
             console.error('Failed to fetch pending requests:', e);
             return [];
@@ -246,7 +277,7 @@
     async function fetchFriends() {
         if (!currentUser) return [];
         try {
-            return await api('/api/friends');
+            return await apiList('/api/friends');
         } catch (e) {
             console.error('Failed to fetch friends:', e);
             return [];
@@ -424,6 +455,44 @@
         }
     }
 
+    // Friend notifications are pushed over server-sent events; fall back to
+    // polling only in browsers without EventSource
+    function startFriendsUpdates() {
+        if (typeof EventSource === 'undefined') {
+            startFriendsPoll();
+            return;
+        }
+        if (friendsStream) return;
+
+        friendsStream = new EventSource(`${API_URL}/api/friends/stream`, { withCredentials: true });
+
+        friendsStream.addEventListener('friend_request', async () => {
+            pendingFriendRequests = await fetchPendingRequests();
+            updateFriendBadge();
+            if (friendsModal && friendsModal.style.display === 'flex') {
+                renderPendingRequests();
+            }
+        });
+
+        // Acceptances, removals and birthday changes all change friend birthdays
+        ['friend_accepted', 'friend_removed', 'birthday_changed'].forEach(type => {
+            friendsStream.addEventListener(type, async () => {
+                await loadEventsFromAPI();
+                if (friendsModal && friendsModal.style.display === 'flex') {
+                    renderFriends();
+                }
+            });
+        });
+    }
+
+    function stopFriendsUpdates() {
+        if (friendsStream) {
+            friendsStream.close();
+            friendsStream = null;
+        }
+        stopFriendsPoll();
+    }
+
     function startFriendsPoll() {
         if (friendsPollInterval) return;
 
@@ -500,35 +569,58 @@
     async function loadEventsFromAPI() {
         if (!currentUser) return;
         try {
-            events = await api('/api/events');
             friends = await fetchFriends(); // Also fetch friends for birthday display
-
-            // Convert events to annotations format
-            annotations = {};
-            events.forEach(event => {
-                const key = `${event.month}-${event.day}`;
-                if (!annotations[key]) annotations[key] = [];
-                const annotation = {
-                    id: event.id,
-                    title: event.title,
-                    color: event.color || DEFAULT_COLOR,
-                    hidden: event.hidden || false,
-                };
-                // Add end date for multi-day events
-                if (event.end_month && event.end_day) {
-                    annotation.endMonth = event.end_month - 1; // Convert to 0-indexed
-                    annotation.endDay = event.end_day;
-                }
-                annotations[key].push(annotation);
-            });
-            // Inject birthday events (own and friends)
-            injectBirthdayEvent();
-            updateAnnotationMarkers();
+            await syncEvents();
+            rebuildAnnotationsFromEvents();
         } catch (e) {
             console.error('Failed to load events:', e);
         }
     }
 
+    // Fetch only the events changed since the last sync and merge them in;
+    // the first sync (or one whose cursor expired) loads every event
+    async function syncEvents() {
+        const params = eventsCursor ? `?since=${encodeURIComponent(eventsCursor)}` : '';
+        const response = await fetch(`${API_URL}/api/events/changes${params}`, { credentials: 'include' });
+        if (response.status === 410) {
+            eventsCursor = null;
+            return syncEvents();
+        }
+        if (!response.ok) {
+            throw new Error(`API error: ${response.status}`);
+        }
+        const changes = await response.json();
+        const byId = eventsCursor ? new Map(events.map(event => [event.id, event])) : new Map();
+        changes.deleted.forEach(id => byId.delete(id));
+        changes.events.forEach(event => byId.set(event.id, event));
+        events = [...byId.values()];
+        eventsCursor = changes.cursor;
+    }
+
+    function rebuildAnnotationsFromEvents() {
+        // Convert events to annotations format
+        annotations = {};
+        events.forEach(event => {
+            const key = `${event.month}-${event.day}`;
+            if (!annotations[key]) annotations[key] = [];
+            const annotation = {
+                id: event.id,
+                title: event.title,
+                color: event.color || DEFAULT_COLOR,
+                hidden: event.hidden || false,
+            };
+            // Add end date for multi-day events
+            if (event.end_month && event.end_day) {
+                annotation.endMonth = event.end_month - 1; // Convert to 0-indexed
+                annotation.endDay = event.end_day;
+            }
+            annotations[key].push(annotation);
+        });
+        // Inject birthday events (own and friends)
+        injectBirthdayEvent();
+        updateAnnotationMarkers();
+    }
+
     async function createEventAPI(month, day, title, endMonth, endDay, color, hidden) {
         if (!currentUser) return null;
         try {
@@ -1580,40 +1672,82 @@
         const offsetX = -vb.x;
         const offsetY = -vb.y;
 
+        // Rounded so small measurement jitter still hits the server's layout cache
+        const round = v => Math.round(v * 10) / 10;
         const labels = labelData.map(d => ({
-            x: d.originalX + offsetX,
-            y: d.originalY + offsetY,
-            width: d.width,
-            height: d.height,
+            x: round(d.originalX + offsetX),
+            y: round(d.originalY + offsetY),
+            width: round(d.width),
+            height: round(d.height),
             originalX: d.originalX,
             originalY: d.originalY
         }));
 
         const anchors = labelData.map(d => ({
-            x: d.anchorX + offsetX,
-            y: d.anchorY + offsetY,
+            x: round(d.anchorX + offsetX),
+            y: round(d.anchorY + offsetY),
             r: 5
         }));
 
-        // Run the labeler
-        d3.labeler()
-            .label(labels)
-            .anchor(anchors)
-            .width(vb.w)
-            .height(vb.h)
-            .start(500);
-
-        // Apply results back to labelData (convert back from offset coordinates)
-        labels.forEach((label, i) => {
-            labelData[i].x = label.x - offsetX;
-            labelData[i].y = label.y - offsetY;
-        });
+        const applyLayout = (positions) => {
+            // Apply results back to labelData (convert back from offset coordinates)
+            positions.forEach((label, i) => {
+                labelData[i].x = label.x - offsetX;
+                labelData[i].y = label.y - offsetY;
+            });
 
-        // Update DOM
-        applyLabelPositions();
+            // Update DOM
+            applyLabelPositions();
+
+            // Apply priority-based visibility (collision detection)
+            updateLabelVisibility();
+        };
 
-        // Apply priority-based visibility (collision detection)
+        const runLocally = () => {
+            d3.labeler()
+                .label(labels)
+                .anchor(anchors)
+                .width(vb.w)
+                .height(vb.h)
+                .start(500);
+            applyLayout(labels);
+        };
+
+        const run = ++labelerRun;
+        const placing = labelData;
+        // A newer run (or a rebuilt label set) supersedes this one
+        const isStale = () => run !== labelerRun || placing !== labelData;
+
+        if (!currentUser) {
+            runLocally();
+            return;
+        }
+
+        // Show unplaced labels right away; the server layout replaces them
+        applyLabelPositions();
         updateLabelVisibility();
+
+        api('/api/layout', {
+            method: 'POST',
+            body: JSON.stringify({
+                width: vb.w,
+                height: vb.h,
+                sweeps: 500,
+                labels: labelData.map((d, i) => ({
+                    id: d.id,
+                    x: labels[i].x,
+                    y: labels[i].y,
+                    width: labels[i].width,
+                    height: labels[i].height,
+                    anchor_x: anchors[i].x,
+                    anchor_y: anchors[i].y
+                }))
+            })
+        }).then(layout => {
+            if (!isStale()) applyLayout(layout.labels);
+        }).catch(() => {
+            if (!isStale()) runLocally();
+        });
     }
 
     function applyLabelPositions() {
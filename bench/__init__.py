@@ -0,0 +1,22 @@
+"""Benchmarks and load tests for the API.
+
+    python -m bench.generator   seed a database with a synthetic dataset
+    python -m bench.run         load scenarios against the ASGI app, JSON report
+    python -m bench.compare     diff two reports
+    python -m bench.list_serialization   CPU per list request, before/after
+    python -m bench.middleware           middleware overhead per request, before/after
+    python -m bench.write_queries        SQL statements per write endpoint, against budgets
+    python -m bench.friend_graph         friend lookups at ~1M friendships, before/after edges
+
+Everything runs against DATABASE_URL, or a scratch SQLite database when it
+isn't set. Point it at a throwaway database: the generator refuses to load
+into one that already has users.
+"""
+import os
+import tempfile
+
+# Set before anything imports api.config, which reads the environment once
+if "DATABASE_URL" not in os.environ:
+    _scratch = os.path.join(tempfile.mkdtemp(prefix="circle-cal-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_scratch}"
+os.environ.setdefault("DB_ECHO", "false")
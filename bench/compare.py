@@ -0,0 +1,74 @@
+"""Compare two bench/run.py reports route by route.
+
+    python -m bench.compare before.json after.json [--threshold 25]
+
+Prints p50/p99 latency and queries per request side by side. Exits 1 when a
+route now issues more queries per request, or its p99 grew by more than
+--threshold percent. Query counts are exact for a given dataset; latencies
+vary by 10-20% between identical runs, so compare several runs before
+trusting small latency changes.
+"""
+import argparse
+import json
+import sys
+
+
+def _rows(report: dict) -> dict[str, dict]:
+    rows = {}
+    for name, result in report["scenarios"].items():
+        for route, stats in result.get("routes", {}).items():
+            rows[f"{name}: {route}"] = stats
+    return rows
+
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return ""
+    return f"{(after - before) / before * 100:+.0f}%"
+
+
+def compare(before: dict, after: dict, threshold: float) -> list[str]:
+    """Print the comparison; returns the routes that regressed."""
+    old, new = _rows(before), _rows(after)
+    if before["meta"].get("dataset") != after["meta"].get("dataset"):
+        print("warning: the reports were run on different datasets")
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    print(f"{'route':<56}{'p50':>21}{'p99':>24}{'q/req':>14}")
+    regressions = []
+    for key in sorted(old.keys() | new.keys()):
+        if key not in old or key not in new:
+            print(f"{key:<56}  only in {'after' if key in new else 'before'}")
+            continue
+        a, b = old[key], new[key]
+        p50 = (a["latency_ms"]["p50"], b["latency_ms"]["p50"])
+        p99 = (a["latency_ms"]["p99"], b["latency_ms"]["p99"])
+        queries = (a["queries_per_request"]["mean"], b["queries_per_request"]["mean"])
+        print(
+            f"{key:<56}"
+            f"{p50[0]:>7.1f} {p50[1]:>7.1f} {_change(*p50):>5}"
+            f"{p99[0]:>9.1f} {p99[1]:>8.1f} {_change(*p99):>5}"
+            f"{queries[0]:>7.2f} {queries[1]:>6.2f}"
+        )
+        if queries[1] > queries[0] + 1e-9 or (p99[0] and (p99[1] - p99[0]) / p99[0] * 100 > threshold):
+            regressions.append(key)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two bench/run.py JSON reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=25.0, help="allowed p99 growth, percent")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    regressions = compare(before, after, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressed: " + ", ".join(regressions))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Benchmark: friend graph lookups, OR across friendships vs symmetric edges.
+
+Loads a generated graph (see bench.generator; the defaults give about a
+million friendships) and times the three lookups the API makes, written both
+ways:
+
+- friend list: a user's accepted friends with their user rows (GET /api/friends)
+- existence: the friendship between two users, either direction (friend requests)
+- birthdays: the birthdays of a user's friends (the rendered ring)
+
+for a typical user and for the best-connected one. On Postgres it also prints
+the scans each plan uses, where the edge lookups should be a single index
+range scan of friend_edges.
+
+    python -m bench.friend_graph [--users 200000 --degree 10] [--repeat 50]
+    python -m bench.friend_graph --no-load   # a database loaded earlier
+
+Prints milliseconds per lookup (median), before and after.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from sqlalchemy import and_, case, func, or_, select, text
+
+from api.database import async_session, engine
+from api.friend_graph import friendship_between
+from api.friends import FRIEND_USER_COLUMNS, load_friends
+from api.models import FriendEdge, Friendship, User
+from bench import generator
+
+
+def _either_side(user_id: str):
+    return or_(Friendship.requester_id == user_id, Friendship.addressee_id == user_id)
+
+
+def _other_side(user_id: str):
+    return case((Friendship.requester_id == user_id, Friendship.addressee_id), else_=Friendship.requester_id)
+
+
+def friends_before(user_id: str):
+    return (
+        select(Friendship.id, Friendship.created_at, *FRIEND_USER_COLUMNS)
+        .join(User, User.id == _other_side(user_id))
+        .where(_either_side(user_id), Friendship.status == "accepted")
+        .order_by(Friendship.created_at, Friendship.id)
+    )
+
+
+def friends_after(user_id: str):
+    return (
+        select(FriendEdge.friendship_id, FriendEdge.created_at, *FRIEND_USER_COLUMNS)
+        .join(User, User.id == FriendEdge.friend_id)
+        .where(FriendEdge.user_id == user_id, FriendEdge.status == "accepted")
+        .order_by(FriendEdge.created_at, FriendEdge.friendship_id)
+    )
+
+
+def existence_before(user_id: str, other_id: str):
+    return select(Friendship).where(or_(
+        and_(Friendship.requester_id == user_id, Friendship.addressee_id == other_id),
+        and_(Friendship.requester_id == other_id, Friendship.addressee_id == user_id),
+    ))
+
+
+def existence_after(user_id: str, other_id: str):
+    return (
+        select(Friendship)
+        .join(FriendEdge, FriendEdge.friendship_id == Friendship.id)
+        .where(FriendEdge.user_id == user_id, FriendEdge.friend_id == other_id)
+    )
+
+
+def birthdays_before(user_id: str):
+    return (
+        select(User.birthday_month, User.birthday_day)
+        .join(Friendship, User.id == _other_side(user_id))
+        .where(_either_side(user_id), Friendship.status == "accepted", User.birthday_month.is_not(None))
+    )
+
+
+def birthdays_after(user_id: str):
+    return (
+        select(User.birthday_month, User.birthday_day)
+        .join(FriendEdge, User.id == FriendEdge.friend_id)
+        .where(FriendEdge.user_id == user_id, FriendEdge.status == "accepted", User.birthday_month.is_not(None))
+    )
+
+
+async def _sample_users() -> dict:
+    """A user of median degree and the best-connected user, each with a friend."""
+    async with async_session() as db:
+        degrees = (
+            select(FriendEdge.user_id, func.count().label("degree"))
+            .where(FriendEdge.status == "accepted")
+            .group_by(FriendEdge.user_id)
+            .subquery()
+        )
+        result = await db.execute(select(degrees.c.user_id, degrees.c.degree).order_by(degrees.c.degree))
+        ranked = result.all()
+        users = {"typical": ranked[len(ranked) // 2], "hub": ranked[-1]}
+        sample = {}
+        for label, (user_id, degree) in users.items():
+            friend_id = (await db.execute(
+                select(FriendEdge.friend_id).where(FriendEdge.user_id == user_id).limit(1)
+            )).scalar_one()
+            sample[label] = (user_id, friend_id, degree)
+        return sample
+
+
+def cases(user_id: str, friend_id: str) -> dict:
+    """lookup -> (statement before, statement after)"""
+    return {
+        "friend list": (friends_before(user_id), friends_after(user_id)),
+        "existence": (existence_before(user_id, friend_id), existence_after(user_id, friend_id)),
+        "birthdays": (birthdays_before(user_id), birthdays_after(user_id)),
+    }
+
+
+async def time_ms(statement, repeat: int) -> float:
+    samples = []
+    async with async_session() as db:
+        await db.execute(statement)  # warm the cache
+        for _ in range(repeat):
+            start = time.perf_counter()
+            (await db.execute(statement)).all()
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _scans(plan: dict) -> list[str]:
+    found = []
+    if "Scan" in plan.get("Node Type", ""):
+        found.append(f"{plan['Node Type']} {plan.get('Index Name') or plan.get('Relation Name', '')}".strip())
+    for child in plan.get("Plans", []):
+        found.extend(_scans(child))
+    return found
+
+
+async def plan_scans(statement) -> str:
+    async with engine.connect() as conn:
+        compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+        result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+        return ", ".join(_scans(result.scalar()[0]["Plan"]))
+
+
+async def run(args) -> int:
+    if args.load:
+        dataset = generator.generate(args.users, args.events, args.degree, args.seed)
+        print(f"loading {len(dataset.friendships)} friendships among {len(dataset.users)} users")
+        try:
+            await generator.load(dataset)
+        except RuntimeError as e:
+            print(e)
+            return 1
+    is_postgres = engine.dialect.name == "postgresql"
+    if is_postgres:
+        # VACUUM too: index-only scans need the visibility map
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM ANALYZE"))
+
+    # Sanity check before timing: both versions must return the same rows
+    for label, (user_id, friend_id, degree) in (await _sample_users()).items():
+        async with async_session() as db:
+            edges = await load_friends(db, user_id)
+            before = (await db.execute(friends_before(user_id))).all()
+            if [f["id"] for f in edges] != [row[0] for row in before]:
+                print(f"{label}: friend lists differ")
+                return 1
+            if await friendship_between(db, friend_id, user_id) is None:
+                print(f"{label}: friendship not found from the other side")
+                return 1
+
+        print(f"\n{label} user, {degree} friends")
+        print(f"{'lookup':<14}{'before ms':>11}{'after ms':>10}")
+        for lookup, (before, after) in cases(user_id, friend_id).items():
+            before_ms = await time_ms(before, args.repeat)
+            after_ms = await time_ms(after, args.repeat)
+            print(f"{lookup:<14}{before_ms:>11.3f}{after_ms:>10.3f}")
+            if is_postgres:
+                print(f"    before: {await plan_scans(before)}")
+                print(f"    after:  {await plan_scans(after)}")
+    await engine.dispose()
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time friend graph lookups before/after friend edges")
+    generator.add_arguments(parser)
+    parser.set_defaults(users=200_000, events=0, degree=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--no-load", dest="load", action="store_false",
+                        help="use the graph already in the database")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Seeded synthetic dataset: users, events and a friendship graph.
+
+The same arguments always produce the same rows, ids included, so reports
+from different commits are measured on identical data.
+
+- Users: about 70% have a birthday set.
+- Events per user: mostly single days. About 15% span 2-14 days and about
+  5% wrap from late December into January.
+- Friendships: a preferential-attachment (Barabási–Albert) graph. Most users
+  have a few friends and a handful have hundreds, like real social graphs.
+  Most edges are accepted; some are pending or declined.
+
+    python -m bench.generator --users 1000 --events 50 --degree 10 --seed 1
+"""
+import argparse
+import asyncio
+import random
+import sys
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from api.database import engine
+from api.migrations import migrate
+from api.friend_graph import edge_rows
+from api.models import Event, Friendship, FriendEdge, User, day_of_year
+
+COLORS = ["#ff6360", "#ffcc00", "#00c886", "#0ba1ff"]
+# Fixed so timestamps are reproducible too
+EPOCH = datetime(2025, 1, 1)
+INSERT_CHUNK_SIZE = 5000
+
+
+@dataclass
+class Dataset:
+    seed: int
+    users: list[dict] = field(default_factory=list)
+    events: list[dict] = field(default_factory=list)
+    friendships: list[dict] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        degree: dict[str, int] = {}
+        for f in self.friendships:
+            if f["status"] == "accepted":
+                for user_id in (f["requester_id"], f["addressee_id"]):
+                    degree[user_id] = degree.get(user_id, 0) + 1
+        degrees = sorted(degree.get(u["id"], 0) for u in self.users)
+        return {
+            "seed": self.seed,
+            "users": len(self.users),
+            "events": len(self.events),
+            "friendships": len(self.friendships),
+            "friends_median": degrees[len(degrees) // 2] if degrees else 0,
+            "friends_max": degrees[-1] if degrees else 0,
+        }
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _timestamp(rng: random.Random) -> datetime:
+    return EPOCH + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+
+
+def _event_dates(rng: random.Random) -> tuple[date, date]:
+    # Dates on a leap year so Feb 29 can come up
+    kind = rng.random()
+    if kind < 0.05:
+        return date(2024, 12, rng.randint(20, 31)), date(2025, 1, rng.randint(1, 10))
+    start = date(2024, 1, 1) + timedelta(days=rng.randrange(366))
+    if kind < 0.20:
+        end = start + timedelta(days=rng.randint(1, 13))
+        # Spans that would run past Dec 31 stay inside the year; the
+        # wrapping share is controlled above
+        return start, min(end, date(2024, 12, 31))
+    return start, start
+
+
+def _events(rng: random.Random, user_id: str, count: int) -> list[dict]:
+    events = []
+    for i in range(count):
+        start, end = _event_dates(rng)
+        created = _timestamp(rng)
+        events.append({
+            "id": _uuid(rng),
+            "user_id": user_id,
+            "month": start.month,
+            "day": start.day,
+            "end_month": end.month,
+            "end_day": end.day,
+            "start_doy": day_of_year(start.month, start.day),
+            "end_doy": day_of_year(end.month, end.day),
+            "title": f"Event {i}",
+            "color": rng.choice(COLORS),
+            "hidden": rng.random() < 0.05,
+            "created_at": created,
+            "updated_at": created,
+        })
+    return events
+
+
+def _friend_edges(rng: random.Random, n: int, mean_degree: int) -> list[tuple[int, int]]:
+    """Barabási–Albert graph on n nodes; each new node links to m = mean_degree / 2 others."""
+    m = max(1, mean_degree // 2)
+    if n <= m:
+        return [(i, j) for i in range(n) for j in range(i + 1, n)]
+    edges = [(i, j) for i in range(m) for j in range(i + 1, m)]
+    # Every node appears once per edge end, so uniform picks are degree-weighted
+    ends = [node for edge in edges for node in edge] or list(range(m))
+    for node in range(m, n):
+        targets: set[int] = set()
+        while len(targets) < m:
+            targets.add(rng.choice(ends))
+        for target in targets:
+            edges.append((node, target))
+            ends.extend((node, target))
+    return edges
+
+
+def generate(users: int, events_per_user: int, mean_degree: int = 10, seed: int = 1) -> Dataset:
+    rng = random.Random(seed)
+    dataset = Dataset(seed=seed)
+    for i in range(users):
+        has_birthday = rng.random() < 0.7
+        birthday = date(2024, 1, 1) + timedelta(days=rng.randrange(366))
+        dataset.users.append({
+            "id": _uuid(rng),
+            "google_id": f"bench-{seed}-{i}",
+            "email": f"user{i}@bench.example.com",
+            "name": f"User {i}",
+            "birthday_month": birthday.month if has_birthday else None,
+            "birthday_day": birthday.day if has_birthday else None,
+            "created_at": _timestamp(rng),
+        })
+    for user in dataset.users:
+        dataset.events.extend(_events(rng, user["id"], events_per_user))
+    for a, b in _friend_edges(rng, users, mean_degree):
+        # Either side may have sent the request
+        if rng.random() < 0.5:
+            a, b = b, a
+        roll = rng.random()
+        status = "accepted" if roll < 0.85 else ("pending" if roll < 0.95 else "declined")
+        created = _timestamp(rng)
+        dataset.friendships.append({
+            "id": _uuid(rng),
+            "requester_id": dataset.users[a]["id"],
+            "addressee_id": dataset.users[b]["id"],
+            "status": status,
+            "created_at": created,
+            "updated_at": created,
+        })
+    return dataset
+
+
+async def load(dataset: Dataset, db_engine: AsyncEngine = engine) -> None:
+    """Migrate and bulk insert the dataset; refuses a database that already has users."""
+    await migrate(db_engine)
+    async with db_engine.begin() as conn:
+        existing = (await conn.execute(select(func.count()).select_from(User))).scalar()
+        if existing:
+            raise RuntimeError(f"Database already has {existing} users; use an empty one")
+        edges = [edge for friendship in dataset.friendships for edge in edge_rows(friendship)]
+        for model, rows in (
+            (User, dataset.users), (Event, dataset.events), (Friendship, dataset.friendships), (FriendEdge, edges),
+        ):
+            for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                await conn.execute(insert(model), rows[start:start + INSERT_CHUNK_SIZE])
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=50, help="events per user")
+    parser.add_argument("--degree", type=int, default=10, help="mean friends per user")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+async def _main(args) -> int:
+    dataset = generate(args.users, args.events, args.degree, args.seed)
+    try:
+        await load(dataset)
+    except RuntimeError as e:
+        print(e)
+        return 1
+    finally:
+        await engine.dispose()
+    print(dataset.summary())
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load a synthetic dataset into DATABASE_URL")
+    add_arguments(parser)
+    sys.exit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Micro-benchmark: CPU per list request, ORM + Pydantic vs column tuples.
+
+Seeds one user with events, friends and pending requests (see bench/__init__
+for the database it uses), then times the load + serialize step of
+GET /api/events, /api/friends and /api/friends/requests/pending both ways:
+
+    before  ORM objects (selectinload for friend users), model_validate and
+            model_dump_json per item, as the routers did before
+    after   the routers' loaders (plain column tuples, one join for friend
+            users) encoded by pagination's orjson encoder
+
+    python -m bench.list_serialization [--events 2000] [--friends 300] [--repeat 50]
+
+Reports CPU milliseconds per request (process time, so the database
+driver's work counts too) and checks both paths produce the same JSON.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from sqlalchemy import select, or_
+from sqlalchemy.orm import selectinload
+
+from api.database import async_session, engine
+from api.events import load_events
+from api.friend_graph import add_edges
+from api.friends import load_friends, load_pending_requests
+from api.migrations import migrate
+from api.models import Event, Friendship, User
+from api.pagination import encode_list
+from api.schemas import (
+    EventResponse,
+    FriendRequestResponse,
+    FriendshipResponse,
+    FriendUserResponse,
+)
+
+
+async def seed(events: int, friends: int, pending: int) -> str:
+    async with async_session() as db:
+        user = User(google_id="bench-user", email="bench@example.com", name="Bench")
+        db.add(user)
+        await db.flush()
+        others = [
+            User(google_id=f"bench-{i}", email=f"bench-{i}@example.com", name=f"Friend {i}",
+                 birthday_month=i % 12 + 1, birthday_day=i % 28 + 1)
+            for i in range(friends + pending)
+        ]
+        db.add_all(others)
+        await db.flush()
+        for i in range(events):
+            month, day = i % 12 + 1, i % 28 + 1
+            db.add(Event(user_id=user.id, month=month, day=day, end_month=month, end_day=day,
+                         title=f"Event {i}", color="#ff6360"))
+        friendships = []
+        for i, other in enumerate(others):
+            if i < friends:
+                # Both directions, so the friend is sometimes the requester
+                requester, addressee = (user, other) if i % 2 else (other, user)
+                friendships.append(Friendship(requester_id=requester.id, addressee_id=addressee.id, status="accepted"))
+            else:
+                friendships.append(Friendship(requester_id=other.id, addressee_id=user.id, status="pending"))
+        db.add_all(friendships)
+        await db.flush()
+        await add_edges(db, *(f.id for f in friendships))
+        await db.commit()
+        return user.id
+
+
+def _dump_models(models) -> bytes:
+    return b"[" + b",".join(m.model_dump_json().encode() for m in models) + b"]"
+
+
+async def events_before(db, user_id: str) -> bytes:
+    result = await db.execute(
+        select(Event).where(Event.user_id == user_id).order_by(Event.month, Event.day, Event.id)
+    )
+    return _dump_models(EventResponse.model_validate(e) for e in result.scalars().all())
+
+
+async def friends_before(db, user_id: str) -> bytes:
+    result = await db.execute(
+        select(Friendship)
+        .options(selectinload(Friendship.requester), selectinload(Friendship.addressee))
+        .where(
+            or_(Friendship.requester_id == user_id, Friendship.addressee_id == user_id),
+            Friendship.status == "accepted",
+        )
+        .order_by(Friendship.created_at, Friendship.id)
+    )
+    return _dump_models(
+        FriendshipResponse(
+            id=f.id,
+            friend=FriendUserResponse.model_validate(f.addressee if f.requester_id == user_id else f.requester),
+            created_at=f.created_at,
+        )
+        for f in result.scalars().all()
+    )
+
+
+async def pending_before(db, user_id: str) -> bytes:
+    result = await db.execute(
+        select(Friendship)
+        .options(selectinload(Friendship.requester))
+        .where(Friendship.addressee_id == user_id, Friendship.status == "pending")
+        .order_by(Friendship.created_at.desc(), Friendship.id.desc())
+    )
+    return _dump_models(
+        FriendRequestResponse(
+            id=f.id,
+            requester=FriendUserResponse.model_validate(f.requester),
+            status=f.status,
+            created_at=f.created_at,
+        )
+        for f in result.scalars().all()
+    )
+
+
+def _after(loader):
+    async def run(db, user_id: str) -> bytes:
+        return encode_list(await loader(db, user_id))
+    return run
+
+
+CASES = [
+    ("GET /api/events", events_before, _after(load_events)),
+    ("GET /api/friends", friends_before, _after(load_friends)),
+    ("GET /api/friends/requests/pending", pending_before, _after(load_pending_requests)),
+]
+
+
+async def cpu_ms(fn, user_id: str, repeat: int) -> float:
+    """CPU milliseconds per call, each call in a fresh session like a request."""
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time()
+        async with async_session() as db:
+            await fn(db, user_id)
+        samples.append(time.process_time() - start)
+    samples.sort()
+    # Median; process_time has coarse resolution on some platforms
+    return samples[len(samples) // 2] * 1000
+
+
+async def run(args) -> int:
+    await migrate(engine)
+    user_id = await seed(args.events, args.friends, args.pending)
+    print(f"{args.events} events, {args.friends} friends, {args.pending} pending; "
+          f"median CPU ms per request over {args.repeat} runs")
+    print(f"{'endpoint':<36}{'before':>10}{'after':>10}{'speedup':>10}")
+    mismatches = 0
+    for name, before, after in CASES:
+        async with async_session() as db:
+            if json.loads(await before(db, user_id)) != json.loads(await after(db, user_id)):
+                mismatches += 1
+                print(f"{name}: bodies differ")
+        # Warm up statement caches and lazy imports before timing
+        await cpu_ms(before, user_id, 3)
+        await cpu_ms(after, user_id, 3)
+        before_ms = await cpu_ms(before, user_id, args.repeat)
+        after_ms = await cpu_ms(after, user_id, args.repeat)
+        print(f"{name:<36}{before_ms:>10.2f}{after_ms:>10.2f}{before_ms / after_ms:>9.1f}x")
+    await engine.dispose()
+    return 1 if mismatches else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--friends", type=int, default=300)
+    parser.add_argument("--pending", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Micro-benchmark: per-request overhead of the redirect and session middleware.
+
+Wraps the app's router in the old stack (global SessionMiddleware plus the
+@app.middleware("http") redirect, i.e. BaseHTTPMiddleware) and in the
+current pure ASGI one, both in production mode, and calls each directly over
+ASGI with no network or client in between. The request carries a session
+cookie, as a signed-in browser's would.
+
+    python -m bench.middleware [--requests 5000]
+
+Reports microseconds per request for a static asset and for a 304 revalidation
+of one, where middleware overhead is most of the work.
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import Request
+from fastapi.responses import RedirectResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+
+from api.main import app, static_assets
+from api.middleware import CanonicalHostMiddleware, ScopedSessionMiddleware
+
+SECRET = "bench-secret"
+
+
+async def legacy_redirect(request: Request, call_next):
+    """The redirect as it was written with @app.middleware("http")."""
+    host = request.headers.get("host", "")
+    forwarded_proto = request.headers.get("x-forwarded-proto", "https")
+    if host.startswith("www."):
+        url = request.url.replace(scheme="https", netloc=host[4:])
+        return RedirectResponse(url=str(url), status_code=301)
+    if forwarded_proto == "http":
+        url = request.url.replace(scheme="https")
+        return RedirectResponse(url=str(url), status_code=301)
+    response = await call_next(request)
+    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+    return response
+
+
+def stacks(inner) -> dict:
+    session_options = {"secret_key": SECRET, "https_only": True, "same_site": "lax"}
+    return {
+        "before": SessionMiddleware(BaseHTTPMiddleware(inner, dispatch=legacy_redirect), **session_options),
+        "after": ScopedSessionMiddleware(
+            CanonicalHostMiddleware(inner), paths=("/auth/google", "/auth/callback"), **session_options
+        ),
+    }
+
+
+async def _session_cookie() -> bytes:
+    """A signed session cookie with some OAuth state in it, made by SessionMiddleware itself."""
+    cookie = b""
+
+    async def set_state(scope, receive, send):
+        scope["session"]["_state_google_x"] = {"data": {"redirect_uri": "https://example.com/auth/callback"}}
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def capture(message):
+        nonlocal cookie
+        for key, value in message.get("headers", []):
+            if key == b"set-cookie":
+                cookie = value.split(b";")[0]
+
+    await SessionMiddleware(set_state, secret_key=SECRET)(
+        {"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""},
+        _receiver(), capture,
+    )
+    return cookie
+
+
+def _receiver():
+    """The request body once, then block as a server does until the client disconnects."""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    return receive
+
+
+async def _discard(message):
+    pass
+
+
+def _scope(path: str, headers: list) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": headers, "server": ("bench", 443), "client": ("127.0.0.1", 1),
+        "app": app,
+    }
+
+
+async def per_request_us(stack, path: str, headers: list, requests: int) -> float:
+    for _ in range(50):
+        await stack(_scope(path, headers), _receiver(), _discard)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await stack(_scope(path, headers), _receiver(), _discard)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def run(requests: int) -> None:
+    static_assets.load()
+    cookie = await _session_cookie()
+    path = "/style.css"
+    etag = static_assets.lookup(path)[0].etag("identity")
+    base = [(b"host", b"circlecalendars.com"), (b"x-forwarded-proto", b"https"), (b"cookie", cookie)]
+    cases = {
+        "GET /style.css": base,
+        "GET /style.css (304)": base + [(b"if-none-match", etag.encode())],
+    }
+    print(f"{requests} requests each, microseconds per request")
+    print(f"{'request':<26}{'before':>10}{'after':>10}{'saved':>10}")
+    built = stacks(app.router)
+    for name, headers in cases.items():
+        before = await per_request_us(built["before"], path, headers, requests)
+        after = await per_request_us(built["after"], path, headers, requests)
+        print(f"{name:<26}{before:>10.1f}{after:>10.1f}{before - after:>10.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-request overhead of the middleware stack")
+    parser.add_argument("--requests", type=int, default=5000)
+    asyncio.run(run(parser.parse_args().requests))
+
+
+if __name__ == "__main__":
+    main()
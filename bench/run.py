@@ -0,0 +1,307 @@
+"""Load scenarios against the ASGI app with a JSON report.
+
+Generates and loads a dataset (bench/generator.py), then drives the app in
+api/main.py in-process through httpx's ASGI transport. There is no network
+or server in the way, so the numbers are app + database time:
+
+    bootstrap        first paint: GET /api/bootstrap
+    event_crud       create, update, reload and delete storms on events
+    friend_requests  bursts of requests to members and to unknown emails,
+                     then addressees list and answer them
+    poll             the app.js 30 s poll: pending requests, plus the
+                     friend list when the modal is open
+
+Each scenario reports latency percentiles and SQL statements per request,
+overall and per route. `--output` writes the report as JSON for
+bench/compare.py.
+
+    python -m bench.run --users 1000 --events 50 --concurrency 20 --output before.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import math
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+from sqlalchemy import event
+
+from api.auth import create_token
+from api.database import engine, read_engine
+
+from .generator import Dataset, add_arguments, generate, load
+
+POLL_INTERVAL_SECONDS = 30
+# Share of polls made with the friends modal open, which also refetches the friend list
+POLL_MODAL_OPEN = 0.2
+
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+_statements: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("bench_statements", default=None)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _statements.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+for _engine in {engine, read_engine}:
+    event.listen(_engine.sync_engine, "before_cursor_execute", _count_statement)
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    """Latency, statement count and status of every request, by route."""
+
+    def __init__(self):
+        self.samples: dict[str, list[tuple[float, int, int]]] = {}
+
+    def add(self, route: str, seconds: float, statements: int, status: int) -> None:
+        self.samples.setdefault(route, []).append((seconds, statements, status))
+
+    @staticmethod
+    def _stats(samples: list[tuple[float, int, int]]) -> dict:
+        latencies = sorted(s[0] * 1000 for s in samples)
+        statements = [s[1] for s in samples]
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for s in samples if s[2] >= 500),
+            # Expected in the scenarios: duplicate friend requests and the like
+            "rejected": sum(1 for s in samples if 400 <= s[2] < 500),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50), 3),
+                "p90": round(percentile(latencies, 90), 3),
+                "p99": round(percentile(latencies, 99), 3),
+                "max": round(latencies[-1], 3),
+                "mean": round(sum(latencies) / len(latencies), 3),
+            },
+            "queries_per_request": {
+                "mean": round(sum(statements) / len(statements), 3),
+                "max": max(statements),
+            },
+        }
+
+    def report(self, wall_seconds: float) -> dict:
+        everything = [s for samples in self.samples.values() for s in samples]
+        if not everything:
+            return {"requests": 0, "wall_seconds": round(wall_seconds, 3), "routes": {}}
+        return {
+            **self._stats(everything),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_rps": round(len(everything) / wall_seconds, 1),
+            "routes": {route: self._stats(samples) for route, samples in sorted(self.samples.items())},
+        }
+
+
+class Session:
+    """Scenario helpers: one signed-in client per user, bounded concurrency."""
+
+    def __init__(self, app, dataset: Dataset, concurrency: int, rng: random.Random):
+        self.app = app
+        self.dataset = dataset
+        self.rng = rng
+        self.recorder = Recorder()
+        self._limit = asyncio.Semaphore(concurrency)
+        self._transport = httpx.ASGITransport(app=app)
+
+    async def request(self, user_id: str, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self._limit:
+            async with httpx.AsyncClient(
+                transport=self._transport,
+                base_url="http://bench",
+                cookies={"auth_token": create_token(user_id)},
+            ) as client:
+                counter = [0]
+                _statements.set(counter)
+                start = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                elapsed = time.perf_counter() - start
+        route = f"{method} {_UUID.sub('{id}', url)}"
+        self.recorder.add(route, elapsed, counter[0], response.status_code)
+        return response
+
+    def users(self, count: int) -> list[dict]:
+        return self.rng.sample(self.dataset.users, min(count, len(self.dataset.users)))
+
+
+async def bootstrap(session: Session, requests: int) -> None:
+    await asyncio.gather(*(
+        session.request(user["id"], "GET", "/api/bootstrap") for user in session.users(requests)
+    ))
+
+
+async def event_crud(session: Session, requests: int) -> None:
+    async def storm(user_id: str, rng: random.Random):
+        # What app.js does per edit: mutate, then reload the list
+        created = await session.request(user_id, "POST", "/api/events", json={
+            "month": rng.randint(1, 12), "day": rng.randint(1, 28), "title": "bench",
+        })
+        if created.status_code >= 400:
+            return
+        event_id = created.json()["id"]
+        await session.request(user_id, "GET", "/api/events")
+        await session.request(user_id, "PUT", f"/api/events/{event_id}", json={
+            "title": "bench edited", "end_month": rng.randint(1, 12), "end_day": rng.randint(1, 28),
+        })
+        await session.request(user_id, "GET", "/api/events")
+        await session.request(user_id, "DELETE", f"/api/events/{event_id}")
+        await session.request(user_id, "GET", "/api/events")
+
+    # Six requests per storm; the same user may run several at once
+    users = [session.rng.choice(session.dataset.users) for _ in range(max(1, requests // 6))]
+    await asyncio.gather(*(
+        storm(user["id"], random.Random(session.rng.random())) for user in users
+    ))
+
+
+async def friend_requests(session: Session, requests: int) -> None:
+    users = session.dataset.users
+    senders = [session.rng.choice(users) for _ in range(max(1, requests // 2))]
+
+    async def send(i: int, sender: dict):
+        # Three in four go to members, the rest to unknown emails (invitation + email)
+        if session.rng.random() < 0.75:
+            email = session.rng.choice(users)["email"]
+        else:
+            email = f"invitee{i}@bench.example.com"
+        await session.request(sender["id"], "POST", "/api/friends/request", json={"email": email})
+
+    await asyncio.gather(*(send(i, sender) for i, sender in enumerate(senders)))
+
+    async def answer(user: dict):
+        pending = await session.request(user["id"], "GET", "/api/friends/requests/pending")
+        if pending.status_code >= 400:
+            return
+        for request in pending.json()[:3]:
+            await session.request(
+                user["id"], "PATCH", f"/api/friends/request/{request['id']}",
+                json={"accept": session.rng.random() < 0.8},
+            )
+
+    await asyncio.gather(*(answer(user) for user in session.users(max(1, requests // 4))))
+
+
+async def poll(session: Session, requests: int) -> None:
+    async def tick(user: dict):
+        await session.request(user["id"], "GET", "/api/friends/requests/pending")
+        if session.rng.random() < POLL_MODAL_OPEN:
+            await session.request(user["id"], "GET", "/api/friends")
+
+    users = [session.rng.choice(session.dataset.users) for _ in range(requests)]
+    await asyncio.gather(*(tick(user) for user in users))
+
+
+SCENARIOS = {
+    "bootstrap": bootstrap,
+    "event_crud": event_crud,
+    "friend_requests": friend_requests,
+    "poll": poll,
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def _print_report(report: dict) -> None:
+    print(f"{'scenario / route':<44}{'reqs':>7}{'4xx':>5}{'5xx':>5}{'p50':>9}{'p90':>9}{'p99':>9}{'q/req':>7}")
+    for name, result in report["scenarios"].items():
+        rows = [(name, result)] + [(f"  {route}", stats) for route, stats in result["routes"].items()]
+        for label, stats in rows:
+            if not stats["requests"]:
+                continue
+            latency = stats["latency_ms"]
+            print(f"{label:<44}{stats['requests']:>7}{stats['rejected']:>5}{stats['errors']:>5}{latency['p50']:>9.2f}"
+                  f"{latency['p90']:>9.2f}{latency['p99']:>9.2f}{stats['queries_per_request']['mean']:>7.2f}")
+        if name == "poll" and result.get("throughput_rps"):
+            print(f"  sustains ~{result['poll_users_at_30s']} users polling every {POLL_INTERVAL_SECONDS} s")
+
+
+async def run(args) -> dict:
+    # Import late: the app module reads settings and wires routers on import
+    from api.main import app
+
+    dataset = generate(args.users, args.events, args.degree, args.seed)
+    try:
+        await load(dataset)
+    except RuntimeError:
+        await engine.dispose()
+        raise
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "dataset": dataset.summary(),
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenarios:
+            session = Session(app, dataset, args.concurrency, random.Random(f"{args.seed}-{name}"))
+            start = time.perf_counter()
+            await SCENARIOS[name](session, args.requests)
+            result = session.recorder.report(time.perf_counter() - start)
+            if name == "poll" and result.get("throughput_rps"):
+                # Polls per second this process keeps up with, as users at one poll per interval
+                result["poll_users_at_30s"] = int(result["throughput_rps"] * POLL_INTERVAL_SECONDS)
+            report["scenarios"][name] = result
+    finally:
+        await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run load scenarios against the ASGI app")
+    add_arguments(parser)
+    parser.add_argument("--requests", type=int, default=500, help="approximate requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=list(SCENARIOS),
+                        help=f"comma separated, from {','.join(SCENARIOS)}")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    try:
+        report = asyncio.run(run(args))
+    except RuntimeError as e:
+        sys.exit(str(e))
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    errors = sum(result.get("errors", 0) for result in report["scenarios"].values())
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
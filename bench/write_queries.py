@@ -0,0 +1,161 @@
+"""Check: SQL statements per write endpoint stay within budget.
+
+Drives each single-row write through the ASGI app a few times against a
+seeded scratch database (see bench/__init__) and counts the statements it
+sends. Every write also bumps the user's revision (ETags, delta sync), so
+one statement on top of the RETURNING write is the floor; a write that finds
+nothing to change should cost only the conditional bump.
+
+    python -m bench.write_queries [--repeat 5]
+
+Prints the median per endpoint next to its budget and the count before the
+writes used RETURNING, and exits 1 if any endpoint is over budget or answers
+with an unexpected status. tests/test_write_queries.py holds the test suite to
+the same budgets.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import uuid
+
+import httpx
+from sqlalchemy import event
+
+from api.auth import create_token
+from api.database import async_session, engine, read_engine
+from api.friend_graph import add_edges
+from api.migrations import migrate
+from api.models import Event, Friendship, User
+
+# endpoint -> (budget, statements before RETURNING writes)
+BUDGETS = {
+    "POST /api/events": (2, 3),
+    "PUT /api/events/{id}": (2, 4),
+    "PUT /api/events/{id} (404)": (1, 1),
+    "DELETE /api/events/{id}": (3, 5),
+    "DELETE /api/events/{id} (404)": (1, 1),
+    # Two updates (one of a missing event): a single UPDATE for both
+    "POST /api/events/batch (updates)": (2, 3),
+    "PATCH /api/profile": (2, 4),
+    # The answer is copied onto both friend edges
+    "PATCH /api/friends/request/{id}": (3, 5),
+    "DELETE /api/friends/{id}": (2, 3),
+}
+
+_statements = 0
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    global _statements
+    _statements += 1
+
+
+for _engine in {engine, read_engine}:
+    event.listen(_engine.sync_engine, "before_cursor_execute", _count_statement)
+
+
+async def seed(repeat: int) -> dict:
+    """One user with events to edit, pending requests to answer and friends to remove."""
+    tag = uuid.uuid4().hex[:8]
+    async with async_session() as db:
+        me = User(google_id=f"me-{tag}", email=f"me-{tag}@example.com", name="Me")
+        others = [
+            User(google_id=f"o{i}-{tag}", email=f"o{i}-{tag}@example.com", name=f"Other {i}")
+            for i in range(2 * repeat)
+        ]
+        db.add_all([me, *others])
+        await db.flush()
+        events = [
+            Event(user_id=me.id, month=3, day=i + 1, end_month=3, end_day=i + 1, title="seed")
+            for i in range(2 * repeat)
+        ]
+        pending = [Friendship(requester_id=o.id, addressee_id=me.id, status="pending") for o in others[:repeat]]
+        accepted = [Friendship(requester_id=me.id, addressee_id=o.id, status="accepted") for o in others[repeat:]]
+        db.add_all(events + pending + accepted)
+        await db.flush()
+        await add_edges(db, *(f.id for f in pending + accepted))
+        await db.commit()
+        return {
+            "me": me.id,
+            "events": [e.id for e in events],
+            "pending": [f.id for f in pending],
+            "accepted": [f.id for f in accepted],
+        }
+
+
+def cases(seeded: dict, i: int) -> dict:
+    """endpoint -> (method, path, json body, expected status) for repetition i."""
+    edit, remove = seeded["events"][2 * i], seeded["events"][2 * i + 1]
+    return {
+        "POST /api/events": ("POST", "/api/events", {"month": 5, "day": 6, "title": "x"}, 201),
+        "PUT /api/events/{id}": ("PUT", f"/api/events/{edit}", {"title": f"y{i}", "end_month": None}, 200),
+        "PUT /api/events/{id} (404)": ("PUT", "/api/events/missing", {"title": "y"}, 404),
+        "DELETE /api/events/{id}": ("DELETE", f"/api/events/{remove}", None, 204),
+        "DELETE /api/events/{id} (404)": ("DELETE", f"/api/events/{remove}", None, 404),
+        "POST /api/events/batch (updates)": ("POST", "/api/events/batch", {"operations": [
+            {"op": "update", "id": edit, "data": {"color": "#123456"}},
+            {"op": "update", "id": "missing", "data": {"title": "z"}},
+        ]}, 200),
+        "PATCH /api/profile": ("PATCH", "/api/profile", {"birthday_month": 6, "birthday_day": i + 1}, 200),
+        "PATCH /api/friends/request/{id}": (
+            "PATCH", f"/api/friends/request/{seeded['pending'][i]}", {"accept": True}, 200,
+        ),
+        "DELETE /api/friends/{id}": ("DELETE", f"/api/friends/{seeded['accepted'][i]}", None, 204),
+    }
+
+
+async def measure(repeat: int) -> tuple[dict, list[str]]:
+    """Statements sent by each endpoint per repetition, and any unexpected statuses."""
+    global _statements
+    # Import late: bench/__init__ must point DATABASE_URL at the scratch database first
+    from api.main import app
+
+    await migrate()
+    seeded = await seed(repeat)
+    counts = {endpoint: [] for endpoint in BUDGETS}
+    failures = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", cookies={"auth_token": create_token(seeded["me"])}
+    ) as client:
+        for i in range(repeat):
+            for endpoint, (method, path, body, expected) in cases(seeded, i).items():
+                _statements = 0
+                response = await client.request(method, path, json=body)
+                counts[endpoint].append(_statements)
+                if response.status_code != expected:
+                    failures.append(f"{endpoint}: status {response.status_code}, expected {expected}")
+    return counts, failures
+
+
+def over_budget(counts: dict) -> list[str]:
+    failures = []
+    for endpoint, (budget, _) in BUDGETS.items():
+        # Median: an occasional outlier repetition shouldn't count
+        now = statistics.median(counts[endpoint])
+        if now > budget:
+            failures.append(f"{endpoint}: {now:g} statements, budget {budget}")
+    return failures
+
+
+async def run(repeat: int) -> int:
+    counts, failures = await measure(repeat)
+    print(f"{'endpoint':<36}{'before':>8}{'now':>6}{'budget':>8}")
+    for endpoint, (budget, before) in BUDGETS.items():
+        print(f"{endpoint:<36}{before:>8}{statistics.median(counts[endpoint]):>6g}{budget:>8}")
+    failures += over_budget(counts)
+    for failure in failures:
+        print(failure)
+    await engine.dispose()
+    return 1 if failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check SQL statements per write endpoint")
+    parser.add_argument("--repeat", type=int, default=5)
+    sys.exit(asyncio.run(run(parser.parse_args().repeat)))
+
+
+if __name__ == "__main__":
+    main()
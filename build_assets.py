@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""Build fingerprinted, precompressed static assets into dist/.
+
+Run before starting the server in production:
+
+    python build_assets.py
+
+Install the optional `brotli` package to also emit .br variants.
+"""
+import os
+
+from api.static_assets import write_build
+
+root = os.path.dirname(os.path.abspath(__file__))
+manifest = write_build(root, os.path.join(root, "dist"))
+
+for url_path, entry in sorted(manifest["assets"].items()):
+    print(f"{url_path}: {', '.join(sorted(entry['files']))}")
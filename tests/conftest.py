@@ -0,0 +1,62 @@
+"""Shared fixtures for the API tests.
+
+Tests run against DATABASE_URL when it is set (the Postgres-only checks
+need it) and a scratch SQLite database otherwise. Point DATABASE_URL at a
+throwaway database: tests create users and events in it.
+
+    python -m pytest -q
+    DATABASE_URL=postgresql+asyncpg://... python -m pytest -q
+"""
+import asyncio
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# Set before anything imports api.config, which reads the environment once
+if "DATABASE_URL" not in os.environ:
+    _scratch = os.path.join(tempfile.mkdtemp(prefix="circle-cal-test-"), "test.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_scratch}"
+os.environ.setdefault("DB_ECHO", "false")
+# Tests fire requests faster than any user would
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx  # noqa: E402
+
+from api.auth import create_token  # noqa: E402
+from api.database import async_session, engine  # noqa: E402
+from api.migrations import migrate  # noqa: E402
+from api.models import User  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def run():
+    """Run a coroutine on the session's event loop (pooled connections belong to one loop)."""
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(migrate())
+    yield loop.run_until_complete
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+@pytest.fixture
+def make_user(run):
+    def make(**columns) -> str:
+        async def create():
+            suffix = uuid.uuid4().hex[:12]
+            async with async_session() as db:
+                user = User(google_id=f"g-{suffix}", email=f"{suffix}@example.com", name=suffix, **columns)
+                db.add(user)
+                await db.commit()
+                return user.id
+        return run(create())
+    return make
+
+
+def client(user_id=None) -> httpx.AsyncClient:
+    """An ASGI client for the app, signed in as `user_id` if given."""
+    from api.main import app
+
+    cookies = {"auth_token": create_token(user_id)} if user_id else None
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", cookies=cookies)
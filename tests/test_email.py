@@ -0,0 +1,8 @@
+from api.email import render_friend_invitation
+
+
+def test_invitation_escapes_the_inviters_name():
+    subject, html_content = render_friend_invitation('Eve <a href="https://evil.example">click</a>')
+    assert subject.startswith("Eve <a href=")
+    assert "<a href=\"https://evil.example\">" not in html_content
+    assert "Eve &lt;a href=&quot;https://evil.example&quot;&gt;click&lt;/a&gt;" in html_content
@@ -0,0 +1,32 @@
+from tests.conftest import client
+
+
+def test_batch_updates_keep_the_fields_each_one_leaves_out(run, make_user):
+    user_id = make_user()
+    other_id = make_user()
+
+    async def scenario():
+        async with client(other_id) as c:
+            foreign = (await c.post("/api/events", json={"month": 1, "day": 1, "title": "theirs"})).json()["id"]
+        async with client(user_id) as c:
+            created = (await c.post("/api/events/batch", json={"operations": [
+                {"op": "create", "data": {"month": 3, "day": 4, "end_month": 3, "end_day": 6, "title": "a"}},
+                {"op": "create", "data": {"month": 7, "day": 8, "title": "b", "color": "#000000"}},
+            ]})).json()["results"]
+            a, b = created[0]["id"], created[1]["id"]
+            response = await c.post("/api/events/batch", json={"operations": [
+                {"op": "update", "id": a, "data": {"title": "a2"}},
+                {"op": "update", "id": foreign, "data": {"title": "mine now"}},
+                {"op": "update", "id": b, "data": {"month": 9, "end_day": None}},
+            ]})
+            return a, b, response
+
+    a, b, response = run(scenario())
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == [200, 404, 200]
+    first, third = results[0]["event"], results[2]["event"]
+    assert (first["id"], first["title"], first["month"], first["end_day"]) == (a, "a2", 3, 6)
+    assert (third["id"], third["title"], third["month"], third["day"], third["end_day"], third["color"]) == (
+        b, "b", 9, 8, 8, "#000000",
+    )
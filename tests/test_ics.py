@@ -0,0 +1,74 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from api.ics import format_event
+from tests.conftest import client
+
+STAMP = datetime(2026, 1, 1)
+
+
+def _event(month, day, end_month=None, end_day=None):
+    return SimpleNamespace(
+        id="e1", month=month, day=day, end_month=end_month, end_day=end_day, title="t", updated_at=None,
+    )
+
+
+def _dates(vevent: str) -> tuple[str, str]:
+    fields = dict(line.split(":", 1) for line in vevent.split("\r\n") if ":" in line)
+    return fields["DTSTART;VALUE=DATE"], fields["DTEND;VALUE=DATE"]
+
+
+def test_days_past_the_end_of_the_month_roll_over():
+    assert _dates(format_event(_event(2, 30), 2026, STAMP)) == ("20260302", "20260303")
+    assert _dates(format_event(_event(4, 31), 2026, STAMP)) == ("20260501", "20260502")
+
+
+def test_feb_29_is_anchored_in_a_leap_year():
+    assert _dates(format_event(_event(2, 29), 2026, STAMP)) == ("20240229", "20240301")
+
+
+def test_end_date_wraps_into_next_year():
+    assert _dates(format_event(_event(12, 30, 1, 2), 2026, STAMP)) == ("20261230", "20270103")
+
+
+def test_feed_survives_an_impossible_date(run, make_user):
+    user_id = make_user()
+
+    async def scenario():
+        async with client(user_id) as c:
+            created = await c.post("/api/events/batch", json={"operations": [
+                {"op": "create", "data": {"month": 2, "day": 30, "title": "Feb 30"}},
+                {"op": "create", "data": {"month": 3, "day": 5, "title": "after"}},
+            ]})
+            assert created.status_code == 200
+            return await c.get("/api/events.ics")
+
+    response = run(scenario())
+    assert response.status_code == 200
+    assert response.text.count("BEGIN:VEVENT") == 2
+    assert response.text.endswith("END:VCALENDAR\r\n")
+
+
+def _calendar(*summaries: str) -> bytes:
+    vevents = "".join(
+        f"BEGIN:VEVENT\r\nDTSTART;VALUE=DATE:20240{i % 9 + 1}01\r\nSUMMARY:{summary}\r\nEND:VEVENT\r\n"
+        for i, summary in enumerate(summaries)
+    )
+    return f"BEGIN:VCALENDAR\r\n{vevents}END:VCALENDAR\r\n".encode()
+
+
+def test_import_is_all_or_nothing(run, make_user):
+    user_id = make_user()
+
+    async def scenario():
+        async with client(user_id) as c:
+            imported = await c.post("/api/events/import", content=_calendar("a", "b"))
+            broken = await c.post("/api/events/import", content=_calendar("c") + b"BEGIN:VEVENT\r\nSUMMARY:" + b"x" * 70000)
+            events = await c.get("/api/events")
+            return imported, broken, events
+
+    imported, broken, events = run(scenario())
+    assert imported.status_code == 200
+    assert imported.json() == {"imported": 2, "skipped": 0}
+    assert broken.status_code == 400
+    assert sorted(e["title"] for e in events.json()) == ["a", "b"]
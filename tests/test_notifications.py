@@ -0,0 +1,43 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+from api.config import get_settings
+from api.notifications import PostgresBackend
+
+settings = get_settings()
+
+pytestmark = pytest.mark.skipif(
+    not settings.database_url.startswith("postgresql"), reason="LISTEN/NOTIFY needs Postgres"
+)
+
+
+def test_listen_connection_is_replaced_after_it_drops(run):
+    delivered = []
+
+    async def scenario():
+        backend = PostgresBackend(settings.database_url)
+        backend.RECONNECT_MIN_DELAY = 0.05
+        await backend.start(lambda user_id, message: delivered.append((user_id, message)))
+        try:
+            first = backend._conn
+            killer = await asyncpg.connect(backend._dsn)
+            await killer.execute("SELECT pg_terminate_backend($1)", first.get_server_pid())
+            await killer.close()
+            for _ in range(100):
+                if backend._conn is not None and backend._conn is not first:
+                    break
+                await asyncio.sleep(0.05)
+            await backend.publish("u1", {"type": "ping"})
+            for _ in range(100):
+                if delivered:
+                    break
+                await asyncio.sleep(0.05)
+            return first, backend._conn
+        finally:
+            await backend.stop()
+
+    first, replaced = run(scenario())
+    assert replaced is not first
+    assert delivered == [("u1", {"type": "ping"})]
@@ -0,0 +1,14 @@
+import pytest
+
+from api.database import engine
+from api.query_plans import seq_scans
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "postgresql", reason="EXPLAIN plans need Postgres")
+
+
+def test_hot_queries_are_served_by_an_index(run):
+    checked, failures = run(seq_scans())
+    assert checked > 0
+    assert [
+        f"Seq Scan on {', '.join(tables)}: {' '.join(statement.split())}" for statement, tables in failures
+    ] == []
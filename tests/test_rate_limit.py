@@ -0,0 +1,21 @@
+from api.rate_limit import Budget, LocalBackend, RateLimiter
+
+ROUTE = "POST /api/events/import"
+
+
+def test_a_request_the_user_bucket_rejects_keeps_its_route_token(run):
+    limiter = RateLimiter(LocalBackend(), Budget(burst=1, per_minute=0.001), {ROUTE: Budget(burst=2, per_minute=0.001)})
+
+    async def scenario():
+        first = await limiter.check("user:a", ROUTE)
+        rejected = [await limiter.check("user:a", ROUTE) for _ in range(5)]
+        # A fresh user budget: the route bucket still has the token the rejected requests didn't use
+        limiter.user_budget = Budget(burst=10, per_minute=0.001)
+        limiter.backend._buckets.pop("user:a")
+        return first, rejected, await limiter.check("user:a", ROUTE), await limiter.check("user:a", ROUTE)
+
+    first, rejected, second, third = run(scenario())
+    assert first == 0
+    assert all(wait > 0 for wait in rejected)
+    assert second == 0
+    assert third > 0
@@ -0,0 +1,21 @@
+from tests.conftest import client
+
+
+def test_each_variant_of_the_ring_has_its_own_etag(run, make_user):
+    user_id = make_user()
+
+    async def scenario():
+        async with client(user_id) as c:
+            light = await c.get("/api/render/ring.svg")
+            dark = await c.get("/api/render/ring.svg", params={"theme": "dark"})
+            stale = await c.get(
+                "/api/render/ring.svg", params={"theme": "dark"}, headers={"If-None-Match": light.headers["etag"]}
+            )
+            fresh = await c.get("/api/render/ring.svg", headers={"If-None-Match": light.headers["etag"]})
+            return light, dark, stale, fresh
+
+    light, dark, stale, fresh = run(scenario())
+    assert light.status_code == dark.status_code == 200
+    assert light.headers["etag"] != dark.headers["etag"]
+    assert stale.status_code == 200
+    assert fresh.status_code == 304
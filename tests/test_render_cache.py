@@ -0,0 +1,26 @@
+import os
+
+from api.render_cache import PRUNE_TO, RenderCache
+
+
+def _disk_bytes(cache: RenderCache) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(cache.directory))
+
+
+def test_disk_tier_is_scanned_only_when_it_passes_its_budget(tmp_path, monkeypatch):
+    cache = RenderCache(str(tmp_path), memory_bytes=0, disk_bytes=10_000)
+    scans = []
+    prune = cache._prune
+    monkeypatch.setattr(cache, "_prune", lambda: scans.append(1) or prune())
+
+    for i in range(9):
+        cache._write(f"key{i}", b"x" * 1000)
+    assert len(scans) == 1  # the first write, to learn the directory's size
+
+    cache._write("key9", b"x" * 1000)
+    cache._write("key10", b"x" * 1000)
+    assert len(scans) == 2
+    assert _disk_bytes(cache) <= 10_000 * PRUNE_TO
+    # the oldest entries went first
+    assert cache._read("key0") is None
+    assert cache._read("key10") is not None
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from api.database import async_session
+from api.models import EventTombstone
+from api.tombstones import TOMBSTONE_RETENTION, prune_expired
+from tests.conftest import client
+
+
+def test_tombstones_past_the_retention_are_pruned(run, make_user):
+    user_id = make_user()
+
+    async def scenario():
+        async with client(user_id) as c:
+            ids = [
+                (await c.post("/api/events", json={"month": 1, "day": day, "title": "t"})).json()["id"]
+                for day in (1, 2)
+            ]
+            for event_id in ids:
+                assert (await c.delete(f"/api/events/{event_id}")).status_code == 204
+        old, recent = ids
+        async with async_session() as db:
+            await db.execute(
+                update(EventTombstone)
+                .where(EventTombstone.event_id == old)
+                .values(deleted_at=datetime.utcnow() - TOMBSTONE_RETENTION - timedelta(hours=1))
+            )
+            await db.commit()
+        await prune_expired()
+        async with async_session() as db:
+            result = await db.execute(select(EventTombstone.event_id).where(EventTombstone.user_id == user_id))
+            return recent, list(result.scalars())
+
+    recent, remaining = run(scenario())
+    assert remaining == [recent]
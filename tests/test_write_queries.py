@@ -0,0 +1,7 @@
+from bench.write_queries import measure, over_budget
+
+
+def test_write_endpoints_stay_within_their_statement_budgets(run):
+    counts, failures = run(measure(3))
+    assert failures == []
+    assert over_budget(counts) == []